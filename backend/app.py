@@ -1,54 +1,91 @@
 # app.py
-from flask import Flask
-from flask_sqlalchemy import SQLAlchemy
-from flask_cors import CORS
-from flask_jwt_extended import JWTManager
-from flask_migrate import Migrate
 import os
-from dotenv import load_dotenv
+import click
+from flask import Flask, current_app
+from flask_cors import CORS
+from flask_jwt_extended import decode_token
 from flask_socketio import SocketIO
-
-# Load .env
-load_dotenv()
+from sqlalchemy import inspect
+from config import config_by_name
+from database import configure_engine
+from extensions import jwt, db
+from tally_cache import TallyCache
+from ttl_cache import TTLCache
+from passwords import PasswordHasher
+from realtime import TallyBroadcaster
+from versions import DataVersions
+from metrics import Metrics
 
 if not os.getenv("JWT_SECRET_KEY"):
     print("Warning: JWT_SECRET_KEY not set in .env. Using fallback.")
 
-# create flask app 
-app = Flask(__name__)
-
-# connection between backend and frontend
-CORS(app, supports_credentials=True, resources={r"/*": {"origins": "http://localhost:3000"}})
-# Uses database file called polling_app.db 
-basedir = os.path.abspath(os.path.dirname(__file__))
-
-app.config['SQLALCHEMY_DATABASE_URI'] = f"sqlite:///{os.path.join(basedir, 'instance/polling_app.db')}"
-app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
-# Ensures secure logins
-app.config["JWT_SECRET_KEY"] = os.getenv("JWT_SECRET_KEY", "fallback_key_for_dev")
-
-# login token setup
-jwt = JWTManager(app)
-# database setup
-db = SQLAlchemy(app)
-# migrate
-migrate = Migrate(app, db)
-# socketIO
-socketio = SocketIO(app, cors_allowed_origins="http://localhost:3000")
-@socketio.on('connect')
-def handle_connect():
-    app.logger.info('Client connected.')
 
-import os
-import sys
-sys.path.append(os.path.dirname(__file__))  # Ensure backend directory is in the path
-from routes import *
+def create_app(config_name=None):
+    # settings for the environment in config_name, or APP_CONFIG
+    app = Flask(__name__)
+    app.config.from_object(config_by_name[config_name or os.getenv("APP_CONFIG", "development")])
+
+    # connection between backend and frontend
+    CORS(app, supports_credentials=True, resources={r"/*": {"origins": "http://localhost:3000"}})
 
+    jwt.init_app(app)
+    db.init_app(app)
+    with app.app_context():
+        configure_engine(app, db.engine)
+        Metrics(app, db.engine)
+    # migrations only matter to the flask command (flask db ...); workers and
+    # tests skip importing Alembic
+    if os.environ.get("FLASK_RUN_FROM_CLI") == "true":
+        from flask_migrate import Migrate
+        Migrate(app, db)
+    # per-app state, found through app.extensions (see extensions.py)
+    TallyCache(app)
+    DataVersions(app)
+    TTLCache(app)
+    PasswordHasher(app)
+    socketio = SocketIO(app, cors_allowed_origins="http://localhost:3000")
+    socketio.on_event("connect", handle_connect)
+    TallyBroadcaster(app, socketio)
 
-# create tables (only if app is running)
-with app.app_context():
+    # imported here: routes and the commands pull in the models
+    from routes import api
+    from importer import import_cli
+    from journal import init_journal, journal_cli
+    from lifecycle import init_scheduler, polls_cli
+    from reconcile import tallies_cli
+    init_journal(app)
+    init_scheduler(app)
+    app.register_blueprint(api)
+    app.cli.add_command(import_cli)
+    app.cli.add_command(journal_cli)
+    app.cli.add_command(polls_cli)
+    app.cli.add_command(tallies_cli)
+    app.cli.add_command(init_db_command)
+    return app
+
+
+def handle_connect(auth=None):
+    # same JWT as the REST API, passed in the socket auth payload
+    try:
+        decode_token((auth or {}).get("token"))
+    except Exception:
+        return False
+    current_app.logger.info('Client connected.')
+
+
+# create tables once, instead of on every start
+@click.command("init-db", help="Create any missing tables; a new database is marked as fully migrated.")
+def init_db_command():
+    fresh = not inspect(db.engine).get_table_names()
     db.create_all()
+    if fresh:
+        # the tables match the latest models, so later `flask db upgrade` starts from here
+        from flask_migrate import stamp
+        stamp()
+    click.echo("Created a new database." if fresh else "Created any missing tables.")
+
 
 # start app
 if __name__ == "__main__":
-    socketio.run(app, debug=True, port=5000)
+    app = create_app()
+    app.extensions["socketio"].run(app, debug=True, port=5000)
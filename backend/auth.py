@@ -0,0 +1,47 @@
+# auth.py
+# resolves the logged-in user once per request; lookups are shared across
+# requests through user_cache and dropped as soon as a user row changes
+from collections import namedtuple
+from flask import g
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import event, select
+from sqlalchemy.orm import Session, object_session
+from extensions import db, user_cache
+from models import User
+
+CurrentUser = namedtuple("CurrentUser", ["id", "email", "is_admin"])
+
+
+def current_user():
+    # the user behind the request's JWT, or None if they no longer exist
+    if "current_user" not in g:
+        email = get_jwt_identity()
+        user = user_cache.get(email)
+        if user is None:
+            row = db.session.execute(
+                select(User.id, User.email, User.is_admin).where(User.email == email)
+            ).first()
+            user = CurrentUser(row.id, row.email, bool(row.is_admin)) if row else None
+            if user:
+                user_cache.put(email, user)
+        g.current_user = user
+    return g.current_user
+
+
+# invalidate once the change is committed, so a concurrent request can't
+# re-cache the old row between the flush and the commit
+@event.listens_for(User, "after_update")
+@event.listens_for(User, "after_delete")
+def _user_changed(mapper, connection, target):
+    object_session(target).info.setdefault("changed_users", set()).add(target.email)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidate_changed_users(session):
+    for email in session.info.pop("changed_users", ()):
+        user_cache.invalidate(email)
+
+
+@event.listens_for(Session, "after_rollback")
+def _forget_changed_users(session):
+    session.info.pop("changed_users", None)
@@ -0,0 +1,95 @@
+# dataset.py
+# seeded synthetic data for the benchmarks: users, polls with options, and votes
+# whose popularity is skewed (a few hot polls and options take most of the votes)
+import random
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import insert, update, bindparam
+
+BENCH_PASSWORD = "benchpass"
+BATCH = 5000
+
+
+def zipf_weights(count, skew):
+    # weight of the item at rank r is 1 / r^skew
+    return [1 / (rank ** skew) for rank in range(1, count + 1)]
+
+
+def generate(db, models, password_hash, users=1000, polls=200, options=4, votes=20000, skew=1.1, seed=42):
+    # fills an empty schema; returns a summary of what was created and
+    # the set of voters per poll, so scenarios can pick users who can still vote
+    User, Poll, Option, Vote = models
+    rng = random.Random(seed)
+    now = datetime.now(timezone.utc)
+
+    # users, all sharing one precomputed hash so generation doesn't spend minutes hashing
+    _bulk_insert(db, User, (
+        {"username": f"user{i}", "email": f"user{i}@bench.local", "password": password_hash, "is_admin": i == 0}
+        for i in range(users)
+    ))
+
+    # polls one minute apart, created by the admin (user id 1)
+    _bulk_insert(db, Poll, (
+        {"question": f"Benchmark poll {i}?", "user_id": 1, "created_at": now - timedelta(minutes=polls - i)}
+        for i in range(polls)
+    ))
+    _bulk_insert(db, Option, (
+        {"text": f"Option {o}", "poll_id": poll_id, "votes": 0}
+        for poll_id in range(1, polls + 1) for o in range(options)
+    ))
+
+    # votes: poll and option picked by skewed weights, one vote per (poll, user)
+    poll_weights = zipf_weights(polls, skew)
+    option_weights = zipf_weights(options, skew)
+    voters_by_poll = {}
+    counts = {}
+    rows = []
+    attempts = 0
+    while len(rows) < votes and attempts < votes * 20:
+        attempts += 1
+        poll_id = rng.choices(range(1, polls + 1), poll_weights)[0]
+        voters = voters_by_poll.setdefault(poll_id, set())
+        if len(voters) >= users:
+            continue
+        user_id = rng.randint(1, users)
+        if user_id in voters:
+            continue
+        voters.add(user_id)
+        option_id = (poll_id - 1) * options + rng.choices(range(1, options + 1), option_weights)[0]
+        counts[option_id] = counts.get(option_id, 0) + 1
+        rows.append({
+            "poll_id": poll_id, "user_id": user_id, "option_id": option_id,
+            "timestamp": now - timedelta(seconds=rng.randint(0, 30 * 24 * 3600))
+        })
+    _bulk_insert(db, Vote, rows)
+
+    option_table = Option.__table__
+    db.session.execute(
+        update(option_table).where(option_table.c.id == bindparam("option_key")).values(votes=bindparam("count")),
+        [{"option_key": option_id, "count": count} for option_id, count in counts.items()]
+    )
+    db.session.commit()
+
+    # hottest polls first, scenarios aim most traffic at them
+    hot_polls = sorted(voters_by_poll, key=lambda p: len(voters_by_poll[p]), reverse=True)
+    summary = {
+        "users": users,
+        "polls": polls,
+        "options_per_poll": options,
+        "votes": len(rows),
+        "skew": skew,
+        "seed": seed,
+        "hot_polls": hot_polls[:10],
+    }
+    return summary, voters_by_poll
+
+
+def _bulk_insert(db, model, rows):
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= BATCH:
+            db.session.execute(insert(model), batch)
+            batch = []
+    if batch:
+        db.session.execute(insert(model), batch)
+    db.session.commit()
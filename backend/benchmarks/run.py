@@ -0,0 +1,185 @@
+# run.py
+# load-test benchmark: builds a seeded dataset in a scratch SQLite file, runs the
+# scenarios through the Flask test client or a real HTTP server, and reports
+# p50/p95/p99 latency and throughput per route
+#
+#   cd backend
+#   python benchmarks/run.py                          # test client, default sizes
+#   python benchmarks/run.py --driver http --concurrency 16
+#   python benchmarks/run.py --baseline old.json      # compare with an earlier run
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+SCENARIOS = ["register", "login", "vote_storm", "poll_listing", "results_reads"]
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Polling app benchmark")
+    parser.add_argument("--driver", choices=["test-client", "http"], default="test-client")
+    parser.add_argument("--config", default="production", help="APP_CONFIG profile for the app under test")
+    parser.add_argument("--db", help="SQLite file for the dataset (default: a temporary file)")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--polls", type=int, default=200)
+    parser.add_argument("--options", type=int, default=4)
+    parser.add_argument("--votes", type=int, default=20000)
+    parser.add_argument("--skew", type=float, default=1.1, help="zipf exponent for poll and option popularity")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--requests", type=int, default=500, help="requests per scenario")
+    parser.add_argument("--concurrency", type=int, default=1)
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--output", default=os.path.join(os.path.dirname(__file__), "results", "latest.json"))
+    parser.add_argument("--baseline", help="earlier results file to compare against")
+    return parser.parse_args()
+
+
+def percentile(sorted_values, fraction):
+    # nearest-rank percentile of an already sorted list
+    if not sorted_values:
+        return None
+    index = max(0, min(len(sorted_values) - 1, round(fraction * len(sorted_values) + 0.5) - 1))
+    return sorted_values[index]
+
+
+def summarise(samples, wall_seconds):
+    by_route = {}
+    for route, status, seconds in samples:
+        by_route.setdefault(route, []).append((status, seconds))
+    report = {}
+    for route, entries in by_route.items():
+        latencies = sorted(seconds * 1000 for _, seconds in entries)
+        report[route] = {
+            "requests": len(entries),
+            "errors": sum(1 for status, _ in entries if status >= 500),
+            "status_counts": {str(s): sum(1 for status, _ in entries if status == s) for s in {s for s, _ in entries}},
+            "throughput_rps": round(len(entries) / wall_seconds, 2) if wall_seconds else None,
+            "mean_ms": round(sum(latencies) / len(latencies), 3),
+            "p50_ms": round(percentile(latencies, 0.50), 3),
+            "p95_ms": round(percentile(latencies, 0.95), 3),
+            "p99_ms": round(percentile(latencies, 0.99), 3),
+            "max_ms": round(latencies[-1], 3),
+        }
+    return report
+
+
+def git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], text=True, stderr=subprocess.DEVNULL).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def start_server(app):
+    # werkzeug's threaded server on a free port, in a daemon thread
+    from werkzeug.serving import make_server
+    server = make_server("127.0.0.1", 0, app, threaded=True)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_port}"
+
+
+def print_report(results, baseline):
+    header = f"{'route':28} {'reqs':>6} {'rps':>9} {'p50':>9} {'p95':>9} {'p99':>9}"
+    print(header)
+    print("-" * len(header))
+    for scenario, data in results["scenarios"].items():
+        for route, stats in data["routes"].items():
+            line = (f"{route:28} {stats['requests']:>6} {stats['throughput_rps']:>9} "
+                    f"{stats['p50_ms']:>9} {stats['p95_ms']:>9} {stats['p99_ms']:>9}")
+            before = (baseline or {}).get("scenarios", {}).get(scenario, {}).get("routes", {}).get(route)
+            if before:
+                change = (stats["p95_ms"] - before["p95_ms"]) / before["p95_ms"] * 100 if before["p95_ms"] else 0
+                line += f"  p95 {change:+.1f}%"
+            print(line)
+
+
+def main():
+    args = parse_args()
+
+    # create_app reads DATABASE_URL, so point it at the scratch database first
+    db_path = args.db or os.path.join(tempfile.mkdtemp(prefix="polling-bench-"), "bench.db")
+    if os.path.exists(db_path):
+        os.remove(db_path)
+    os.environ["APP_CONFIG"] = args.config
+    os.environ["DATABASE_URL"] = f"sqlite:///{os.path.abspath(db_path)}"
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+    from app import create_app
+    from extensions import db, password_hasher
+    from models import User, Poll, Option, Vote
+    from flask_jwt_extended import create_access_token
+    import dataset
+    import scenarios
+
+    app = create_app(args.config)
+    with app.app_context():
+        db.create_all()
+        started = time.perf_counter()
+        summary, voters_by_poll = dataset.generate(
+            db, (User, Poll, Option, Vote), password_hasher.hash(dataset.BENCH_PASSWORD),
+            users=args.users, polls=args.polls, options=args.options,
+            votes=args.votes, skew=args.skew, seed=args.seed
+        )
+        summary["generation_seconds"] = round(time.perf_counter() - started, 2)
+        tokens = [create_access_token(identity=f"user{i}@bench.local") for i in range(args.users)]
+    admin_token = tokens[0]
+    hot_polls = summary["hot_polls"]
+    print(f"dataset: {summary}")
+
+    server = None
+    if args.driver == "http":
+        # always a server on the seeded database: the dataset and tokens only exist there
+        server, url = start_server(app)
+        driver = scenarios.HttpDriver(url)
+    else:
+        driver = scenarios.TestClientDriver(app)
+
+    count = args.requests
+    work = {
+        "register": lambda: scenarios.register(driver, count, args.seed),
+        "login": lambda: scenarios.login(driver, count, args.users, args.seed),
+        "vote_storm": lambda: scenarios.vote_storm(
+            driver, count, tokens, hot_polls, voters_by_poll, args.options, args.seed
+        ),
+        "poll_listing": lambda: scenarios.poll_listing(driver, max(1, count // 5), tokens[-1], 5),
+        "results_reads": lambda: scenarios.results_reads(driver, count, admin_token, hot_polls, args.seed),
+    }
+
+    results = {
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "driver": driver.name,
+        "concurrency": args.concurrency,
+        "config": args.config,
+        "dataset": summary,
+        "scenarios": {},
+    }
+    for name in args.scenarios.split(","):
+        samples, wall = scenarios.run_scenario(work[name](), args.concurrency)
+        results["scenarios"][name] = {"wall_seconds": round(wall, 3), "routes": summarise(samples, wall)}
+
+    if server:
+        server.shutdown()
+
+    os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    print_report(results, baseline)
+    print(f"results written to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,131 @@
+# scenarios.py
+# scripted traffic for the benchmarks, and the two ways of sending it:
+# straight into the Flask test client, or over HTTP to a running server
+import json
+import random
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from dataset import BENCH_PASSWORD
+
+
+class TestClientDriver:
+    # in-process, no network; each thread gets its own client
+    name = "test-client"
+
+    def __init__(self, app):
+        self.app = app
+
+    def request(self, method, url, json_body=None, headers=None):
+        with self.app.test_client() as client:
+            response = client.open(url, method=method, json=json_body, headers=headers or {})
+            return response.status_code, response.get_data()
+
+
+class HttpDriver:
+    name = "http"
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+
+    def request(self, method, url, json_body=None, headers=None):
+        data = json.dumps(json_body).encode() if json_body is not None else None
+        request = urllib.request.Request(self.base_url + url, data=data, method=method, headers={
+            **({"Content-Type": "application/json"} if data is not None else {}),
+            **(headers or {}),
+        })
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                return response.status, response.read()
+        except urllib.error.HTTPError as error:
+            return error.code, error.read()
+
+
+class Recorder:
+    # (route, status, seconds) for every request of a scenario
+    def __init__(self):
+        self.samples = []
+
+    def timed(self, driver, route, method, url, **kwargs):
+        started = time.perf_counter()
+        status, body = driver.request(method, url, **kwargs)
+        self.samples.append((route, status, time.perf_counter() - started))
+        return status, body
+
+
+def run_scenario(work, concurrency):
+    # work is a list of callables taking a Recorder; returns (samples, wall seconds)
+    recorder = Recorder()
+    started = time.perf_counter()
+    if concurrency <= 1:
+        for job in work:
+            job(recorder)
+    else:
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            list(pool.map(lambda job: job(recorder), work))
+    return recorder.samples, time.perf_counter() - started
+
+
+def auth(token):
+    return {"Authorization": f"Bearer {token}"}
+
+
+def register(driver, count, seed):
+    def job(i):
+        return lambda rec: rec.timed(driver, "POST /register", "POST", "/register", json_body={
+            "username": f"new{seed}-{i}", "email": f"new{seed}-{i}@bench.local", "password": BENCH_PASSWORD
+        })
+    return [job(i) for i in range(count)]
+
+
+def login(driver, count, users, seed):
+    rng = random.Random(seed)
+    def job(user_id):
+        return lambda rec: rec.timed(driver, "POST /login", "POST", "/login", json_body={
+            "email": f"user{user_id - 1}@bench.local", "password": BENCH_PASSWORD
+        })
+    return [job(rng.randint(1, users)) for _ in range(count)]
+
+
+def vote_storm(driver, count, tokens, hot_polls, voters_by_poll, options, seed):
+    # fresh voters on the hottest polls, the way a live event looks
+    rng = random.Random(seed)
+    jobs = []
+    for _ in range(count):
+        poll_id = rng.choice(hot_polls)
+        voters = voters_by_poll.setdefault(poll_id, set())
+        # prefer users who haven't voted on this poll yet; repeats measure the 400 path
+        for _ in range(20):
+            user_id = rng.randint(1, len(tokens))
+            if user_id not in voters:
+                break
+        voters.add(user_id)
+        option_id = (poll_id - 1) * options + rng.randint(1, options)
+        jobs.append(lambda rec, p=poll_id, o=option_id, t=tokens[user_id - 1]: rec.timed(
+            driver, "POST /vote/<id>", "POST", f"/vote/{p}", json_body={"optionId": o}, headers=auth(t)
+        ))
+    return jobs
+
+
+def poll_listing(driver, count, token, pages):
+    # first page, then follow next_cursor for a few more
+    def job(rec):
+        url = "/polls"
+        for _ in range(pages):
+            status, body = rec.timed(driver, "GET /polls", "GET", url, headers=auth(token))
+            cursor = json.loads(body).get("next_cursor") if status == 200 else None
+            if not cursor:
+                break
+            url = f"/polls?cursor={cursor}"
+    return [job for _ in range(count)]
+
+
+def results_reads(driver, count, admin_token, hot_polls, seed):
+    rng = random.Random(seed)
+    return [
+        lambda rec, p=rng.choice(hot_polls): rec.timed(
+            driver, "GET /poll-results/<id>", "GET", f"/poll-results/{p}", headers=auth(admin_token)
+        )
+        for _ in range(count)
+    ]
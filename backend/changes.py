@@ -0,0 +1,46 @@
+# changes.py
+# the poll change log behind /changes. Every write to a poll stamps its row with
+# the next database-wide version, in the same transaction as the change, so a
+# client holding version N asks for rows above N and gets each changed poll
+# once: in full if it was created or edited since, otherwise just its tallies
+from sqlalchemy import bindparam, func, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from extensions import db
+from models import PollChange
+
+TALLIES, EDITED, DELETED = "tallies", "edited", "deleted"
+
+
+def record_changes(poll_ids, kind=TALLIES):
+    # call before committing the change itself; one statement for any number of polls
+    poll_ids = sorted(set(poll_ids))
+    if not poll_ids:
+        return
+    table = PollChange.__table__
+    # evaluated per row, so a batch takes consecutive versions
+    next_version = select(func.coalesce(func.max(table.c.version), 0) + 1).scalar_subquery()
+    statement = sqlite_insert(table).values(
+        poll_id=bindparam("poll_key"), version=next_version, poll_version=next_version, deleted=kind == DELETED
+    )
+    updates = {"version": statement.excluded.version}
+    if kind == EDITED:
+        updates.update(poll_version=statement.excluded.version, deleted=False)
+    elif kind == DELETED:
+        updates["deleted"] = True
+    db.session.execute(
+        statement.on_conflict_do_update(index_elements=[table.c.poll_id], set_=updates),
+        [{"poll_key": poll_id} for poll_id in poll_ids]
+    )
+
+
+def current_version():
+    return db.session.scalar(select(func.coalesce(func.max(PollChange.version), 0)))
+
+
+def changes_since(version, limit):
+    # up to limit change rows after version, oldest first, plus whether there are more
+    rows = db.session.execute(
+        select(PollChange.poll_id, PollChange.version, PollChange.poll_version, PollChange.deleted)
+        .where(PollChange.version > version).order_by(PollChange.version).limit(limit + 1)
+    ).all()
+    return rows[:limit], len(rows) > limit
@@ -0,0 +1,20 @@
+# checkpoints.py
+# named positions kept in the checkpoint table by background jobs (how far the
+# vote journal has been applied, up to when poll openings were announced, ...)
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from extensions import db
+from models import Checkpoint
+
+
+def load_checkpoint(name, default=0):
+    value = db.session.scalar(select(Checkpoint.value).where(Checkpoint.name == name))
+    return default if value is None else value
+
+
+def save_checkpoint(name, value):
+    # part of the caller's transaction, so the position moves with the work it covers
+    db.session.execute(
+        sqlite_insert(Checkpoint).values(name=name, value=value)
+        .on_conflict_do_update(index_elements=[Checkpoint.name], set_={"value": value})
+    )
@@ -0,0 +1,136 @@
+# config.py
+# settings per environment, picked with APP_CONFIG (development, production, testing)
+import os
+from dotenv import load_dotenv
+
+# Load .env
+load_dotenv()
+
+basedir = os.path.abspath(os.path.dirname(__file__))
+
+
+class Config:
+    # Uses database file called polling_app.db
+    SQLALCHEMY_DATABASE_URI = os.getenv(
+        "DATABASE_URL", f"sqlite:///{os.path.join(basedir, 'instance/polling_app.db')}"
+    )
+    SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # pool of connections to the database file; timeout is how long
+    # a request waits for a free connection
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "pool_size": 5,
+        "max_overflow": 10,
+        "pool_timeout": 30,
+        "connect_args": {"check_same_thread": False},
+    }
+    # run on every new SQLite connection. WAL lets reads carry on while a vote
+    # is being written, busy_timeout waits for the write lock instead of failing
+    # with "database is locked"
+    SQLITE_PRAGMAS = {
+        "journal_mode": "WAL",
+        "synchronous": "NORMAL",
+        "busy_timeout": 5000,  # ms
+        "cache_size": -16000,  # KiB
+        "mmap_size": 64 * 1024 * 1024,  # bytes
+        "temp_store": "MEMORY",
+        # enforce foreign keys, which also runs their ON DELETE CASCADE
+        "foreign_keys": "ON",
+    }
+
+    # Ensures secure logins
+    JWT_SECRET_KEY = os.getenv("JWT_SECRET_KEY", "fallback_key_for_dev")
+
+    # page sizes for list endpoints
+    POLLS_PAGE_SIZE = 50
+    POLLS_MAX_PAGE_SIZE = 200
+    USERS_PAGE_SIZE = 50
+    USERS_MAX_PAGE_SIZE = 500
+    HISTORY_PAGE_SIZE = 50
+    HISTORY_MAX_PAGE_SIZE = 200
+    CHANGES_PAGE_SIZE = 200
+    CHANGES_MAX_PAGE_SIZE = 1000
+    # most votes accepted by one /vote/batch request
+    VOTE_BATCH_MAX = 1000
+    # number of polls whose tallies are kept in memory
+    TALLY_CACHE_SIZE = 1024
+    # encoded /polls and /poll-results bodies kept for conditional GETs
+    RESPONSE_CACHE_SIZE = 256
+    # rows fetched per chunk when streaming vote exports
+    EXPORT_CHUNK_SIZE = 1000
+    # seconds a resolved login (id, admin flag) is reused before re-reading the user row
+    USER_CACHE_TTL = 30
+    # password hashing: "bcrypt" or a werkzeug method, run in a pool of worker threads or processes
+    PASSWORD_HASH_METHOD = os.getenv("PASSWORD_HASH_METHOD", "scrypt")
+    BCRYPT_LOG_ROUNDS = int(os.getenv("BCRYPT_LOG_ROUNDS", "12"))
+    PASSWORD_HASH_WORKERS = int(os.getenv("PASSWORD_HASH_WORKERS", "0")) or None
+    PASSWORD_HASH_EXECUTOR = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+    # seconds over which live vote deltas are merged before being pushed
+    LIVE_UPDATE_WINDOW = float(os.getenv("LIVE_UPDATE_WINDOW", "0.25"))
+    # most buckets one /poll-timeline request may cover
+    TIMELINE_MAX_BUCKETS = 5000
+    # bulk imports: rows per transaction, and most rows accepted by one request
+    IMPORT_BATCH_SIZE = 500
+    IMPORT_MAX_ROWS = 10000
+    # request timing and SQL counting for /metrics; off installs no hooks at all
+    METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+    # requests and queries slower than these (ms) are logged as warnings
+    SLOW_REQUEST_MS = int(os.getenv("SLOW_REQUEST_MS", "500"))
+    SLOW_QUERY_MS = int(os.getenv("SLOW_QUERY_MS", "100"))
+    # "direct" commits every vote in its request; "journal" appends votes to an
+    # fsynced file, answers 202 and applies them in batches in the background.
+    # The journal belongs to one process, so run a single worker with it
+    VOTE_INGEST_MODE = os.getenv("VOTE_INGEST_MODE", "direct")
+    VOTE_JOURNAL_PATH = os.getenv("VOTE_JOURNAL_PATH", os.path.join(basedir, "instance/vote-journal.jsonl"))
+    # votes applied per transaction, and seconds between background compactions
+    VOTE_JOURNAL_BATCH_SIZE = 5000
+    VOTE_JOURNAL_INTERVAL = float(os.getenv("VOTE_JOURNAL_INTERVAL", "1.0"))
+    # a fully applied journal is emptied once it is bigger than this (bytes)
+    VOTE_JOURNAL_ROTATE_BYTES = 16 * 1024 * 1024
+    # seconds between runs of the thread that closes and archives expired polls
+    # and reconciles vote counters (0 turns it off; `flask polls close-expired`
+    # and `flask tallies reconcile` do the same from cron)
+    POLL_SCHEDULER_INTERVAL = float(os.getenv("POLL_SCHEDULER_INTERVAL", "30"))
+    # polls with more votes than this are deleted by that thread, this many rows
+    # per transaction with a pause (seconds) between them so other writers get in
+    POLL_DELETE_CHUNK_SIZE = 5000
+    POLL_DELETE_PAUSE = 0.05
+    # changed polls recounted per transaction by the counter reconciliation
+    RECONCILE_BATCH_SIZE = 500
+
+
+class DevelopmentConfig(Config):
+    pass
+
+
+class ProductionConfig(Config):
+    SQLALCHEMY_ENGINE_OPTIONS = {
+        "pool_size": 20,
+        "max_overflow": 20,
+        "pool_timeout": 30,
+        "connect_args": {"check_same_thread": False},
+    }
+    SQLITE_PRAGMAS = {
+        **Config.SQLITE_PRAGMAS,
+        "cache_size": -64000,
+        "mmap_size": 256 * 1024 * 1024,
+    }
+
+
+class TestingConfig(Config):
+    TESTING = True
+    # in-memory database, flask-sqlalchemy shares one connection for it
+    SQLALCHEMY_DATABASE_URI = "sqlite:///:memory:"
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    SQLITE_PRAGMAS = {"foreign_keys": "ON"}
+    # cheap hashes keep the suite fast
+    PASSWORD_HASH_METHOD = "pbkdf2:sha256:1000"
+    BCRYPT_LOG_ROUNDS = 4
+    # tests close polls themselves
+    POLL_SCHEDULER_INTERVAL = 0
+
+
+config_by_name = {
+    "development": DevelopmentConfig,
+    "production": ProductionConfig,
+    "testing": TestingConfig,
+}
@@ -0,0 +1,17 @@
+# database.py
+# connect-time setup for the SQLite engine
+from sqlalchemy import event
+
+
+def configure_engine(app, engine):
+    # apply SQLITE_PRAGMAS to every connection the pool opens
+    pragmas = app.config.get("SQLITE_PRAGMAS") or {}
+    if engine.dialect.name != "sqlite" or not pragmas:
+        return
+
+    @event.listens_for(engine, "connect")
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f"PRAGMA {name}={value}")
+        cursor.close()
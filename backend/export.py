@@ -0,0 +1,58 @@
+# export.py
+# streams raw vote rows as CSV or NDJSON. Rows come off one cursor in
+# EXPORT_CHUNK_SIZE batches, so memory stays flat however many votes there are;
+# with WAL the long read doesn't hold up vote writes
+import csv
+import io
+import json
+from sqlalchemy import select
+from models import Vote
+
+EXPORT_COLUMNS = ["id", "poll_id", "option_id", "user_id", "timestamp"]
+
+
+def vote_rows(engine, chunk_size, poll_id=None, since=None, until=None, table=Vote):
+    # yields lists of rows, one list per chunk; table is Vote or ArchivedVote
+    statement = select(table.id, table.poll_id, table.option_id, table.user_id, table.timestamp)
+    if poll_id is not None:
+        # walks the (poll_id, timestamp) index in order, no sort step
+        statement = statement.where(table.poll_id == poll_id).order_by(table.timestamp, table.id)
+    else:
+        statement = statement.order_by(table.id)
+    if since is not None:
+        statement = statement.where(table.timestamp >= since)
+    if until is not None:
+        statement = statement.where(table.timestamp < until)
+
+    with engine.connect() as connection:
+        result = connection.execution_options(stream_results=True, yield_per=chunk_size).execute(statement)
+        for rows in result.partitions():
+            yield rows
+
+
+def encode_csv(chunks):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_COLUMNS)
+    yield buffer.getvalue()
+    for rows in chunks:
+        buffer.seek(0)
+        buffer.truncate()
+        writer.writerows(
+            (row.id, row.poll_id, row.option_id, row.user_id, _timestamp(row.timestamp)) for row in rows
+        )
+        yield buffer.getvalue()
+
+
+def encode_ndjson(chunks):
+    for rows in chunks:
+        yield "".join(
+            json.dumps(dict(zip(EXPORT_COLUMNS, (
+                row.id, row.poll_id, row.option_id, row.user_id, _timestamp(row.timestamp)
+            )))) + "\n"
+            for row in rows
+        )
+
+
+def _timestamp(value):
+    return value.isoformat() if value is not None else None
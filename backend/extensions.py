@@ -0,0 +1,36 @@
+# extensions.py
+# the database and JWT extensions are created unbound here and attached to an app
+# by create_app, so modules can import them without building an app first. The
+# in-process state (caches, hashing pool, socket server, live updates, metrics)
+# is made per app by create_app and kept in app.extensions; the names below
+# stand for the current app's instance, so two apps never share any of it.
+# Flask-Migrate is not here: create_app loads it only for the flask command
+from flask import current_app
+from flask_sqlalchemy import SQLAlchemy
+from flask_jwt_extended import JWTManager
+from werkzeug.local import LocalProxy
+
+
+def _app_state(name):
+    # the current app's instance of an extension, set up by create_app
+    return LocalProxy(lambda: current_app.extensions[name])
+
+
+# login token setup
+jwt = JWTManager()
+# database setup
+db = SQLAlchemy()
+# socketIO
+socketio = _app_state("socketio")
+# poll tally cache
+tally_cache = _app_state("tally_cache")
+# encoded responses for ETags
+data_versions = _app_state("data_versions")
+# logged-in user lookups
+user_cache = _app_state("user_cache")
+# password hashing pool
+password_hasher = _app_state("password_hasher")
+# live poll results
+broadcaster = _app_state("tally_broadcaster")
+# request timing and query counts
+metrics = _app_state("metrics")
@@ -0,0 +1,233 @@
+# importer.py
+# bulk creation of users and polls from JSON or CSV, for the admin import
+# endpoints and the `flask import` commands. Rows are checked up front, passwords
+# are hashed across the whole hashing pool, and inserts go out as executemany in
+# IMPORT_BATCH_SIZE batches, one transaction per batch. Every rejected row is
+# reported with its index instead of failing the whole file
+import csv
+import io
+import json
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import insert, or_, select
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
+from extensions import db, password_hasher
+from models import User, Poll, Option
+from changes import record_changes, EDITED
+
+BATCH_ATTEMPTS = 3
+TRUE_VALUES = {"1", "true", "yes", "y"}
+
+
+class ImportFileError(ValueError):
+    # the file itself can't be read; row problems go in the report instead
+    pass
+
+
+def parse_rows(text, fmt, kind):
+    # list of row dicts from a JSON array (or {"users"/"polls": [...]}) or a CSV with a header.
+    # Poll CSV rows are question plus one column per option (option1, option2, ...)
+    if fmt == "json":
+        try:
+            data = json.loads(text)
+        except ValueError:
+            raise ImportFileError("Invalid JSON")
+        if isinstance(data, dict):
+            data = data.get(kind)
+        if not isinstance(data, list):
+            raise ImportFileError(f"Expected a list of {kind}")
+        return data
+    if fmt == "csv":
+        reader = csv.DictReader(io.StringIO(text))
+        if not reader.fieldnames:
+            raise ImportFileError("Missing CSV header")
+        rows = []
+        for row in reader:
+            if kind == "polls":
+                options = [row[name] for name in reader.fieldnames if name.lower().startswith("option") and row.get(name)]
+                row = {"question": row.get("question"), "options": options}
+            else:
+                row = dict(row, is_admin=(row.get("is_admin") or "").strip().lower() in TRUE_VALUES)
+            rows.append(row)
+        return rows
+    raise ImportFileError("Unsupported format, use json or csv")
+
+
+def _batches(items, size):
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+def _check_user(row):
+    if not isinstance(row, dict):
+        return "Invalid row"
+    username, email, password = row.get("username"), row.get("email"), row.get("password")
+    if not username or not email or not password:
+        return "Missing required fields"
+    if not all(isinstance(value, str) for value in (username, email, password)):
+        return "Invalid row"
+    if len(username) > 80 or len(email) > 120:
+        return "Username or email too long"
+    # a real boolean, so "false" in a JSON file doesn't make an admin
+    if not isinstance(row.get("is_admin", False), bool):
+        return "is_admin must be true or false"
+    return None
+
+
+def _check_poll(row):
+    if not isinstance(row, dict):
+        return "Invalid row"
+    question, options = row.get("question"), row.get("options")
+    if not question or not isinstance(question, str) or not isinstance(options, list) or len(options) < 2:
+        return "Missing required fields: question and options."
+    if len(question) > 200 or any(not isinstance(text, str) or not text or len(text) > 200 for text in options):
+        return "Invalid question or option text"
+    if not isinstance(row.get("is_multiple_choice", False), bool):
+        return "is_multiple_choice must be true or false"
+    return None
+
+
+def import_users(rows, batch_size=None):
+    # returns {"created": n, "errors": [{"index", "msg"}]}
+    batch_size = batch_size or current_app.config["IMPORT_BATCH_SIZE"]
+    errors = {}
+    seen_usernames, seen_emails = set(), set()
+    valid = []
+    for index, row in enumerate(rows):
+        msg = _check_user(row)
+        if msg is None and (row["username"] in seen_usernames or row["email"] in seen_emails):
+            msg = "Duplicate username or email in file"
+        if msg:
+            errors[index] = msg
+            continue
+        seen_usernames.add(row["username"])
+        seen_emails.add(row["email"])
+        valid.append((index, row))
+
+    created = 0
+    for batch in _batches(valid, batch_size):
+        # hash the batch over every worker before taking the write lock
+        hashes = password_hasher.hash_many([row["password"] for _, row in batch])
+        pending = [(index, row, hashed) for (index, row), hashed in zip(batch, hashes)]
+        for _ in range(BATCH_ATTEMPTS):
+            # accounts that already exist, one query for the whole batch
+            taken = set(db.session.execute(select(User.username, User.email).where(or_(
+                User.username.in_([row["username"] for _, row, _ in pending]),
+                User.email.in_([row["email"] for _, row, _ in pending])
+            ))).all())
+            taken_usernames = {username for username, _ in taken}
+            taken_emails = {email for _, email in taken}
+            insertable = []
+            for index, row, hashed in pending:
+                if row["username"] in taken_usernames or row["email"] in taken_emails:
+                    errors[index] = "Username or email already in use"
+                else:
+                    insertable.append((index, row, hashed))
+            if not insertable:
+                break
+            try:
+                db.session.execute(insert(User), [{
+                    "username": row["username"],
+                    "email": row["email"],
+                    "password": hashed,
+                    "is_admin": row.get("is_admin", False),
+                } for _, row, hashed in insertable])
+                db.session.commit()
+                created += len(insertable)
+                break
+            except IntegrityError:
+                # someone registered one of these meanwhile; check the batch again
+                db.session.rollback()
+                pending = insertable
+        else:
+            for index, _, _ in pending:
+                errors[index] = "Could not be saved, please retry"
+
+    return _report(created, errors)
+
+
+def import_polls(rows, user_id, batch_size=None):
+    # returns {"created": n, "poll_ids": [...], "errors": [{"index", "msg"}]}
+    batch_size = batch_size or current_app.config["IMPORT_BATCH_SIZE"]
+    errors = {}
+    valid = []
+    for index, row in enumerate(rows):
+        msg = _check_poll(row)
+        if msg:
+            errors[index] = msg
+        else:
+            valid.append((index, row))
+
+    poll_ids = []
+    for batch in _batches(valid, batch_size):
+        try:
+            # the new ids in row order, whatever ids the database hands out
+            ids = list(db.session.scalars(insert(Poll).returning(Poll.id, sort_by_parameter_order=True), [{
+                "question": row["question"],
+                "user_id": user_id,
+                "is_multiple_choice": row.get("is_multiple_choice", False),
+            } for _, row in batch]))
+            db.session.execute(insert(Option), [
+                {"text": text, "poll_id": poll_id}
+                for poll_id, (_, row) in zip(ids, batch) for text in row["options"]
+            ])
+            record_changes(ids, EDITED)
+            db.session.commit()
+        except SQLAlchemyError:
+            # earlier batches are in; this one is reported and the rest still tried
+            db.session.rollback()
+            for index, _ in batch:
+                errors[index] = "Could not be saved, please retry"
+            continue
+        poll_ids.extend(ids)
+
+    report = _report(len(poll_ids), errors)
+    report["poll_ids"] = poll_ids
+    return report
+
+
+def _report(created, errors):
+    return {
+        "created": created,
+        "errors": [{"index": index, "msg": msg} for index, msg in sorted(errors.items())],
+    }
+
+
+# flask import users FILE / flask import polls FILE --creator EMAIL
+import_cli = AppGroup("import", help="Bulk import users or polls from JSON or CSV.")
+
+
+def _read_file(path, fmt, kind):
+    fmt = fmt or ("csv" if path.lower().endswith(".csv") else "json")
+    with open(path, encoding="utf-8", newline="") as f:
+        try:
+            return parse_rows(f.read(), fmt, kind)
+        except ImportFileError as error:
+            raise click.ClickException(str(error))
+
+
+def _echo_report(report):
+    click.echo(f"created {report['created']}, rejected {len(report['errors'])}")
+    for error in report["errors"]:
+        click.echo(f"  row {error['index']}: {error['msg']}", err=True)
+
+
+@import_cli.command("users", help="Create user accounts from a JSON or CSV file.")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--format", "fmt", type=click.Choice(["json", "csv"]), help="default: from the file extension")
+@click.option("--batch-size", type=int, help="rows per transaction")
+def import_users_command(path, fmt, batch_size):
+    _echo_report(import_users(_read_file(path, fmt, "users"), batch_size))
+
+
+@import_cli.command("polls", help="Create polls with their options from a JSON or CSV file.")
+@click.argument("path", type=click.Path(exists=True, dir_okay=False))
+@click.option("--creator", required=True, help="email of the user the polls belong to")
+@click.option("--format", "fmt", type=click.Choice(["json", "csv"]), help="default: from the file extension")
+@click.option("--batch-size", type=int, help="rows per transaction")
+def import_polls_command(path, creator, fmt, batch_size):
+    user_id = db.session.execute(select(User.id).where(User.email == creator)).scalar()
+    if user_id is None:
+        raise click.ClickException(f"No user with email {creator}")
+    _echo_report(import_polls(_read_file(path, fmt, "polls"), user_id, batch_size))
@@ -0,0 +1,319 @@
+# journal.py
+# high-throughput vote ingest for VOTE_INGEST_MODE=journal. Accepted votes are
+# appended to a JSON-lines file and acknowledged once fsynced; votes that arrive
+# while one write is on its way to disk go out together in the next (group
+# commit). A background compactor applies the journal to the vote, option and
+# vote_rollup tables in large batches and saves how far it got in the checkpoint
+# table in the same transaction. Repeat votes are caught by an in-memory index
+# of every vote, rebuilt from the database and the unapplied end of the journal.
+# Closing, editing or deleting a poll blocks its votes (blocking_votes) and bumps
+# its epoch; votes checked against the poll as it was before are turned away
+import json
+import os
+import threading
+import time
+from collections import Counter, defaultdict, namedtuple
+from concurrent.futures import Future
+from contextlib import contextmanager
+from datetime import datetime
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import func, select
+from extensions import db
+from models import Option, Poll, Vote
+from checkpoints import load_checkpoint, save_checkpoint
+from voting import apply_votes, votes_committed
+
+CHECKPOINT = "vote_journal"
+
+# what accepting a vote needs to know about its poll
+PollInfo = namedtuple("PollInfo", "is_multiple_choice option_ids opens_at closes_at closed_at epoch")
+
+
+class JournalError(Exception):
+    # the votes could not be written to disk, so none of them were accepted
+    pass
+
+
+def init_journal(app):
+    if app.config.get("VOTE_INGEST_MODE") == "journal":
+        app.extensions["vote_journal"] = VoteJournal(app)
+
+
+def current_journal():
+    # the app's journal, None when votes are committed directly
+    return current_app.extensions.get("vote_journal")
+
+
+@contextmanager
+def blocking_votes(poll_id):
+    # around closing, editing or deleting a poll: its journaled votes are applied
+    # first and no new ones are accepted until the block has finished
+    journal = current_journal()
+    if journal is None:
+        yield
+        return
+    journal.block_poll(poll_id)
+    try:
+        journal.compact()
+        yield
+    finally:
+        journal.forget_poll(poll_id)
+
+
+def vote_key(poll_id, user_id, option_id, is_multiple_choice):
+    # what may be voted once: the poll for single choice, each option for multiple choice
+    return (poll_id, user_id, option_id) if is_multiple_choice else (poll_id, user_id)
+
+
+class VoteJournal:
+    def __init__(self, app):
+        self.app = app
+        self.path = app.config["VOTE_JOURNAL_PATH"]
+        self.batch_size = app.config["VOTE_JOURNAL_BATCH_SIZE"]
+        self.interval = app.config["VOTE_JOURNAL_INTERVAL"]
+        self.rotate_bytes = app.config["VOTE_JOURNAL_ROTATE_BYTES"]
+        self._index = defaultdict(set)  # poll id -> vote_key of every accepted vote
+        self._polls = {}  # poll id -> PollInfo, for checking votes
+        self._blocked = set()  # polls being closed, edited or deleted
+        self._epochs = Counter()  # poll id -> changes so far, see epochs()
+        self._queue = []  # (encoded lines, future) waiting for the writer
+        self._lock = threading.Lock()  # index and queue
+        self._queued = threading.Condition(self._lock)
+        self._write_lock = threading.Lock()  # the file and _written
+        self._compact_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._started = False
+        self._file = None
+        self._written = 0  # bytes on disk
+        self._applied = 0  # bytes applied to the database
+        # loaded on the first request, so flask commands and new databases don't pay for it
+        app.before_request(self.start)
+
+    def start(self):
+        if self._started:
+            return
+        with self._start_lock:
+            if self._started:
+                return
+            self._recover()
+            threading.Thread(target=self._write_loop, name="vote-journal-writer", daemon=True).start()
+            if self.interval > 0:
+                threading.Thread(target=self._compact_loop, name="vote-journal-compactor", daemon=True).start()
+            self._started = True
+
+    def pending_bytes(self):
+        return self._written - self._applied
+
+    def epochs(self, poll_ids):
+        # take before checking votes against the polls, pass to append
+        with self._lock:
+            return {poll_id: self._epochs[poll_id] for poll_id in poll_ids}
+
+    def append(self, rows, epochs, all_or_nothing=False):
+        # rows are vote dicts as cast_votes builds them, checked against the polls
+        # at epochs; returns for each True once it is on disk, False for a repeat
+        # vote, or None if its poll has changed since (check it again)
+        keys = [vote_key(row["poll_id"], row["user_id"], row["option_id"], row["is_multiple_choice"]) for row in rows]
+        accepted = []
+        with self._lock:
+            seen = set()
+            for row, key in zip(rows, keys):
+                poll_id = row["poll_id"]
+                if poll_id in self._blocked or self._epochs[poll_id] != epochs[poll_id]:
+                    accepted.append(None)
+                else:
+                    accepted.append(key not in self._index.get(poll_id, ()) and key not in seen)
+                seen.add(key)
+            if all_or_nothing and not all(accepted):
+                return [None if ok is None else False for ok in accepted]
+            new_keys = [key for key, ok in zip(keys, accepted) if ok]
+            if not new_keys:
+                return accepted
+            for key in new_keys:
+                self._index[key[0]].add(key)
+            future = Future()
+            self._queue.append((b"".join(_encode(row) for row, ok in zip(rows, accepted) if ok), future))
+            self._queued.notify()
+        try:
+            future.result()
+        except OSError as error:
+            with self._lock:
+                for key in new_keys:
+                    self._index[key[0]].discard(key)
+            raise JournalError(str(error))
+        return accepted
+
+    def poll(self, poll_id):
+        # PollInfo of a poll, None if it doesn't exist; kept in memory so
+        # accepting a vote doesn't need the database
+        with self._lock:
+            poll = self._polls.get(poll_id)
+            epoch = self._epochs[poll_id]
+        if poll is None:
+            rows = db.session.execute(
+                select(Option.id, func.coalesce(Poll.is_multiple_choice, False), Poll.opens_at, Poll.closes_at, Poll.closed_at)
+                .join(Poll, Poll.id == Option.poll_id).where(Option.poll_id == poll_id, Poll.deleted_at.is_(None))
+            ).all()
+            if not rows:
+                return None
+            _, multiple, opens_at, closes_at, closed_at = rows[0]
+            poll = PollInfo(bool(multiple), frozenset(row[0] for row in rows), opens_at, closes_at, closed_at, epoch)
+            with self._lock:
+                # not if the poll is changing or changed while it was read
+                if poll_id not in self._blocked and self._epochs[poll_id] == epoch:
+                    self._polls[poll_id] = poll
+        return poll
+
+    def block_poll(self, poll_id):
+        # before closing, editing or deleting: votes checked earlier are turned away
+        with self._lock:
+            self._blocked.add(poll_id)
+            self._epochs[poll_id] += 1
+            self._polls.pop(poll_id, None)
+
+    def forget_poll(self, poll_id):
+        # after the close, edit or delete (committed or not); a deleted poll's id
+        # can be handed out again
+        with self._lock:
+            self._blocked.discard(poll_id)
+            self._epochs[poll_id] += 1
+            self._polls.pop(poll_id, None)
+            self._index.pop(poll_id, None)
+
+    def compact(self):
+        # apply everything on disk so far; returns the number of votes applied
+        applied = 0
+        with self._compact_lock:
+            with self._write_lock:
+                end = self._written
+            with open(self.path, "rb") as f:
+                f.seek(self._applied)
+                while self._applied < end:
+                    lines, size = [], 0
+                    while len(lines) < self.batch_size and self._applied + size < end:
+                        line = f.readline()
+                        lines.append(json.loads(line))
+                        size += len(line)
+                    applied += self._apply(lines, self._applied + size)
+                    self._applied += size
+            self._rotate()
+        return applied
+
+    def _apply(self, entries, offset):
+        # votes for options deleted since, with their poll, are dropped
+        existing = set(db.session.scalars(
+            select(Option.id).where(Option.id.in_({entry["option_id"] for entry in entries}))
+        ))
+        rows = [
+            dict(entry, timestamp=datetime.fromisoformat(entry["timestamp"]))
+            for entry in entries if entry["option_id"] in existing
+        ]
+        try:
+            counts = apply_votes(rows) if rows else {}
+            save_checkpoint(CHECKPOINT, offset)
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        votes_committed(counts)
+        return len(rows)
+
+    def _rotate(self):
+        # empty a fully applied journal once it has grown; the file is cut before
+        # the checkpoint is reset, so a crash in between replays nothing
+        with self._write_lock:
+            if self._written < self.rotate_bytes or self._applied != self._written:
+                return
+            self._file.truncate(0)
+            os.fsync(self._file.fileno())
+            self._written = self._applied = 0
+            save_checkpoint(CHECKPOINT, 0)
+            db.session.commit()
+
+    def _recover(self):
+        applied = load_checkpoint(CHECKPOINT)
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        with open(self.path, "ab+") as f:
+            f.seek(0)
+            data = f.read()
+            # a torn last line was never acknowledged
+            end = data.rfind(b"\n") + 1
+            if end < len(data):
+                f.truncate(end)
+                os.fsync(f.fileno())
+        # shorter than the checkpoint: emptied after being applied, before the checkpoint was reset
+        if applied > end:
+            applied = 0
+        index = defaultdict(set)
+        for row in db.session.execute(select(Vote.poll_id, Vote.user_id, Vote.option_id, Vote.is_multiple_choice)):
+            index[row[0]].add(vote_key(*row))
+        for line in data[applied:end].splitlines():
+            entry = json.loads(line)
+            index[entry["poll_id"]].add(
+                vote_key(entry["poll_id"], entry["user_id"], entry["option_id"], entry["is_multiple_choice"])
+            )
+        with self._lock:
+            self._index = index
+        self._written, self._applied = end, applied
+        self._file = open(self.path, "ab")
+        self.app.logger.info("vote journal: %d bytes to apply", end - applied)
+
+    def _write_loop(self):
+        while True:
+            with self._queued:
+                while not self._queue:
+                    self._queued.wait()
+                batch, self._queue = self._queue, []
+            # everything queued while the last fsync ran shares this one
+            data = b"".join(lines for lines, _ in batch)
+            with self._write_lock:
+                try:
+                    self._file.write(data)
+                    self._file.flush()
+                    os.fsync(self._file.fileno())
+                except OSError as error:
+                    # leave nothing of an unacknowledged group for the compactor
+                    try:
+                        self._file.truncate(self._written)
+                    except OSError:
+                        pass
+                    for _, future in batch:
+                        future.set_exception(error)
+                    continue
+                self._written += len(data)
+            for _, future in batch:
+                future.set_result(None)
+
+    def _compact_loop(self):
+        while True:
+            time.sleep(self.interval)
+            with self.app.app_context():
+                try:
+                    self.compact()
+                except Exception:
+                    self.app.logger.exception("vote journal compaction failed")
+
+
+def _encode(row):
+    return (json.dumps({
+        "poll_id": row["poll_id"],
+        "user_id": row["user_id"],
+        "option_id": row["option_id"],
+        "is_multiple_choice": bool(row["is_multiple_choice"]),
+        "timestamp": row["timestamp"].isoformat(),
+    }, separators=(",", ":")) + "\n").encode()
+
+
+# flask journal compact
+journal_cli = AppGroup("journal", help="Vote journal maintenance.")
+
+
+@journal_cli.command("compact", help="Apply every vote in the journal now. Stop the server first.")
+def compact_command():
+    journal = current_journal()
+    if journal is None:
+        raise click.ClickException("VOTE_INGEST_MODE is not journal")
+    journal.start()
+    click.echo(f"applied {journal.compact()} votes")
@@ -0,0 +1,217 @@
+# lifecycle.py
+# poll open and close times. Closing a poll freezes its final tallies into
+# poll_snapshot and moves its vote rows to archived_vote, so the vote table and
+# the open-poll indexes only hold polls that can still change. A scheduler thread
+# closes polls whose closes_at has passed and stamps polls whose opens_at has
+# passed in the change log, so /changes and the ETags pick them up.
+# Deleting a poll is one DELETE that the database cascades to its rows; polls
+# with more votes than POLL_DELETE_CHUNK_SIZE are only marked deleted and the
+# same thread removes their rows a chunk per transaction. It also runs the vote
+# counter reconciliation
+import json
+import threading
+import time
+from datetime import datetime, timezone
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import delete, func, insert, literal_column, select, update
+from extensions import db
+from models import Poll, Option, Vote, ArchivedVote, PollSnapshot, VoteRollup
+from changes import record_changes, EDITED, DELETED
+from checkpoints import load_checkpoint, save_checkpoint
+from journal import blocking_votes
+from voting import poll_changed
+from reconcile import reconcile
+
+OPENED_CHECKPOINT = "polls_opened_through"  # unix seconds
+ARCHIVED_COLUMNS = ["id", "poll_id", "user_id", "option_id", "timestamp", "is_multiple_choice"]
+
+
+def utcnow():
+    # naive UTC, the way timestamps are stored
+    return datetime.now(timezone.utc).replace(tzinfo=None)
+
+
+def close_poll(poll_id, now=None):
+    # snapshot and archive one poll; returns the snapshot, or None if the poll
+    # doesn't exist or was already closed
+    now = now or utcnow()
+    # votes still in the journal belong in the final tally, and none are taken
+    # while the poll closes
+    with blocking_votes(poll_id):
+        snapshot = _close(poll_id, now)
+    if snapshot is not None:
+        poll_changed(poll_id, "poll_closed")
+    return snapshot
+
+
+def _close(poll_id, now):
+    poll = db.session.get(Poll, poll_id)
+    if poll is None or poll.closed_at is not None or poll.deleted_at is not None:
+        return None
+    # conditional, so two schedulers can't both archive the poll
+    closing = update(Poll).where(
+        Poll.id == poll_id, Poll.closed_at.is_(None), Poll.deleted_at.is_(None)
+    ).values(closed_at=now)
+    if db.session.execute(closing).rowcount != 1:
+        db.session.rollback()
+        return None
+
+    options = db.session.execute(
+        select(Option.id, Option.text, Option.votes).where(Option.poll_id == poll_id).order_by(Option.id)
+    ).all()
+    snapshot = PollSnapshot(poll_id=poll_id, question=poll.question, closed_at=now, results=json.dumps([
+        {"id": option_id, "option": text, "votes": votes or 0} for option_id, text, votes in options
+    ]))
+    db.session.add(snapshot)
+    vote_table = Vote.__table__
+    db.session.execute(insert(ArchivedVote).from_select(
+        ARCHIVED_COLUMNS,
+        select(*(vote_table.c[name] for name in ARCHIVED_COLUMNS)).where(vote_table.c.poll_id == poll_id)
+    ))
+    db.session.execute(delete(Vote).where(Vote.poll_id == poll_id))
+    record_changes([poll_id], EDITED)
+    db.session.commit()
+    return snapshot
+
+
+def snapshot_payload(snapshot):
+    # the /poll-results body of a closed poll
+    return {
+        "poll_id": snapshot.poll_id,
+        "question": snapshot.question,
+        "closed_at": snapshot.closed_at.isoformat(),
+        "results": [{"option": result["option"], "votes": result["votes"]} for result in json.loads(snapshot.results)],
+    }
+
+
+def close_expired(now=None):
+    # close every poll past its closes_at; returns their ids
+    now = now or utcnow()
+    poll_ids = list(db.session.scalars(
+        select(Poll.id).where(
+            Poll.closed_at.is_(None), Poll.deleted_at.is_(None), Poll.closes_at.is_not(None), Poll.closes_at <= now
+        )
+    ))
+    return [poll_id for poll_id in poll_ids if close_poll(poll_id, now) is not None]
+
+
+def announce_opened(now=None):
+    # stamp polls whose opens_at passed since the last run; returns their ids
+    now = now or utcnow()
+    since = datetime.fromtimestamp(load_checkpoint(OPENED_CHECKPOINT), timezone.utc).replace(tzinfo=None)
+    poll_ids = list(db.session.scalars(select(Poll.id).where(
+        Poll.closed_at.is_(None), Poll.deleted_at.is_(None), Poll.opens_at.is_not(None),
+        Poll.opens_at > since, Poll.opens_at <= now
+    )))
+    record_changes(poll_ids, EDITED)
+    # whole seconds, rounded down: a poll opening in the same second is stamped twice at most
+    save_checkpoint(OPENED_CHECKPOINT, int(now.replace(tzinfo=timezone.utc).timestamp()))
+    db.session.commit()
+    for poll_id in poll_ids:
+        poll_changed(poll_id, "poll_opened")
+    return poll_ids
+
+
+def remove_poll(poll_id):
+    # returns True if the rows are left to purge_deleted. The vote count comes
+    # from the option counters, which is plenty for choosing a path
+    chunk_size = current_app.config["POLL_DELETE_CHUNK_SIZE"]
+    votes = db.session.scalar(select(func.coalesce(func.sum(Option.votes), 0)).where(Option.poll_id == poll_id))
+    background = votes > chunk_size
+    if background:
+        db.session.execute(update(Poll).where(Poll.id == poll_id).values(deleted_at=utcnow()))
+    else:
+        # options, votes, rollups, archive and snapshot go with it (ON DELETE CASCADE)
+        db.session.execute(delete(Poll).where(Poll.id == poll_id))
+    record_changes([poll_id], DELETED)
+    db.session.commit()
+    if background:
+        scheduler = current_app.extensions.get("poll_scheduler")
+        if scheduler is not None:
+            scheduler.wake()
+    return background
+
+
+def purge_deleted(chunk_size=None, pause=0):
+    # remove the rows of polls marked deleted, at most chunk_size per transaction;
+    # returns the ids of the polls removed
+    chunk_size = chunk_size or current_app.config["POLL_DELETE_CHUNK_SIZE"]
+    poll_ids = list(db.session.scalars(select(Poll.id).where(Poll.deleted_at.is_not(None))))
+    for poll_id in poll_ids:
+        for table in (Vote, ArchivedVote, VoteRollup):
+            while _delete_chunk(table, poll_id, chunk_size) == chunk_size:
+                time.sleep(pause)
+        # what is left is small: the poll, its options and its snapshot
+        db.session.execute(delete(Poll).where(Poll.id == poll_id))
+        db.session.commit()
+    return poll_ids
+
+
+def _delete_chunk(table, poll_id, chunk_size):
+    # one transaction, so the write lock is held for one chunk at a time
+    rowid = literal_column("rowid")
+    chunk = select(rowid).select_from(table).where(table.poll_id == poll_id).limit(chunk_size)
+    deleted = db.session.execute(delete(table).where(rowid.in_(chunk))).rowcount
+    db.session.commit()
+    return deleted
+
+
+def init_scheduler(app):
+    if app.config.get("POLL_SCHEDULER_INTERVAL", 0) > 0:
+        app.extensions["poll_scheduler"] = PollScheduler(app)
+
+
+class PollScheduler:
+    def __init__(self, app):
+        self.app = app
+        self.interval = app.config["POLL_SCHEDULER_INTERVAL"]
+        self.pause = app.config["POLL_DELETE_PAUSE"]
+        self._wake = threading.Event()
+        self._lock = threading.Lock()
+        self._started = False
+        # started by the first request, like the vote journal
+        app.before_request(self.start)
+
+    def start(self):
+        if self._started:
+            return
+        with self._lock:
+            if self._started:
+                return
+            threading.Thread(target=self._loop, name="poll-scheduler", daemon=True).start()
+            self._started = True
+
+    def wake(self):
+        # run now rather than at the next interval, for a poll waiting to be deleted
+        self._wake.set()
+
+    def _loop(self):
+        while True:
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            with self.app.app_context():
+                try:
+                    purge_deleted(pause=self.pause)
+                    announce_opened()
+                    close_expired()
+                    reconcile()
+                except Exception:
+                    db.session.rollback()
+                    self.app.logger.exception("poll scheduler run failed")
+
+
+# flask polls close-expired
+polls_cli = AppGroup("polls", help="Poll lifecycle maintenance.")
+
+
+@polls_cli.command("close-expired", help="Close and archive every poll past its closing time.")
+def close_expired_command():
+    announce_opened()
+    click.echo(f"closed {len(close_expired())} polls")
+
+
+@polls_cli.command("purge-deleted", help="Remove the rows of deleted polls that are still waiting for the background task.")
+def purge_deleted_command():
+    click.echo(f"removed {len(purge_deleted(pause=current_app.config['POLL_DELETE_PAUSE']))} polls")
@@ -0,0 +1,146 @@
+# metrics.py
+# per-request timing and SQL statement counting, slow request/query logging,
+# rendered in Prometheus text format. With METRICS_ENABLED off no hooks or
+# engine listeners are installed at all
+import time
+from threading import Lock
+from flask import g, has_request_context, request
+from sqlalchemy import event
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)  # seconds
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)  # per bucket, made cumulative when rendered
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += 1
+        self.sum += value
+
+
+class Metrics:
+    def __init__(self, app=None, engine=None):
+        self.enabled = False
+        self._lock = Lock()
+        self.reset()
+        if app is not None:
+            self.init_app(app, engine)
+
+    def init_app(self, app, engine):
+        self.enabled = app.config.get("METRICS_ENABLED", True)
+        self.slow_request = app.config.get("SLOW_REQUEST_MS", 500) / 1000
+        self.slow_query = app.config.get("SLOW_QUERY_MS", 100) / 1000
+        self.logger = app.logger
+        self.reset()
+        app.extensions["metrics"] = self
+        if not self.enabled:
+            return
+        app.before_request(self._start_request)
+        app.after_request(self._finish_request)
+        app.teardown_request(self._teardown_request)
+        event.listen(engine, "before_cursor_execute", self._before_query)
+        event.listen(engine, "after_cursor_execute", self._after_query)
+
+    def reset(self):
+        with self._lock:
+            self.latency = {}  # (method, route) -> Histogram of seconds
+            self.queries = {}  # (method, route) -> Histogram of statements per request
+            self.query_seconds = {}  # (method, route) -> total seconds in SQL
+            self.responses = {}  # (method, route, status) -> count
+
+    # request hooks
+    def _start_request(self):
+        g.metrics_started = time.perf_counter()
+        g.metrics_queries = 0
+        g.metrics_query_seconds = 0.0
+
+    def _finish_request(self, response):
+        self._record(response.status_code)
+        return response
+
+    def _teardown_request(self, error):
+        # after_request is skipped when a view raises
+        if error is not None:
+            self._record(500)
+
+    def _record(self, status):
+        started = g.pop("metrics_started", None)
+        if started is None:
+            return
+        elapsed = time.perf_counter() - started
+        route = request.url_rule.rule if request.url_rule else "unmatched"
+        key = (request.method, route)
+        with self._lock:
+            self.latency.setdefault(key, Histogram(LATENCY_BUCKETS)).observe(elapsed)
+            self.queries.setdefault(key, Histogram(QUERY_COUNT_BUCKETS)).observe(g.metrics_queries)
+            self.query_seconds[key] = self.query_seconds.get(key, 0.0) + g.metrics_query_seconds
+            self.responses[key + (status,)] = self.responses.get(key + (status,), 0) + 1
+        if elapsed >= self.slow_request:
+            self.logger.warning(
+                "slow request: %s %s took %.1f ms with %d queries (%.1f ms in SQL)",
+                request.method, request.path, elapsed * 1000, g.metrics_queries, g.metrics_query_seconds * 1000
+            )
+
+    # engine events
+    def _before_query(self, conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("metrics_query_started", []).append(time.perf_counter())
+
+    def _after_query(self, conn, cursor, statement, parameters, context, executemany):
+        elapsed = time.perf_counter() - conn.info["metrics_query_started"].pop()
+        if has_request_context() and "metrics_queries" in g:
+            g.metrics_queries += 1
+            g.metrics_query_seconds += elapsed
+        if elapsed >= self.slow_query:
+            self.logger.warning("slow query (%.1f ms): %s", elapsed * 1000, " ".join(statement.split()))
+
+    def render(self, extra=None):
+        # Prometheus text exposition format; extra maps metric name -> (help, type, value)
+        lines = []
+        with self._lock:
+            lines += _histogram_lines(
+                "http_request_duration_seconds", "Request latency by route.", self.latency
+            )
+            lines += _histogram_lines(
+                "http_request_db_queries", "SQL statements executed per request.", self.queries
+            )
+            lines.append("# HELP http_request_db_seconds_total Time spent in SQL by route.")
+            lines.append("# TYPE http_request_db_seconds_total counter")
+            for (method, route), seconds in sorted(self.query_seconds.items()):
+                lines.append(f'http_request_db_seconds_total{{{_labels(method, route)}}} {seconds:.6f}')
+            lines.append("# HELP http_responses_total Responses by route and status.")
+            lines.append("# TYPE http_responses_total counter")
+            for (method, route, status), count in sorted(self.responses.items()):
+                lines.append(f'http_responses_total{{{_labels(method, route)},status="{status}"}} {count}')
+        for name, (help_text, kind, value) in (extra or {}).items():
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.append(f"{name} {value}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(method, route):
+    route = route.replace("\\", "\\\\").replace('"', '\\"')
+    return f'method="{method}",route="{route}"'
+
+
+def _histogram_lines(name, help_text, histograms):
+    lines = [f"# HELP {name} {help_text}", f"# TYPE {name} histogram"]
+    for (method, route), histogram in sorted(histograms.items()):
+        labels = _labels(method, route)
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.total}')
+        lines.append(f"{name}_sum{{{labels}}} {histogram.sum:.6f}")
+        lines.append(f"{name}_count{{{labels}}} {histogram.total}")
+    return lines
@@ -0,0 +1,41 @@
+"""Add indexes for hot foreign key and time columns
+
+Revision ID: 3c9e1f4a7b21
+Revises: fb97ff014d0d
+Create Date: 2026-10-18 10:12:41.208113
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '3c9e1f4a7b21'
+down_revision = 'fb97ff014d0d'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('poll', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_poll_created_at'), ['created_at'], unique=False)
+
+    with op.batch_alter_table('option', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_option_poll_id'), ['poll_id'], unique=False)
+
+    with op.batch_alter_table('vote', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_vote_option_id'), ['option_id'], unique=False)
+        batch_op.create_index('ix_vote_poll_id_timestamp', ['poll_id', 'timestamp'], unique=False)
+        batch_op.create_index('ix_vote_user_id_timestamp', ['user_id', 'timestamp'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('vote', schema=None) as batch_op:
+        batch_op.drop_index('ix_vote_user_id_timestamp')
+        batch_op.drop_index('ix_vote_poll_id_timestamp')
+        batch_op.drop_index(batch_op.f('ix_vote_option_id'))
+
+    with op.batch_alter_table('option', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_option_poll_id'))
+
+    with op.batch_alter_table('poll', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_poll_created_at'))
@@ -0,0 +1,43 @@
+"""Never reuse poll ids
+
+Revision ID: 4f8c2a6e9d13
+Revises: e7a3c9d5b182
+Create Date: 2026-10-19 09:12:44.503218
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4f8c2a6e9d13'
+down_revision = 'e7a3c9d5b182'
+branch_labels = None
+depends_on = None
+
+# reflection loses the WHERE of the partial indexes, so they're dropped and recreated
+PARTIAL_INDEXES = {
+    'ix_poll_open_created_at': (['created_at', 'id'], 'closed_at IS NULL'),
+    'ix_poll_open_opens_at': (['opens_at'], 'closed_at IS NULL AND opens_at IS NOT NULL'),
+    'ix_poll_open_closes_at': (['closes_at'], 'closed_at IS NULL AND closes_at IS NOT NULL'),
+    'ix_poll_deleted_at': (['deleted_at'], 'deleted_at IS NOT NULL'),
+}
+
+
+def _rebuild_poll(autoincrement):
+    # AUTOINCREMENT can only be set by rebuilding the table
+    for name in PARTIAL_INDEXES:
+        op.drop_index(name, table_name='poll')
+    with op.batch_alter_table('poll', schema=None, recreate='always',
+                              table_kwargs={'sqlite_autoincrement': autoincrement}):
+        pass
+    for name, (columns, where) in PARTIAL_INDEXES.items():
+        op.create_index(name, 'poll', columns, unique=False, sqlite_where=sa.text(where))
+
+
+def upgrade():
+    _rebuild_poll(True)
+
+
+def downgrade():
+    _rebuild_poll(False)
@@ -0,0 +1,28 @@
+"""Add checkpoint table for the vote journal
+
+Revision ID: 5e8b3d1c9a27
+Revises: a41f6b2d8e93
+Create Date: 2026-10-18 18:40:12.204511
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5e8b3d1c9a27'
+down_revision = 'a41f6b2d8e93'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('checkpoint',
+    sa.Column('name', sa.String(length=50), nullable=False),
+    sa.Column('value', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('name')
+    )
+
+
+def downgrade():
+    op.drop_table('checkpoint')
@@ -0,0 +1,46 @@
+"""Add vote_rollup table for vote timelines
+
+Revision ID: 7d2a9c5e4f10
+Revises: 3c9e1f4a7b21
+Create Date: 2026-10-18 14:03:27.551902
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '7d2a9c5e4f10'
+down_revision = '3c9e1f4a7b21'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # `flask init-db` on an existing database creates missing tables, this one included
+    if not sa.inspect(op.get_bind()).has_table('vote_rollup'):
+        op.create_table('vote_rollup',
+        sa.Column('poll_id', sa.Integer(), nullable=False),
+        sa.Column('resolution', sa.String(length=10), nullable=False),
+        sa.Column('bucket_start', sa.DateTime(), nullable=False),
+        sa.Column('option_id', sa.Integer(), nullable=False),
+        sa.Column('count', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['option_id'], ['option.id'], ),
+        sa.ForeignKeyConstraint(['poll_id'], ['poll.id'], ),
+        sa.PrimaryKeyConstraint('poll_id', 'resolution', 'bucket_start', 'option_id')
+        )
+
+    # rollups are derived data: rebuild them from the votes already cast,
+    # bucket starts in the format SQLAlchemy stores datetimes
+    op.execute("DELETE FROM vote_rollup")
+    for resolution, bucket in (('minute', '%Y-%m-%d %H:%M:00.000000'), ('hour', '%Y-%m-%d %H:00:00.000000')):
+        op.execute(
+            "INSERT INTO vote_rollup (poll_id, resolution, bucket_start, option_id, count) "
+            f"SELECT poll_id, '{resolution}', strftime('{bucket}', timestamp), option_id, count(*) "
+            "FROM vote WHERE timestamp IS NOT NULL "
+            f"GROUP BY poll_id, strftime('{bucket}', timestamp), option_id"
+        )
+
+
+def downgrade():
+    op.drop_table('vote_rollup')
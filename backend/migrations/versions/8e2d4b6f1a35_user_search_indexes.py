@@ -0,0 +1,26 @@
+"""Add lower() indexes for case-insensitive user search
+
+Revision ID: 8e2d4b6f1a35
+Revises: 4f8c2a6e9d13
+Create Date: 2026-10-19 11:03:27.815062
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8e2d4b6f1a35'
+down_revision = '4f8c2a6e9d13'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_user_username_lower', 'user', [sa.text('lower(username)')], unique=False)
+    op.create_index('ix_user_email_lower', 'user', [sa.text('lower(email)')], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_user_email_lower', table_name='user')
+    op.drop_index('ix_user_username_lower', table_name='user')
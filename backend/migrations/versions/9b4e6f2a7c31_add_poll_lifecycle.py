@@ -0,0 +1,66 @@
+"""Add poll open/close times, archived_vote and poll_snapshot
+
+Revision ID: 9b4e6f2a7c31
+Revises: c2f7a8e1d4b6
+Create Date: 2026-10-18 21:04:52.630517
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9b4e6f2a7c31'
+down_revision = 'c2f7a8e1d4b6'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('poll', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('opens_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('closes_at', sa.DateTime(), nullable=True))
+        batch_op.add_column(sa.Column('closed_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_poll_open_created_at', ['created_at', 'id'], unique=False,
+                              sqlite_where=sa.text('closed_at IS NULL'))
+        batch_op.create_index('ix_poll_open_opens_at', ['opens_at'], unique=False,
+                              sqlite_where=sa.text('closed_at IS NULL AND opens_at IS NOT NULL'))
+        batch_op.create_index('ix_poll_open_closes_at', ['closes_at'], unique=False,
+                              sqlite_where=sa.text('closed_at IS NULL AND closes_at IS NOT NULL'))
+
+    op.create_table('archived_vote',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('poll_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('option_id', sa.Integer(), nullable=False),
+    sa.Column('timestamp', sa.DateTime(), nullable=True),
+    sa.Column('is_multiple_choice', sa.Boolean(), nullable=False),
+    sa.ForeignKeyConstraint(['option_id'], ['option.id'], ),
+    sa.ForeignKeyConstraint(['poll_id'], ['poll.id'], ),
+    sa.ForeignKeyConstraint(['user_id'], ['user.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index('ix_archived_vote_poll_id_timestamp', 'archived_vote', ['poll_id', 'timestamp'], unique=False)
+    op.create_index('ix_archived_vote_user_id_timestamp', 'archived_vote', ['user_id', 'timestamp'], unique=False)
+    op.create_table('poll_snapshot',
+    sa.Column('poll_id', sa.Integer(), nullable=False),
+    sa.Column('question', sa.String(length=200), nullable=False),
+    sa.Column('closed_at', sa.DateTime(), nullable=False),
+    sa.Column('results', sa.Text(), nullable=False),
+    sa.ForeignKeyConstraint(['poll_id'], ['poll.id'], ),
+    sa.PrimaryKeyConstraint('poll_id')
+    )
+
+
+def downgrade():
+    op.drop_table('poll_snapshot')
+    op.drop_index('ix_archived_vote_user_id_timestamp', table_name='archived_vote')
+    op.drop_index('ix_archived_vote_poll_id_timestamp', table_name='archived_vote')
+    op.drop_table('archived_vote')
+    with op.batch_alter_table('poll', schema=None) as batch_op:
+        batch_op.drop_index('ix_poll_open_closes_at')
+        batch_op.drop_index('ix_poll_open_opens_at')
+        batch_op.drop_index('ix_poll_open_created_at')
+        batch_op.drop_column('closed_at')
+        batch_op.drop_column('closes_at')
+        batch_op.drop_column('opens_at')
@@ -0,0 +1,41 @@
+"""Allow several votes per user on multiple-choice polls
+
+Revision ID: a41f6b2d8e93
+Revises: 7d2a9c5e4f10
+Create Date: 2026-10-18 15:41:09.320518
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a41f6b2d8e93'
+down_revision = '7d2a9c5e4f10'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # one vote per (poll, user) becomes one per (poll, user, option), plus a
+    # partial unique index keeping single-choice polls at one vote per user
+    with op.batch_alter_table('vote', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('is_multiple_choice', sa.Boolean(), nullable=False, server_default=sa.false()))
+        batch_op.drop_constraint('unique_user_vote_per_poll', type_='unique')
+        batch_op.create_unique_constraint('unique_user_vote_per_option', ['poll_id', 'user_id', 'option_id'])
+
+    op.execute(
+        "UPDATE vote SET is_multiple_choice = 1 WHERE poll_id IN "
+        "(SELECT id FROM poll WHERE is_multiple_choice)"
+    )
+    op.create_index('unique_user_vote_per_poll', 'vote', ['poll_id', 'user_id'], unique=True,
+                    sqlite_where=sa.text('NOT is_multiple_choice'))
+
+
+def downgrade():
+    # fails if a user holds several votes on a poll; remove those first
+    op.drop_index('unique_user_vote_per_poll', table_name='vote')
+    with op.batch_alter_table('vote', schema=None) as batch_op:
+        batch_op.drop_constraint('unique_user_vote_per_option', type_='unique')
+        batch_op.create_unique_constraint('unique_user_vote_per_poll', ['poll_id', 'user_id'])
+        batch_op.drop_column('is_multiple_choice')
@@ -0,0 +1,34 @@
+"""Add poll_change log for the /changes feed
+
+Revision ID: c2f7a8e1d4b6
+Revises: 5e8b3d1c9a27
+Create Date: 2026-10-18 19:12:40.118203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c2f7a8e1d4b6'
+down_revision = '5e8b3d1c9a27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('poll_change',
+    sa.Column('poll_id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('poll_version', sa.Integer(), nullable=False),
+    sa.Column('deleted', sa.Boolean(), nullable=False),
+    sa.PrimaryKeyConstraint('poll_id')
+    )
+    op.create_index(op.f('ix_poll_change_version'), 'poll_change', ['version'], unique=False)
+    # existing polls start out as created, at versions that follow their ids
+    op.execute("INSERT INTO poll_change (poll_id, version, poll_version, deleted) SELECT id, id, id, 0 FROM poll")
+
+
+def downgrade():
+    op.drop_index(op.f('ix_poll_change_version'), table_name='poll_change')
+    op.drop_table('poll_change')
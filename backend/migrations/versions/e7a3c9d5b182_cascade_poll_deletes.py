@@ -0,0 +1,57 @@
+"""Cascade poll deletes in the database, add poll.deleted_at
+
+Revision ID: e7a3c9d5b182
+Revises: 9b4e6f2a7c31
+Create Date: 2026-10-18 22:31:07.284916
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e7a3c9d5b182'
+down_revision = '9b4e6f2a7c31'
+branch_labels = None
+depends_on = None
+
+# the existing foreign keys have no names; this names them so they can be replaced
+naming_convention = {"fk": "fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s"}
+
+# table -> columns pointing at poll / option
+CASCADES = {
+    'option': [('poll_id', 'poll')],
+    'vote': [('poll_id', 'poll'), ('option_id', 'option')],
+    'archived_vote': [('poll_id', 'poll'), ('option_id', 'option')],
+    'poll_snapshot': [('poll_id', 'poll')],
+    'vote_rollup': [('poll_id', 'poll'), ('option_id', 'option')],
+}
+
+
+def _set_ondelete(ondelete):
+    for table, columns in CASCADES.items():
+        with op.batch_alter_table(table, schema=None, naming_convention=naming_convention) as batch_op:
+            for column, referred in columns:
+                name = f"fk_{table}_{column}_{referred}"
+                batch_op.drop_constraint(name, type_='foreignkey')
+                batch_op.create_foreign_key(name, referred, [column], ['id'], ondelete=ondelete)
+
+
+def upgrade():
+    with op.batch_alter_table('poll', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('deleted_at', sa.DateTime(), nullable=True))
+        batch_op.create_index('ix_poll_deleted_at', ['deleted_at'], unique=False,
+                              sqlite_where=sa.text('deleted_at IS NOT NULL'))
+    _set_ondelete('CASCADE')
+    # deleting an option looks up its rows in these
+    op.create_index(op.f('ix_archived_vote_option_id'), 'archived_vote', ['option_id'], unique=False)
+    op.create_index('ix_vote_rollup_option_id', 'vote_rollup', ['option_id'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_vote_rollup_option_id', table_name='vote_rollup')
+    op.drop_index(op.f('ix_archived_vote_option_id'), table_name='archived_vote')
+    _set_ondelete(None)
+    with op.batch_alter_table('poll', schema=None) as batch_op:
+        batch_op.drop_index('ix_poll_deleted_at')
+        batch_op.drop_column('deleted_at')
@@ -1,6 +1,6 @@
 # models.py
 from datetime import datetime, timezone
-from app import db
+from extensions import db
 # User model
 class User(db.Model):
     id = db.Column(db.Integer, primary_key=True)  # unique user ID
@@ -10,6 +10,12 @@ class User(db.Model):
     is_admin = db.Column(db.Boolean, default=False) # true or false admin
     polls = db.relationship('Poll', backref='creator', lazy=True) # relationship to polls
 
+    __table_args__ = (
+        # case-insensitive prefix search on /admin/users
+        db.Index('ix_user_username_lower', db.func.lower(username)),
+        db.Index('ix_user_email_lower', db.func.lower(email)),
+    )
+
     def __repr__(self):
         return f'<User {self.email}>'
 
@@ -17,33 +23,117 @@ class User(db.Model):
 class Poll(db.Model):
     id = db.Column(db.Integer, primary_key=True)  # unique poll ID
     question = db.Column(db.String(200), nullable=False)  # required poll question
-    created_at = db.Column(db.DateTime, default=datetime.now(timezone.utc))  # date/time question is created
+    created_at = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc), index=True)  # date/time question is created, indexed for newest-first paging
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False) # foreign key to user
     is_multiple_choice = db.Column(db.Boolean, default=False) # flag if multiple choice
+    opens_at = db.Column(db.DateTime) # votes accepted from, UTC (none: straight away)
+    closes_at = db.Column(db.DateTime) # votes accepted until, UTC (none: never closes)
+    closed_at = db.Column(db.DateTime) # when the poll was closed and its votes archived
+    deleted_at = db.Column(db.DateTime) # deleted, rows still being removed in the background
+
+    __table_args__ = (
+        # the open-poll listing, and the scheduler's lookups, only index polls that can still change
+        db.Index('ix_poll_open_created_at', 'created_at', 'id', sqlite_where=db.text('closed_at IS NULL')),
+        db.Index('ix_poll_open_opens_at', 'opens_at', sqlite_where=db.text('closed_at IS NULL AND opens_at IS NOT NULL')),
+        db.Index('ix_poll_open_closes_at', 'closes_at', sqlite_where=db.text('closed_at IS NULL AND closes_at IS NOT NULL')),
+        db.Index('ix_poll_deleted_at', 'deleted_at', sqlite_where=db.text('deleted_at IS NOT NULL')),
+        # ids of deleted polls aren't handed out again, so nothing cached under one outlives its poll
+        {'sqlite_autoincrement': True},
+    )
 
     def __repr__(self):
         return f'<Poll {self.question}>'
 
-    # option relationship
-    options = db.relationship("Option", backref="poll", lazy=True, cascade="all, delete")
+    @staticmethod
+    def status_at(opens_at, closes_at, closed_at, now):
+        # "upcoming", "open" or "closed" at now (naive UTC)
+        if closed_at is not None or (closes_at is not None and closes_at <= now):
+            return "closed"
+        if opens_at is not None and opens_at > now:
+            return "upcoming"
+        return "open"
+
+    @classmethod
+    def open_at(cls, now):
+        # SQL condition for polls taking votes at now
+        return db.and_(
+            cls.closed_at.is_(None),
+            cls.deleted_at.is_(None),
+            db.or_(cls.opens_at.is_(None), cls.opens_at <= now),
+            db.or_(cls.closes_at.is_(None), cls.closes_at > now),
+        )
+
+    # option relationship; the database deletes them with the poll (ON DELETE CASCADE)
+    options = db.relationship("Option", backref="poll", lazy=True, cascade="all, delete", passive_deletes=True)
     # votes relationship
-    votes = db.relationship('Vote', backref='poll', lazy=True, cascade= "all, delete") 
+    votes = db.relationship('Vote', backref='poll', lazy=True, cascade="all, delete", passive_deletes=True)
 
 # Options model
 class Option(db.Model):
     id = db.Column(db.Integer, primary_key=True)  # unique option ID
     text = db.Column(db.String(200), nullable=False)  # text for the option
     votes = db.Column(db.Integer, default=0)  # Vote count
-    poll_id = db.Column(db.Integer, db.ForeignKey('poll.id'), nullable=False)  # Key for poll
+    poll_id = db.Column(db.Integer, db.ForeignKey('poll.id', ondelete='CASCADE'), nullable=False, index=True)  # Key for poll
 
 # Vote model
 class Vote(db.Model):
     id = db.Column(db.Integer, primary_key=True) # unique vote ID
-    poll_id = db.Column(db.Integer, db.ForeignKey('poll.id'), nullable=False) # poll key
+    poll_id = db.Column(db.Integer, db.ForeignKey('poll.id', ondelete='CASCADE'), nullable=False) # poll key
+    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False) # user key
+    option_id = db.Column(db.Integer, db.ForeignKey('option.id', ondelete='CASCADE'), nullable=False, index=True) # option key
+    timestamp = db.Column(db.DateTime, default=lambda: datetime.now(timezone.utc)) # when the vote was cast 
+    is_multiple_choice = db.Column(db.Boolean, nullable=False, default=False) # copied from the poll, for the unique index below
+
+    __table_args__ = (
+        db.UniqueConstraint('poll_id', 'user_id', 'option_id', name='unique_user_vote_per_option'), # each option at most once per user
+        db.Index('unique_user_vote_per_poll', 'poll_id', 'user_id', unique=True,
+                 sqlite_where=db.text('NOT is_multiple_choice')), # user can only vote once per single-choice poll
+        db.Index('ix_vote_poll_id_timestamp', 'poll_id', 'timestamp'), # a poll's votes, by time
+        db.Index('ix_vote_user_id_timestamp', 'user_id', 'timestamp'), # a user's votes, by time
+    )
+
+# votes of closed polls, moved out of the vote table when the poll is archived
+class ArchivedVote(db.Model):
+    id = db.Column(db.Integer, primary_key=True) # id the vote had in the vote table
+    poll_id = db.Column(db.Integer, db.ForeignKey('poll.id', ondelete='CASCADE'), nullable=False) # poll key
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False) # user key
-    option_id = db.Column(db.Integer, db.ForeignKey('option.id'), nullable=False) # option key
-    timestamp = db.Column(db.DateTime, default=datetime.now(timezone.utc)) # when the vote was cast 
+    option_id = db.Column(db.Integer, db.ForeignKey('option.id', ondelete='CASCADE'), nullable=False, index=True) # option key, indexed for the cascade
+    timestamp = db.Column(db.DateTime) # when the vote was cast
+    is_multiple_choice = db.Column(db.Boolean, nullable=False, default=False) # copied from the poll
+
+    __table_args__ = (
+        db.Index('ix_archived_vote_poll_id_timestamp', 'poll_id', 'timestamp'), # a poll's votes, by time
+        db.Index('ix_archived_vote_user_id_timestamp', 'user_id', 'timestamp'), # a user's votes, by time
+    )
+
+# final results of a closed poll, written once when it closes and never changed
+class PollSnapshot(db.Model):
+    poll_id = db.Column(db.Integer, db.ForeignKey('poll.id', ondelete='CASCADE'), primary_key=True) # poll key
+    question = db.Column(db.String(200), nullable=False) # question at close
+    closed_at = db.Column(db.DateTime, nullable=False) # when it closed, UTC
+    results = db.Column(db.Text, nullable=False) # JSON list of {"id", "option", "votes"}
+
+# per-option vote counts in minute and hour buckets, kept up to date as votes
+# are cast so timelines are read without scanning the vote table
+class VoteRollup(db.Model):
+    poll_id = db.Column(db.Integer, db.ForeignKey('poll.id', ondelete='CASCADE'), primary_key=True) # poll key
+    resolution = db.Column(db.String(10), primary_key=True) # "minute" or "hour"
+    bucket_start = db.Column(db.DateTime, primary_key=True) # start of the bucket, UTC
+    option_id = db.Column(db.Integer, db.ForeignKey('option.id', ondelete='CASCADE'), primary_key=True) # option key
+    count = db.Column(db.Integer, nullable=False, default=0) # votes cast in the bucket
 
     __table_args__ = (
-        db.UniqueConstraint('poll_id', 'user_id', name='unique_user_vote_per_poll'), # user can only vote once per poll
+        db.Index('ix_vote_rollup_option_id', 'option_id'), # so deleting an option doesn't scan every rollup
     )
+
+class Checkpoint(db.Model):
+    name = db.Column(db.String(50), primary_key=True) # what the position belongs to
+    value = db.Column(db.Integer, nullable=False, default=0) # how far it has got
+
+# change log for the /changes feed: one row per poll that was ever written,
+# stamped with a database-wide version on every change
+class PollChange(db.Model):
+    poll_id = db.Column(db.Integer, primary_key=True) # poll key, kept after the poll is deleted
+    version = db.Column(db.Integer, nullable=False, index=True) # last change of any kind
+    poll_version = db.Column(db.Integer, nullable=False) # last create or edit (tallies changed since otherwise)
+    deleted = db.Column(db.Boolean, nullable=False, default=False) # the poll was deleted at version
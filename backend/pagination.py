@@ -0,0 +1,41 @@
+# pagination.py
+# helpers for keyset (cursor) pagination and prefix search shared by the list endpoints
+import base64
+import json
+from datetime import datetime
+
+
+def page_size(args, default, maximum):
+    # read ?limit=, clamped to [1, maximum]; None if it isn't a number
+    try:
+        limit = int(args.get("limit", default))
+    except (TypeError, ValueError):
+        return None
+    return max(1, min(limit, maximum))
+
+
+def encode_cursor(*values):
+    # opaque url-safe token holding the sort key of the last row on a page
+    payload = json.dumps([v.isoformat() if isinstance(v, datetime) else v for v in values])
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, *types):
+    # inverse of encode_cursor, converting each value with the matching type; None if malformed
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        if not isinstance(values, list) or len(values) != len(types):
+            return None
+        return tuple(
+            datetime.fromisoformat(value) if kind is datetime else kind(value)
+            for value, kind in zip(values, types)
+        )
+    except (TypeError, ValueError):
+        return None
+
+
+def prefix_match(column, prefix):
+    # "starts with" as a range, so the column's index can be searched
+    # (LIKE 'x%' only uses an index under NOCASE or case_sensitive_like)
+    return column.between(prefix, prefix + "\U0010ffff")
@@ -0,0 +1,84 @@
+# passwords.py
+# password hashing and checking run in a bounded worker pool instead of on the
+# request worker. PASSWORD_HASH_METHOD is "bcrypt" (cost BCRYPT_LOG_ROUNDS) or
+# any werkzeug method such as "scrypt" or "pbkdf2:sha256:600000"
+import os
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from threading import Lock
+import bcrypt
+from werkzeug.security import generate_password_hash, check_password_hash
+
+
+# module level so they can be sent to a process pool
+def _hash(password, method, rounds):
+    if method == "bcrypt":
+        return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds)).decode()
+    return generate_password_hash(password, method=method)
+
+
+def _verify(stored, password):
+    if _is_bcrypt(stored):
+        return bcrypt.checkpw(password.encode(), stored.encode())
+    return check_password_hash(stored, password)
+
+
+def _is_bcrypt(stored):
+    return stored.startswith(("$2a$", "$2b$", "$2y$"))
+
+
+class PasswordHasher:
+    def __init__(self, app=None):
+        self.method = "scrypt"
+        self.rounds = 12
+        self.workers = os.cpu_count() or 1
+        self.executor = "thread"
+        self._pool = None
+        self._pool_lock = Lock()
+        self._werkzeug_prefixes = {}  # method -> full "method:params" it expands to
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.method = app.config.get("PASSWORD_HASH_METHOD", self.method)
+        self.rounds = app.config.get("BCRYPT_LOG_ROUNDS", self.rounds)
+        self.workers = app.config.get("PASSWORD_HASH_WORKERS") or self.workers
+        self.executor = app.config.get("PASSWORD_HASH_EXECUTOR", self.executor)
+        app.extensions["password_hasher"] = self
+
+    def _get_pool(self):
+        # created on first use so importing the app doesn't spawn workers
+        with self._pool_lock:
+            if self._pool is None:
+                pool_class = ProcessPoolExecutor if self.executor == "process" else ThreadPoolExecutor
+                self._pool = pool_class(max_workers=self.workers)
+            return self._pool
+
+    def hash(self, password):
+        return self._get_pool().submit(_hash, password, self.method, self.rounds).result()
+
+    def hash_many(self, passwords):
+        # spread a batch over every worker, results in input order
+        pool = self._get_pool()
+        futures = [pool.submit(_hash, password, self.method, self.rounds) for password in passwords]
+        return [future.result() for future in futures]
+
+    def verify(self, stored, password):
+        return self._get_pool().submit(_verify, stored, password).result()
+
+    def needs_rehash(self, stored):
+        # true when the stored hash was made with another method or cost
+        if self.method == "bcrypt":
+            if not _is_bcrypt(stored):
+                return True
+            return int(stored.split("$")[2]) != self.rounds
+        if _is_bcrypt(stored):
+            return True
+        return stored.split("$", 1)[0] != self._werkzeug_prefix(self.method)
+
+    def _werkzeug_prefix(self, method):
+        # werkzeug fills in default parameters ("scrypt" -> "scrypt:32768:8:1"),
+        # so hash once to learn what this method is stored as
+        if method not in self._werkzeug_prefixes:
+            sample = self._get_pool().submit(_hash, "", method, self.rounds).result()
+            self._werkzeug_prefixes[method] = sample.split("$", 1)[0]
+        return self._werkzeug_prefixes[method]
@@ -0,0 +1,81 @@
+# realtime.py
+# live results over Socket.IO: clients subscribe to a room per poll and receive
+# tally deltas, coalesced over a short window so a busy poll sends a bounded
+# number of messages no matter how many votes it takes
+from collections import defaultdict
+from threading import Lock
+from flask_socketio import join_room, leave_room
+
+
+def poll_room(poll_id):
+    return f"poll-{poll_id}"
+
+
+class TallyBroadcaster:
+    def __init__(self, app=None, socketio=None):
+        self.socketio = None
+        self.window = 0.25  # seconds
+        self._pending = defaultdict(lambda: defaultdict(int))  # poll id -> option id -> delta
+        self._lock = Lock()
+        self._flushing = False
+        self._run = 0  # bumped by clear, so a flush task started before it stops
+        if app is not None:
+            self.init_app(app, socketio)
+
+    def init_app(self, app, socketio):
+        self.socketio = socketio
+        self.window = app.config.get("LIVE_UPDATE_WINDOW", self.window)
+        self.clear()
+        app.extensions["tally_broadcaster"] = self
+
+        # added to the server socketio.init_app just created for this app
+        socketio.on_event("subscribe", self._subscribe)
+        socketio.on_event("unsubscribe", self._unsubscribe)
+
+    def _subscribe(self, data):
+        poll_id = (data or {}).get("poll_id")
+        if isinstance(poll_id, int):
+            join_room(poll_room(poll_id))
+
+    def _unsubscribe(self, data):
+        poll_id = (data or {}).get("poll_id")
+        if isinstance(poll_id, int):
+            leave_room(poll_room(poll_id))
+
+    def record(self, poll_id, option_id, count=1):
+        # queue a committed vote; the flush task is started on demand and stops when idle
+        with self._lock:
+            self._pending[poll_id][option_id] += count
+            if self._flushing:
+                return
+            self._flushing = True
+            run = self._run
+        self.socketio.start_background_task(self._flush_loop, run)
+
+    def announce(self, event, poll_id):
+        # edits and deletes are rare, send them straight away
+        self.socketio.emit(event, {"poll_id": poll_id}, to=poll_room(poll_id))
+
+    def clear(self):
+        # drop queued deltas; a running flush task stops when it next wakes, and
+        # the next vote starts a new one with a full window
+        with self._lock:
+            self._pending.clear()
+            self._flushing = False
+            self._run += 1
+
+    def _flush_loop(self, run):
+        while True:
+            self.socketio.sleep(self.window)
+            with self._lock:
+                if run != self._run:
+                    return
+                pending, self._pending = self._pending, defaultdict(lambda: defaultdict(int))
+                if not pending:
+                    self._flushing = False
+                    return
+            for poll_id, deltas in pending.items():
+                self.socketio.emit("tally_delta", {
+                    "poll_id": poll_id,
+                    "deltas": {str(option_id): count for option_id, count in deltas.items()}
+                }, to=poll_room(poll_id))
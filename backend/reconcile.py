@@ -0,0 +1,94 @@
+# reconcile.py
+# checks the denormalised Option.votes counters against the vote rows. Only polls
+# stamped in the change log since the last run are looked at: the run walks
+# poll_change above its high-water mark in batches, recounts each batch with
+# grouped queries over the option_id indexes of vote and archived_vote, and
+# repairs drifted counters in the same transaction that moves the mark
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, func, select, update
+from extensions import db
+from models import Option, Poll, Vote, ArchivedVote
+from changes import record_changes, changes_since, EDITED
+from checkpoints import load_checkpoint, save_checkpoint
+from voting import poll_changed
+
+CHECKPOINT = "tally_reconcile"  # poll_change version checked through
+
+option_table = Option.__table__
+
+
+def reconcile(batch_size=None, full=False):
+    # returns a report: how far it got, how many polls were checked and each
+    # counter it corrected
+    batch_size = batch_size or current_app.config["RECONCILE_BATCH_SIZE"]
+    version = 0 if full else load_checkpoint(CHECKPOINT)
+    report = {"checked_polls": 0, "corrections": []}
+    has_more = True
+    while has_more:
+        rows, has_more = changes_since(version, batch_size)
+        if not rows:
+            break
+        poll_ids = [row.poll_id for row in rows if not row.deleted]
+        corrections = _repair(poll_ids) if poll_ids else []
+        version = rows[-1].version
+        save_checkpoint(CHECKPOINT, version)
+        db.session.commit()
+
+        repaired = sorted({correction["poll_id"] for correction in corrections})
+        for poll_id in repaired:
+            poll_changed(poll_id, "poll_updated")
+        for correction in corrections:
+            current_app.logger.warning(
+                "tally drift on poll %(poll_id)s option %(option_id)s: %(was)s, recounted %(votes)s", correction
+            )
+        report["checked_polls"] += len(poll_ids)
+        report["corrections"].extend(corrections)
+    report["version"] = version
+    return report
+
+
+def _repair(poll_ids):
+    # drifted counters of the given polls, fixed without committing
+    options = select(Option.id).join(Poll, Poll.id == Option.poll_id).where(
+        Option.poll_id.in_(poll_ids), Poll.deleted_at.is_(None)
+    )
+    counters = db.session.execute(select(Option.id, Option.poll_id, Option.votes).where(Option.id.in_(options))).all()
+    counts = {}
+    for table in (Vote, ArchivedVote):
+        for option_id, count in db.session.execute(
+            select(table.option_id, func.count()).where(table.option_id.in_(options)).group_by(table.option_id)
+        ):
+            counts[option_id] = counts.get(option_id, 0) + count
+    drifted = [
+        {"poll_id": poll_id, "option_id": option_id, "was": votes, "votes": counts.get(option_id, 0)}
+        for option_id, poll_id, votes in counters if (votes or 0) != counts.get(option_id, 0)
+    ]
+    if not drifted:
+        return []
+    # a vote committed between the reads above shows up as drift that isn't
+    # there, so a counter is only replaced if it still holds the value read.
+    # Drift is rare, so one statement per counter is fine and says which ones changed
+    guarded = update(option_table).where(
+        option_table.c.id == bindparam("option_key"), option_table.c.votes.is_(bindparam("was"))
+    ).values(votes=bindparam("count"))
+    drifted = [row for row in drifted if db.session.execute(
+        guarded, {"option_key": row["option_id"], "was": row["was"], "count": row["votes"]}
+    ).rowcount == 1]
+    # the whole poll is resent on /changes, tallies included
+    record_changes({row["poll_id"] for row in drifted}, EDITED)
+    return drifted
+
+
+# flask tallies reconcile
+tallies_cli = AppGroup("tallies", help="Vote counter maintenance.")
+
+
+@tallies_cli.command("reconcile", help="Recount the votes of polls changed since the last run and fix drifted counters.")
+@click.option("--full", is_flag=True, help="Check every poll, not just the ones changed since the last run.")
+def reconcile_command(full):
+    report = reconcile(full=full)
+    for correction in report["corrections"]:
+        click.echo(f"poll {correction['poll_id']} option {correction['option_id']}: {correction['was']} -> {correction['votes']}")
+    click.echo(f"checked {report['checked_polls']} polls, corrected {len(report['corrections'])} counters")
@@ -0,0 +1,64 @@
+# rollups.py
+# vote timelines from pre-aggregated buckets. Every vote write adds to its
+# minute and hour bucket in the same transaction (an upsert per bucket), so a
+# timeline read costs one row per non-empty bucket however many votes there are
+from collections import Counter
+from datetime import timedelta, timezone
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from extensions import db
+from models import VoteRollup
+
+RESOLUTIONS = {
+    "minute": timedelta(minutes=1),
+    "hour": timedelta(hours=1),
+}
+
+
+def bucket_start(timestamp, resolution):
+    # naive UTC start of the bucket holding timestamp
+    if timestamp.tzinfo is not None:
+        timestamp = timestamp.astimezone(timezone.utc).replace(tzinfo=None)
+    if resolution == "hour":
+        return timestamp.replace(minute=0, second=0, microsecond=0)
+    return timestamp.replace(second=0, microsecond=0)
+
+
+def record_votes(votes):
+    # votes is an iterable of (poll id, option id, timestamp); adds them to their
+    # buckets in the current transaction, the caller commits
+    counts = Counter()
+    for poll_id, option_id, timestamp in votes:
+        for resolution in RESOLUTIONS:
+            counts[(poll_id, resolution, bucket_start(timestamp, resolution), option_id)] += 1
+    if not counts:
+        return
+    statement = insert(VoteRollup)
+    db.session.execute(
+        statement.on_conflict_do_update(
+            index_elements=["poll_id", "resolution", "bucket_start", "option_id"],
+            set_={"count": VoteRollup.count + statement.excluded["count"]}
+        ),
+        [
+            {"poll_id": poll_id, "resolution": resolution, "bucket_start": start, "option_id": option_id, "count": count}
+            for (poll_id, resolution, start, option_id), count in counts.items()
+        ]
+    )
+
+
+def timeline(poll_id, resolution, since, until):
+    # [(bucket start, {option id: count})] for non-empty buckets in [since, until), oldest first
+    rows = db.session.execute(
+        select(VoteRollup.bucket_start, VoteRollup.option_id, VoteRollup.count).where(
+            VoteRollup.poll_id == poll_id,
+            VoteRollup.resolution == resolution,
+            VoteRollup.bucket_start >= bucket_start(since, resolution),
+            VoteRollup.bucket_start < until,
+        ).order_by(VoteRollup.bucket_start, VoteRollup.option_id)
+    )
+    buckets = []
+    for start, option_id, count in rows:
+        if not buckets or buckets[-1][0] != start:
+            buckets.append((start, {}))
+        buckets[-1][1][option_id] = count
+    return buckets
@@ -1,13 +1,98 @@
-from app import app, db
-from models import User, Poll, Option, Vote
-from flask import request, jsonify 
+from extensions import db, tally_cache, password_hasher, data_versions, metrics
+from models import User, Poll, Option, Vote, ArchivedVote, PollSnapshot, PollChange
+from flask import Blueprint, current_app, request, jsonify, Response
 from flask_cors import cross_origin
-from flask_jwt_extended import create_access_token, jwt_required, get_jwt_identity
-from werkzeug.security import generate_password_hash, check_password_hash
-
+from flask_jwt_extended import create_access_token, jwt_required
+from sqlalchemy import func, insert, literal, or_, select, tuple_, update
+from sqlalchemy.exc import IntegrityError
+from datetime import datetime, timezone
+import hashlib
+from pagination import page_size, encode_cursor, decode_cursor, prefix_match
+from voting import cast_votes, votes_committed, poll_changed, POLL_NOT_OPEN
+from auth import current_user
+from export import vote_rows, encode_csv, encode_ndjson
+from importer import parse_rows, import_users, import_polls, ImportFileError
+from rollups import RESOLUTIONS, record_votes, timeline
+from journal import blocking_votes, current_journal, JournalError
+from changes import record_changes, current_version, changes_since, EDITED
+from lifecycle import utcnow, close_poll, snapshot_payload, remove_poll
+
+# every endpoint, registered on the app by create_app
+api = Blueprint("api", __name__)
+
+# conditional GETs: 304 when the client already has this version, otherwise
+# the body encoded for this version if there is one (None means build it)
+def cached_response(etag, key):
+    if request.if_none_match.contains(etag):
+        return versioned_response(b"", etag, 304)
+    body = data_versions.get_body(key)
+    return versioned_response(body, etag) if body is not None else None
+
+def versioned_response(body, etag, status=200):
+    response = current_app.response_class(body, status=status, mimetype="application/json")
+    response.set_etag(etag)
+    # revalidate every time, which the ETag makes cheap
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+def snapshot_response(body):
+    # frozen results: the ETag is the content, so revalidating is a 304 for good.
+    # Not immutable, the poll can still be deleted
+    etag = "snap-" + hashlib.sha1(body).hexdigest()
+    if request.if_none_match.contains(etag):
+        body, status = b"", 304
+    else:
+        status = 200
+    response = current_app.response_class(body, status=status, mimetype="application/json")
+    response.set_etag(etag)
+    response.headers["Cache-Control"] = "private, no-cache"
+    return response
+
+def cache_body(key, payload):
+    body = current_app.json.dumps(payload).encode()
+    data_versions.put_body(key, body)
+    return body
+
+def is_id(value):
+    # a JSON integer; bool is an int subclass, so true/false don't count
+    return isinstance(value, int) and not isinstance(value, bool)
+
+def parse_timestamp(value):
+    # ISO timestamp as naive UTC, the way timestamps are stored; ValueError if invalid
+    if not isinstance(value, str):
+        raise ValueError(value)
+    value = datetime.fromisoformat(value)
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+def time_bounds(args, names=("since", "until")):
+    # optional timestamps from a query string or JSON body; returns (bounds, error message)
+    bounds = {}
+    for name in names:
+        value = args.get(name)
+        if value:
+            try:
+                bounds[name] = parse_timestamp(value)
+            except ValueError:
+                return None, f"Invalid {name} timestamp"
+    return bounds, None
+
+def find_poll(poll_id):
+    # None for a poll that doesn't exist or is still being deleted
+    poll = db.session.get(Poll, poll_id)
+    return poll if poll is not None and poll.deleted_at is None else None
+
+def poll_times(poll):
+    # open/close fields shared by the poll listings
+    return {
+        "opens_at": poll.opens_at.isoformat() if poll.opens_at else None,
+        "closes_at": poll.closes_at.isoformat() if poll.closes_at else None,
+        "closed_at": poll.closed_at.isoformat() if poll.closed_at else None,
+    }
 
 # registration 
-@app.route("/register", methods=["POST"])
+@api.route("/register", methods=["POST"])
 def register():
     data = request.get_json() # sends user data with request
 
@@ -25,8 +110,8 @@ def register():
     if existing_user:
         return jsonify({"msg": "Email already in use"}), 400
     
-    # hash password
-    hashed_password = generate_password_hash(password)
+    # hash password (in the hashing pool)
+    hashed_password = password_hasher.hash(password)
 
     # passes all checks, create new user object
     new_user = User(username=username, email=email, password=hashed_password)
@@ -36,7 +121,7 @@ def register():
     return jsonify({"msg": "User created successfully"}), 201
 
 # login 
-@app.route("/login", methods=["POST"])
+@api.route("/login", methods=["POST"])
 def login():
     data = request.get_json()
     # extract data
@@ -54,22 +139,37 @@ def login():
         return jsonify({"msg":"Invalid email"}), 401
     
     #verify password
-    if not check_password_hash(user.password, password):
+    if not password_hasher.verify(user.password, password):
         return jsonify({"msg": "Invalid password"}), 401
 
+    # upgrade the stored hash if the hashing method or cost has changed
+    if password_hasher.needs_rehash(user.password):
+        user.password = password_hasher.hash(password)
+        db.session.commit()
+
     # creates Json web token if email and password are valid
     access_token = create_access_token(identity=user.email)
     # success, return JWT
     return jsonify({"msg": "Login successful", "access_token": access_token, "is_admin": user.is_admin}), 200
 
+def poll_window(data, opens_at=None, closes_at=None):
+    # opens_at / closes_at from a create or edit body, over the current values;
+    # returns (columns to set, error message)
+    times, error = time_bounds(data, ("opens_at", "closes_at"))
+    if error:
+        return None, error
+    opens_at, closes_at = times.get("opens_at", opens_at), times.get("closes_at", closes_at)
+    if opens_at and closes_at and closes_at <= opens_at:
+        return None, "closes_at must be after opens_at"
+    if "closes_at" in times and closes_at <= utcnow():
+        return None, "closes_at must be in the future"
+    return times, None
+
 # create poll 
-@app.route('/create-poll', methods=['POST'])
+@api.route('/create-poll', methods=['POST'])
 @jwt_required()
 def create_poll():
-    current_user_email = get_jwt_identity()
-
-    # user from database
-    user = User.query.filter_by(email=current_user_email).first()
+    user = current_user()
 
     # If not admin cannot create
     if not user or not user.is_admin:
@@ -82,196 +182,738 @@ def create_poll():
 
     if not question or not options or not isinstance(options, list) or len(options) < 2:
         return jsonify({"msg":"Missing required fields: question and options."}), 400
-
-    # poll object
+    # a real boolean, so "false" doesn't make a multiple-choice poll
+    is_multiple_choice = data.get('is_multiple_choice', False)
+    if not isinstance(is_multiple_choice, bool):
+        return jsonify({"msg": "is_multiple_choice must be true or false"}), 400
+    # optional opens_at / closes_at
+    times, error = poll_window(data)
+    if error:
+        return jsonify({"msg": error}), 400
+
+    # save poll, then all options in one executemany
     new_poll = Poll(
         question=question,
-        user_id=user.id
+        user_id=user.id,
+        is_multiple_choice=is_multiple_choice,
+        **times
     )
-
-    # save poll to db
     db.session.add(new_poll)
-    db.session.commit()
-
-    # add options
-    created_options = []
-    for option_text in options:
-        option = Option(text=option_text, poll_id=new_poll.id)
-        db.session.add(option)
-        created_options.append({
-            "id": option.id,  # Include the option ID in the response
-            "text": option.text
-        })
-
+    db.session.flush()
+    db.session.execute(insert(Option), [{"text": option_text, "poll_id": new_poll.id} for option_text in options])
+    created_options = [{
+        "id": option.id,  # Include the option ID in the response
+        "text": option.text
+    } for option in db.session.query(Option.id, Option.text).filter_by(poll_id=new_poll.id).order_by(Option.id)]
+    record_changes([new_poll.id], EDITED)
+    response = {
+        "id": new_poll.id,
+        "question": new_poll.question,
+        "created_at": new_poll.created_at,
+        "user_id": new_poll.user_id,
+        "is_multiple_choice": new_poll.is_multiple_choice,
+        **poll_times(new_poll),
+        "options": created_options  # Return both ID and text for each option
+    }
     db.session.commit()
 
     # success response
     return jsonify({
         "msg": "Poll created successfully",
-        "poll": {
-            "id": new_poll.id,
-            "question": new_poll.question,
-            "created_at": new_poll.created_at,
-            "user_id": new_poll.user_id,
-            "options": created_options  # Return both ID and text for each option
-        }
+        "poll": response
     }), 201
 
 # vote
-@app.route("/vote/<int:poll_id>", methods=["POST"])
+@api.route("/vote/<int:poll_id>", methods=["POST"])
 @jwt_required()
 def vote(poll_id):
-    user_email = get_jwt_identity()
-    user = User.query.filter_by(email=user_email).first()
+    user = current_user()
     if not user:
         return {"msg": "User not found"}, 404
+    user_id = user.id
+
+    # one option, or several at once on a multiple-choice poll
+    data = request.get_json() or {}
+    option_ids = data.get("optionIds", [data.get("optionId")])
+    if not isinstance(option_ids, list) or not option_ids or not all(is_id(option_id) for option_id in option_ids):
+        return {"msg": "Invalid option"}, 400
+    option_ids = sorted(set(option_ids))
+
+    now = datetime.now(timezone.utc)
+    is_multiple_choice = func.coalesce(Poll.is_multiple_choice, False)
+    journal = current_journal()
+    if journal is not None:
+        # journal mode: check the options now, the compactor writes the votes later
+        poll = journal.poll(poll_id)
+        if (poll is None or not poll.option_ids.issuperset(option_ids)
+                or (len(option_ids) > 1 and not poll.is_multiple_choice)
+                or Poll.status_at(poll.opens_at, poll.closes_at, poll.closed_at, utcnow()) != "open"):
+            return vote_rejected(poll_id, option_ids)
+        multiple = poll.is_multiple_choice
+        rows = [{
+            "poll_id": poll_id, "user_id": user_id, "option_id": option_id,
+            "timestamp": now, "is_multiple_choice": multiple
+        } for option_id in option_ids]
+        try:
+            accepted = journal.append(rows, {poll_id: poll.epoch}, all_or_nothing=True)
+        except JournalError:
+            return {"msg": "Vote could not be saved, please retry"}, 503
+        if None in accepted:
+            # the poll was closed, edited or deleted after it was checked
+            return {"msg": "Poll changed, please retry"}, 409
+        if not all(accepted):
+            return already_voted(len(option_ids) > 1 or multiple)
+        return {"msg": "Vote accepted"}, 202
+
+    # insert the votes only if every option belongs to this poll and the poll
+    # takes that many; repeats are rejected by the unique_user_vote_per_poll
+    # index (single choice) or the unique_user_vote_per_option constraint
+    selection = select(
+        Option.poll_id,
+        literal(user_id),
+        Option.id,
+        literal(now, db.DateTime),
+        is_multiple_choice
+    ).join(Poll, Poll.id == Option.poll_id).where(
+        Option.id.in_(option_ids), Option.poll_id == poll_id, Poll.open_at(now)
+    )
+    if len(option_ids) > 1:
+        selection = selection.where(is_multiple_choice)
+    insert_vote = insert(Vote).from_select(
+        ["poll_id", "user_id", "option_id", "timestamp", "is_multiple_choice"], selection
+    )
+    try:
+        if db.session.execute(insert_vote).rowcount != len(option_ids):
+            db.session.rollback()
+            return vote_rejected(poll_id, option_ids)
+
+        # increment in SQL so concurrent votes can't overwrite each other's count
+        db.session.execute(
+            update(Option).where(Option.id.in_(option_ids)).values(votes=Option.votes + 1)
+        )
+        record_votes([(poll_id, option_id, now) for option_id in option_ids])
+        record_changes([poll_id])
+        db.session.commit()
+    except IntegrityError:
+        db.session.rollback()
+        return already_voted(
+            len(option_ids) > 1 or db.session.scalar(select(Poll.is_multiple_choice).where(Poll.id == poll_id))
+        )
+
+    votes_committed({(poll_id, option_id): 1 for option_id in option_ids})
 
-    data = request.get_json()
-    option_id = data.get("optionId")
+    return {"msg": "Vote cast successfully"}, 201
 
-    poll = Poll.query.get(poll_id)
-    if not poll:
+def vote_rejected(poll_id, option_ids):
+    # only the error path pays for telling the cases apart
+    poll = find_poll(poll_id)
+    if poll is None:
         return {"msg": "Poll not found"}, 404
+    status = Poll.status_at(poll.opens_at, poll.closes_at, poll.closed_at, utcnow())
+    if status in POLL_NOT_OPEN:
+        code, msg = POLL_NOT_OPEN[status]
+        return {"msg": msg}, code
+    if len(option_ids) > 1 and not poll.is_multiple_choice:
+        return {"msg": "This poll accepts only one option"}, 400
+    return {"msg": "Option not found for this poll"}, 404
+
+def already_voted(multiple):
+    if multiple:
+        return {"msg": "User has already voted for one of these options"}, 400
+    return {"msg": "User has already voted on this poll"}, 400
+
+# batch vote, for kiosks and imports
+@api.route("/vote/batch", methods=["POST"])
+@jwt_required()
+def vote_batch():
+    user = current_user()
+    if not user:
+        return {"msg": "User not found"}, 404
 
-    option = Option.query.filter_by(id=option_id, poll_id=poll_id).first()
-    if not option:
-        return {"msg": "Option not found for this poll"}, 404
-
-    # Ensure the user has not already voted on this poll
-    existing_vote = Vote.query.filter_by(poll_id=poll_id, user_id=user.id).first()
-    if existing_vote:
-        return {"msg": "User has already voted on this poll"}, 400
+    data = request.get_json() or {}
+    votes = data.get("votes")
+    if not isinstance(votes, list) or not votes:
+        return {"msg": "Missing required fields: votes."}, 400
+    if len(votes) > current_app.config["VOTE_BATCH_MAX"]:
+        return {"msg": "Too many votes in batch"}, 400
+
+    # voting on behalf of other users is admin only
+    on_behalf = any(isinstance(item, dict) and "userId" in item for item in votes)
+    if on_behalf and not user.is_admin:
+        return {"msg": "Unauthorized"}, 403
+
+    # malformed items are answered here, the rest are validated together
+    results = [(400, "Invalid vote")] * len(votes)
+    indexes = []
+    selections = []
+    for index, item in enumerate(votes):
+        if not isinstance(item, dict):
+            continue
+        ids = (item.get("userId") if on_behalf else user.id, item.get("pollId"), item.get("optionId"))
+        if all(is_id(value) for value in ids):
+            indexes.append(index)
+            selections.append(ids)
+    if selections:
+        try:
+            cast = cast_votes(selections, check_users=on_behalf, journal=current_journal())
+        except JournalError:
+            return {"msg": "Votes could not be saved, please retry"}, 503
+        for index, result in zip(indexes, cast):
+            results[index] = result
 
-    # Create a new vote
-    vote = Vote(poll_id=poll_id, user_id=user.id, option_id=option_id)
-    option.votes += 1  # Increment the vote count for the option
-    db.session.add(vote)
-    db.session.commit()
-
-    return {"msg": "Vote cast successfully"}, 201
+    return jsonify({
+        "accepted": sum(1 for status, _ in results if status in (201, 202)),
+        "results": [
+            {"index": index, "status": status, "msg": msg}
+            for index, (status, msg) in enumerate(results)
+        ]
+    }), 200
 
-@app.route('/polls', methods=["GET"])
+# /polls?status= filters; polls past closes_at count as closed before the scheduler archives them
+POLL_STATUSES = {
+    "open": Poll.open_at,
+    "upcoming": lambda now: db.and_(Poll.closed_at.is_(None), Poll.opens_at > now),
+    "closed": lambda now: db.or_(Poll.closed_at.is_not(None), Poll.closes_at <= now),
+    "all": lambda now: None,
+}
+
+def listing_etag(now):
+    # the change log's version, shared by every worker, plus the soonest opens_at
+    # or closes_at after now (off the partial indexes), in one query
+    pending = Poll.closed_at.is_(None), Poll.deleted_at.is_(None)
+    version, *times = db.session.execute(select(
+        select(func.coalesce(func.max(PollChange.version), 0)).scalar_subquery(),
+        select(func.min(Poll.opens_at)).where(*pending, Poll.opens_at > now).scalar_subquery(),
+        select(func.min(Poll.closes_at)).where(*pending, Poll.closes_at > now).scalar_subquery(),
+    )).one()
+    times = [time for time in times if time is not None]
+    return f"g{version}-{min(times).isoformat() if times else 'none'}"
+
+@api.route('/polls', methods=["GET"])
 @jwt_required()
 def get_polls():
-    identity = get_jwt_identity()
-    current_user = User.query.filter_by(email=identity).first()
+    limit = page_size(request.args, current_app.config["POLLS_PAGE_SIZE"], current_app.config["POLLS_MAX_PAGE_SIZE"])
+    if limit is None:
+        return jsonify({"msg": "Invalid limit"}), 400
+
+    # open (the default), upcoming, closed or all
+    status = request.args.get("status", "open")
+    if status not in POLL_STATUSES:
+        return jsonify({"msg": "Status must be open, upcoming, closed or all"}), 400
+
+    # newest first, keyset on (created_at, id) so every page costs the same;
+    # open polls come off the ix_poll_open_created_at partial index
+    query = db.session.query(
+        Poll.id, Poll.question, Poll.created_at, Poll.is_multiple_choice, Poll.opens_at, Poll.closes_at, Poll.closed_at,
+        func.coalesce(PollChange.version, 0).label("version")
+    ).outerjoin(PollChange, PollChange.poll_id == Poll.id).order_by(Poll.created_at.desc(), Poll.id.desc())
+    query = query.filter(Poll.deleted_at.is_(None))
+    now = utcnow()
+    condition = POLL_STATUSES[status](now)
+    if condition is not None:
+        query = query.filter(condition)
+    cursor = request.args.get("cursor")
+    if cursor:
+        position = decode_cursor(cursor, datetime, int)
+        if position is None:
+            return jsonify({"msg": "Invalid cursor"}), 400
+        query = query.filter(tuple_(Poll.created_at, Poll.id) < position)
+
+    # any poll change moves the change log on; a poll opening or closing on
+    # time changes no data, so the next time one does is part of the tag too
+    etag = listing_etag(now)
+    key = ("polls", etag, status, limit, cursor)
+    response = cached_response(etag, key)
+    if response is not None:
+        return response
+
+    # fetch one extra row to know if there is a next page
+    polls = query.limit(limit + 1).all()
+    has_more = len(polls) > limit
+    polls = polls[:limit]
+
+    # tallies cached at each poll's version (read above, before the counts),
+    # misses for the whole page in a single query. Closed polls stay out of the
+    # cache: their results are served from snapshots
+    versions = {poll.id: poll.version for poll in polls}
+    tallies = tally_cache.get_many({poll.id: poll.version for poll in polls if poll.closed_at is None})
+    missing = {poll.id: poll.question for poll in polls if poll.id not in tallies}
+    closed = {poll.id for poll in polls if poll.closed_at is not None}
+    if missing:
+        # the question and counts together, so an edit can't pair one with the other
+        questions = dict(missing)
+        options_by_poll = {poll_id: [] for poll_id in missing}
+        options = db.session.query(Option.id, Option.text, Option.votes, Option.poll_id, Poll.question).join(
+            Poll, Poll.id == Option.poll_id
+        ).filter(Option.poll_id.in_(missing)).order_by(Option.id)
+        for option in options:
+            options_by_poll[option.poll_id].append(option)
+            questions[option.poll_id] = option.question
+        for poll_id, options in options_by_poll.items():
+            if poll_id in closed:
+                tallies[poll_id] = (questions[poll_id], [tuple(option[:3]) for option in options])
+            else:
+                tallies[poll_id] = tally_cache.put(poll_id, versions[poll_id], questions[poll_id], options)
+
+    results = [{
+        "id": poll.id,
+        "question": poll.question,
+        "is_multiple_choice": bool(poll.is_multiple_choice),
+        **poll_times(poll),
+        "options": [
+            {"id": option_id, "text": text, "votes": votes}
+            for option_id, text, votes in tallies[poll.id][1]
+        ]
+    } for poll in polls]
+    next_cursor = encode_cursor(polls[-1].created_at, polls[-1].id) if has_more else None
+    return versioned_response(cache_body(key, {"polls": results, "next_cursor": next_cursor}), etag)
+
+# what changed since a version token: polls created or edited (in full),
+# polls whose tallies moved (option counts only) and deleted poll ids
+@api.route('/changes', methods=["GET"])
+@jwt_required()
+def get_changes():
+    token = request.args.get("since")
+    if not token:
+        # where to start: take the token before loading /polls, so nothing is missed
+        return jsonify({"polls": [], "tallies": [], "deleted": [], "token": encode_cursor(current_version()), "has_more": False})
+    since = decode_cursor(token, int)
+    if since is None:
+        return jsonify({"msg": "Invalid token"}), 400
+    since = since[0]
+    limit = page_size(request.args, current_app.config["CHANGES_PAGE_SIZE"], current_app.config["CHANGES_MAX_PAGE_SIZE"])
+    if limit is None:
+        return jsonify({"msg": "Invalid limit"}), 400
+
+    rows, has_more = changes_since(since, limit)
+    deleted = [row.poll_id for row in rows if row.deleted]
+    edited = [row.poll_id for row in rows if not row.deleted and row.poll_version > since]
+    tallied = [row.poll_id for row in rows if not row.deleted and row.poll_version <= since]
+
+    polls = db.session.query(
+        Poll.id, Poll.question, Poll.is_multiple_choice, Poll.opens_at, Poll.closes_at, Poll.closed_at
+    ).filter(Poll.id.in_(edited)).all() if edited else []
+    options_by_poll = {poll_id: [] for poll_id in edited + tallied}
+    if options_by_poll:
+        for option in db.session.query(Option.id, Option.text, Option.votes, Option.poll_id).filter(
+            Option.poll_id.in_(options_by_poll)
+        ).order_by(Option.id):
+            options_by_poll[option.poll_id].append(option)
 
-    polls = Poll.query.all()
-    results = []
-    for poll in polls:
-        poll_data = {
+    return jsonify({
+        "polls": [{
             "id": poll.id,
             "question": poll.question,
-            "options": []
-        }
-        for option in poll.options:
-            poll_data["options"].append({
-                "id": option.id,
-                "text": option.text,
-                "votes": option.votes
-            })
-        results.append(poll_data)
-    return jsonify(results), 200
+            "is_multiple_choice": bool(poll.is_multiple_choice),
+            **poll_times(poll),
+            "options": [
+                {"id": option.id, "text": option.text, "votes": option.votes}
+                for option in options_by_poll[poll.id]
+            ]
+        } for poll in polls],
+        "tallies": [{
+            "id": poll_id,
+            "options": [{"id": option.id, "votes": option.votes} for option in options_by_poll[poll_id]]
+        } for poll_id in tallied],
+        "deleted": deleted,
+        "token": encode_cursor(rows[-1].version) if rows else token,
+        "has_more": has_more
+    }), 200
 
 # edit poll
-@app.route('/edit-poll/<int:poll_id>', methods=['PATCH'])
+@api.route('/edit-poll/<int:poll_id>', methods=['PATCH'])
 @jwt_required()
 def edit_poll(poll_id):
     # admin user
-    current_user_email = get_jwt_identity()
-    user = User.query.filter_by(email=current_user_email).first()
+    user = current_user()
 
     if not user or not user.is_admin:
         return jsonify({"msg": "Unauthorized"}), 403
     
     # fetch poll
-    poll = Poll.query.get(poll_id)
+    poll = find_poll(poll_id)
     if not poll:
         return jsonify({"msg": "Poll not found"}), 404
     
-    # check if votes have been cast
-    if Vote.query.filter_by(poll_id=poll.id).first():
-        return jsonify({"msg": "Cannot edit poll after votes have been cast"}), 400
-    
-    # update poll
-    data = request.json
-    question = data.get("question")
-    options = data.get("options")
-    
-    if question:
-        poll.question = question
-    if options: 
-        # clear and add new options
-        Option.query.filter_by(poll_id=poll.id).delete()
-        for option_text in options:
-            new_option = Option(text=option_text, poll_id=poll.id)
-            db.session.add(new_option)
-
-    db.session.commit()
+    # no votes are taken until the edit is in
+    with blocking_votes(poll_id):
+        # a no-op update takes the write lock first, so the scheduler can't close
+        # the poll under the edit; it matches nothing if that already happened.
+        # A closed poll's votes are archived, but it stays as it closed
+        claimed = db.session.execute(update(Poll).where(
+            Poll.id == poll_id, Poll.closed_at.is_(None), Poll.deleted_at.is_(None)
+        ).values(question=Poll.question).returning(Poll.opens_at, Poll.closes_at)).first()
+        if claimed is None:
+            db.session.rollback()
+            if find_poll(poll_id) is None:
+                return jsonify({"msg": "Poll not found"}), 404
+            return jsonify({"msg": "Poll is closed"}), 400
+
+        # check if votes have been cast, including any still in the journal
+        # or already archived
+        voted = db.session.execute(select(
+            select(Vote.id).where(Vote.poll_id == poll_id).exists()
+            | select(ArchivedVote.id).where(ArchivedVote.poll_id == poll_id).exists()
+        )).scalar()
+        if voted:
+            db.session.rollback()
+            return jsonify({"msg": "Cannot edit poll after votes have been cast"}), 400
+
+        # update poll
+        data = request.json
+        question = data.get("question")
+        options = data.get("options")
+        times, error = poll_window(data, *claimed)
+        if error:
+            db.session.rollback()
+            return jsonify({"msg": error}), 400
+        for name, value in times.items():
+            setattr(poll, name, value)
+
+        if question:
+            poll.question = question
+        if options:
+            # clear and add new options
+            Option.query.filter_by(poll_id=poll.id).delete()
+            db.session.execute(insert(Option), [{"text": option_text, "poll_id": poll_id} for option_text in options])
+
+        record_changes([poll_id], EDITED)
+        db.session.commit()
+    poll_changed(poll_id, "poll_updated")
     return jsonify({"msg":"Poll updated successfully"}), 200
 
-@app.route('/delete-poll/<int:poll_id>', methods=['DELETE'])
+@api.route('/delete-poll/<int:poll_id>', methods=['DELETE'])
 @jwt_required()
 @cross_origin(supports_credentials=True)
 def delete_poll(poll_id):
-    current_user_email = get_jwt_identity()
-    user = User.query.filter_by(email=current_user_email).first()
+    user = current_user()
 
     if not user or not user.is_admin:
         return jsonify({"msg": "unauthorized"}), 403
 
-    poll = Poll.query.get(poll_id)
+    poll = find_poll(poll_id)
     if not poll:
         return jsonify({"msg": "Poll not found"}), 404
 
-    db.session.delete(poll)
-    db.session.commit()
-    return jsonify({"msg": "poll deleted"}), 200
+    # journaled votes for the poll are applied first, then deleted with it.
+    # Set-based; a big poll disappears now and its rows go in the background
+    with blocking_votes(poll_id):
+        background = remove_poll(poll_id)
+    poll_changed(poll_id, "poll_deleted")
+    data_versions.discard_body(("snapshot", poll_id))
+    return jsonify({"msg": "poll deleted", "background": background}), 200
+
+# close a poll now instead of at closes_at: freezes the results and archives the votes
+@api.route('/close-poll/<int:poll_id>', methods=['POST'])
+@jwt_required()
+def close_poll_now(poll_id):
+    user = current_user()
+    if not user or not user.is_admin:
+        return jsonify({"msg": "Unauthorized"}), 403
+
+    snapshot = close_poll(poll_id)
+    if snapshot is None:
+        if find_poll(poll_id) is None:
+            return jsonify({"msg": "Poll not found"}), 404
+        return jsonify({"msg": "Poll is closed"}), 400
+    return jsonify({"msg": "Poll closed", "results": snapshot_payload(snapshot)}), 200
 
 
 # retrieve poll results
-@app.route('/poll-results/<int:poll_id>', methods=['GET'])
+@api.route('/poll-results/<int:poll_id>', methods=['GET'])
 @jwt_required()
 def get_poll_results(poll_id):
     # admin only
-    current_user_email=get_jwt_identity()
-    user = User.query.filter_by(email=current_user_email).first()
+    user = current_user()
     if not user or not user.is_admin:
         return jsonify({"msg": "Unauthorized"}), 403
     
-    # fetch poll
-    poll = Poll.query.get(poll_id)
-    if not poll:
+    # the poll with its change log version, which any worker's vote or edit moves on
+    poll = db.session.execute(
+        select(Poll.question, Poll.closed_at, func.coalesce(PollChange.version, 0))
+        .outerjoin(PollChange, PollChange.poll_id == Poll.id)
+        .where(Poll.id == poll_id, Poll.deleted_at.is_(None))
+    ).first()
+    snapshot_key = ("snapshot", poll_id)
+    if poll is None:
+        data_versions.discard_body(snapshot_key)
         return jsonify({"msg":"Poll not found"}), 404
-    
-    # fetch results
-    options = Option.query.filter_by(poll_id=poll.id).all()
+    question, closed_at, version = poll
+
+    # a closed poll's results never change
+    if closed_at is not None:
+        body = data_versions.get_body(snapshot_key)
+        if body is None:
+            body = cache_body(snapshot_key, snapshot_payload(db.session.get(PollSnapshot, poll_id)))
+        return snapshot_response(body)
+
+    etag = f"p{version}"
+    key = ("poll-results", poll_id, etag)
+    response = cached_response(etag, key)
+    if response is not None:
+        return response
+
+    # serve from the tally cache, falling back to the database
+    tally = tally_cache.get(poll_id, version)
+    if tally is None:
+        options = db.session.query(Option.id, Option.text, Option.votes).filter_by(
+            poll_id=poll_id
+        ).order_by(Option.id).all()
+        tally = tally_cache.put(poll_id, version, question, options)
+
+    question, options = tally
     results = [
-        {"option": option.text, "votes": option.votes}
-        for option in options
+        {"option": text, "votes": votes}
+        for _, text, votes in options
     ]
-    return jsonify({
-        "poll_id":poll.id,
-        "question":poll.question,
+    return versioned_response(cache_body(key, {
+        "poll_id":poll_id,
+        "question":question,
         "results":results
+    }), etag)
+
+
+# the logged-in user's votes, newest first
+@api.route('/my-votes', methods=['GET'])
+@jwt_required()
+def get_my_votes():
+    user = current_user()
+    if not user:
+        return jsonify({"msg": "User not found"}), 404
+
+    limit = page_size(request.args, current_app.config["HISTORY_PAGE_SIZE"], current_app.config["HISTORY_MAX_PAGE_SIZE"])
+    if limit is None:
+        return jsonify({"msg": "Invalid limit"}), 400
+
+    cursor = request.args.get("cursor")
+    position = None
+    if cursor:
+        position = decode_cursor(cursor, datetime, int)
+        if position is None:
+            return jsonify({"msg": "Invalid cursor"}), 400
+
+    # keyset on (timestamp, id) down ix_vote_user_id_timestamp, joined to the
+    # question and option text, and the same down the archive of closed polls;
+    # archived votes keep their ids, so the two pages merge into one order
+    votes = []
+    for table in (Vote, ArchivedVote):
+        query = db.session.query(
+            table.id, table.poll_id, table.option_id, table.timestamp, Poll.question, Option.text
+        ).join(Poll, Poll.id == table.poll_id).join(Option, Option.id == table.option_id).filter(
+            table.user_id == user.id, Poll.deleted_at.is_(None)
+        ).order_by(table.timestamp.desc(), table.id.desc())
+        if position:
+            query = query.filter(tuple_(table.timestamp, table.id) < position)
+        votes.extend(query.limit(limit + 1).all())
+    votes.sort(key=lambda vote: (vote.timestamp, vote.id), reverse=True)
+    has_more = len(votes) > limit
+    votes = votes[:limit]
+
+    result = {
+        "votes": [{
+            "poll_id": vote.poll_id,
+            "question": vote.question,
+            "option_id": vote.option_id,
+            "option": vote.text,
+            "timestamp": vote.timestamp.isoformat() if vote.timestamp else None
+        } for vote in votes],
+        "next_cursor": encode_cursor(votes[-1].timestamp, votes[-1].id) if has_more else None
+    }
+    # the first page also lists every poll the user has voted on, so the vote
+    # page can disable them without trying each one
+    if not cursor:
+        result["voted_poll_ids"] = sorted(db.session.scalars(
+            select(Vote.poll_id).where(Vote.user_id == user.id).union(
+                select(ArchivedVote.poll_id).where(ArchivedVote.user_id == user.id)
+            )
+        ))
+    return jsonify(result), 200
+
+
+# votes over time per option, from the minute/hour rollups
+@api.route('/poll-timeline/<int:poll_id>', methods=['GET'])
+@jwt_required()
+def get_poll_timeline(poll_id):
+    user = current_user()
+    if not user or not user.is_admin:
+        return jsonify({"msg": "Unauthorized"}), 403
+
+    resolution = request.args.get("resolution", "hour")
+    if resolution not in RESOLUTIONS:
+        return jsonify({"msg": "Resolution must be minute or hour"}), 400
+    bounds, error = time_bounds(request.args)
+    if error:
+        return jsonify({"msg": error}), 400
+    step = RESOLUTIONS[resolution]
+    max_buckets = current_app.config["TIMELINE_MAX_BUCKETS"]
+    # default to the latest day of minutes or month of hours
+    until = bounds.get("until") or datetime.now(timezone.utc).replace(tzinfo=None)
+    since = bounds.get("since") or until - step * (24 * 60 if resolution == "minute" else 30 * 24)
+    if since >= until:
+        return jsonify({"msg": "since must be before until"}), 400
+    if (until - since) / step > max_buckets:
+        return jsonify({"msg": f"At most {max_buckets} buckets per request"}), 400
+
+    poll = find_poll(poll_id)
+    if not poll:
+        return jsonify({"msg": "Poll not found"}), 404
+    options = db.session.query(Option.id, Option.text).filter_by(poll_id=poll_id).order_by(Option.id)
+
+    # only buckets with votes are listed
+    return jsonify({
+        "poll_id": poll_id,
+        "question": poll.question,
+        "resolution": resolution,
+        "since": since.isoformat(),
+        "until": until.isoformat(),
+        "options": [{"id": option_id, "text": text} for option_id, text in options],
+        "buckets": [
+            {"start": start.isoformat(), "counts": {str(option_id): count for option_id, count in counts.items()}}
+            for start, counts in timeline(poll_id, resolution, since, until)
+        ]
     }), 200
 
 
+# tally cache counters
+@api.route('/admin/cache-stats', methods=['GET'])
+@jwt_required()
+def get_cache_stats():
+    user = current_user()
+    if not user or not user.is_admin:
+        return jsonify({"msg": "Unauthorized"}), 403
+
+    return jsonify({"tally_cache": tally_cache.stats()}), 200
+
+
+# request and query metrics in Prometheus text format
+@api.route('/metrics', methods=['GET'])
+@jwt_required()
+def get_metrics():
+    user = current_user()
+    if not user or not user.is_admin:
+        return jsonify({"msg": "Unauthorized"}), 403
+    if not metrics.enabled:
+        return jsonify({"msg": "Metrics are disabled"}), 404
+
+    stats = tally_cache.stats()
+    extra = {
+        "tally_cache_entries": ("Polls held in the tally cache.", "gauge", stats["size"]),
+        "tally_cache_hits_total": ("Tally cache hits.", "counter", stats["hits"]),
+        "tally_cache_misses_total": ("Tally cache misses.", "counter", stats["misses"]),
+        "tally_cache_evictions_total": ("Tally cache evictions.", "counter", stats["evictions"]),
+    }
+    journal = current_journal()
+    if journal is not None:
+        extra["vote_journal_pending_bytes"] = ("Journaled votes not yet applied, in bytes.", "gauge", journal.pending_bytes())
+    return Response(metrics.render(extra), mimetype="text/plain; version=0.0.4")
+
+
+# bulk import of users or polls, JSON body or CSV (Content-Type: text/csv)
+@api.route('/admin/import/<any(users, polls):kind>', methods=['POST'])
+@jwt_required()
+def bulk_import(kind):
+    user = current_user()
+    if not user or not user.is_admin:
+        return jsonify({"msg": "Unauthorized"}), 403
+
+    fmt = "csv" if request.mimetype == "text/csv" else "json"
+    try:
+        rows = parse_rows(request.get_data(as_text=True), fmt, kind)
+    except ImportFileError as error:
+        return jsonify({"msg": str(error)}), 400
+    if len(rows) > current_app.config["IMPORT_MAX_ROWS"]:
+        return jsonify({"msg": f"At most {current_app.config['IMPORT_MAX_ROWS']} rows per import"}), 400
+
+    if kind == "users":
+        report = import_users(rows)
+    else:
+        report = import_polls(rows, user.id)
+    return jsonify(report), 200
+
+
+# export raw votes, for one poll or all of them (open polls, or the archive)
+@api.route('/admin/export/votes', methods=['GET'])
+@api.route('/admin/export/votes/<int:poll_id>', methods=['GET'])
+@jwt_required()
+def export_votes(poll_id=None):
+    user = current_user()
+    if not user or not user.is_admin:
+        return jsonify({"msg": "Unauthorized"}), 403
+
+    export_format = request.args.get("format", "csv")
+    if export_format not in ("csv", "ndjson"):
+        return jsonify({"msg": "Format must be csv or ndjson"}), 400
+
+    # optional ?since= / ?until= ISO timestamps
+    bounds, error = time_bounds(request.args)
+    if error:
+        return jsonify({"msg": error}), 400
+
+    # a closed poll's votes are in the archive; ?archived=true exports the whole archive
+    archived = request.args.get("archived") == "true"
+    if poll_id is not None:
+        poll = find_poll(poll_id)
+        if poll is None:
+            return jsonify({"msg": "Poll not found"}), 404
+        archived = poll.closed_at is not None
+
+    table = ArchivedVote if archived else Vote
+    chunks = vote_rows(db.engine, current_app.config["EXPORT_CHUNK_SIZE"], poll_id, table=table, **bounds)
+    if export_format == "csv":
+        body, mimetype = encode_csv(chunks), "text/csv"
+    else:
+        body, mimetype = encode_ndjson(chunks), "application/x-ndjson"
+    filename = f"votes-{poll_id if poll_id is not None else 'all'}.{export_format}"
+    return Response(body, mimetype=mimetype, headers={
+        "Content-Disposition": f"attachment; filename={filename}"
+    })
+
+
 #view user list
-@app.route("/admin/users", methods=["GET", "OPTIONS"])
+@api.route("/admin/users", methods=["GET", "OPTIONS"])
 @cross_origin(supports_credentials=True)
 @jwt_required()
 def get_users():
-    current_user_email = get_jwt_identity()
-    user = User.query.filter_by(email=current_user_email).first()
+    user = current_user()
 
     if not user or not user.is_admin:
         return jsonify({"msg": "Unauthorized"}), 403
 
-    users = User.query.all()
-    return jsonify([{
-        "id": u.id,
-        "email": u.email,
-        "username": u.username,
-        "is_admin": u.is_admin
-    } for u in users]), 200
+    limit = page_size(request.args, current_app.config["USERS_PAGE_SIZE"], current_app.config["USERS_MAX_PAGE_SIZE"])
+    if limit is None:
+        return jsonify({"msg": "Invalid limit"}), 400
+
+    # only the listed columns, in id order
+    query = db.session.query(User.id, User.email, User.username, User.is_admin)
+    # ?q= matches the start of the username or email, ignoring case (off the lower() indexes)
+    search = request.args.get("q", "").strip().lower()
+    if search:
+        query = query.filter(or_(
+            prefix_match(func.lower(User.username), search), prefix_match(func.lower(User.email), search)
+        ))
+    # total before the cursor is applied
+    total = query.count() if request.args.get("include_total") == "true" else None
+
+    cursor = request.args.get("cursor")
+    if cursor:
+        position = decode_cursor(cursor, int)
+        if position is None:
+            return jsonify({"msg": "Invalid cursor"}), 400
+        query = query.filter(User.id > position[0])
+
+    users = query.order_by(User.id).limit(limit + 1).all()
+    has_more = len(users) > limit
+    users = users[:limit]
+
+    result = {
+        "users": [{
+            "id": u.id,
+            "email": u.email,
+            "username": u.username,
+            "is_admin": u.is_admin
+        } for u in users],
+        "next_cursor": encode_cursor(users[-1].id) if has_more else None
+    }
+    if total is not None:
+        result["total"] = total
+    return jsonify(result), 200
@@ -0,0 +1,76 @@
+# tally_cache.py
+# bounded in-process LRU of poll tallies. Each entry is tagged with the poll's
+# change version (poll_change.version) as read before its counts, and is only
+# used while that is still the poll's version: a vote or edit by any worker
+# stamps a new version, so no worker serves a tally older than the database
+from collections import OrderedDict
+from threading import Lock
+
+
+class TallyCache:
+    def __init__(self, app=None, max_size=1024):
+        self.max_size = max_size
+        self._entries = OrderedDict()  # poll id -> (version, (question, ((option id, text, votes), ...)))
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_size = app.config.get("TALLY_CACHE_SIZE", self.max_size)
+        self.clear()
+        app.extensions["tally_cache"] = self
+
+    def get(self, poll_id, version):
+        return self.get_many({poll_id: version}).get(poll_id)
+
+    def get_many(self, versions):
+        # versions maps poll id -> current version; entries cached at that
+        # version, missing and outdated ones are left out
+        found = {}
+        with self._lock:
+            for poll_id, version in versions.items():
+                entry = self._entries.get(poll_id)
+                if entry is None or entry[0] != version:
+                    self.misses += 1
+                    continue
+                self._entries.move_to_end(poll_id)
+                self.hits += 1
+                found[poll_id] = entry[1]
+        return found
+
+    def put(self, poll_id, version, question, options):
+        # version must be read before the options; options is an iterable of
+        # (id, text, votes, ...). Returns the (question, options) entry
+        entry = (question, tuple((o[0], o[1], o[2]) for o in options))
+        with self._lock:
+            self._entries[poll_id] = (version, entry)
+            self._entries.move_to_end(poll_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return entry
+
+    def invalidate(self, poll_id):
+        # frees the entry of an edited or deleted poll; its version has moved on anyway
+        with self._lock:
+            self._entries.pop(poll_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+            self.evictions = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
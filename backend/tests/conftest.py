@@ -0,0 +1,76 @@
+import os
+import sqlite3
+import pytest
+from contextlib import contextmanager
+from sqlalchemy import event
+
+# the app reads its settings at import time, so pick the testing profile first
+os.environ.setdefault("APP_CONFIG", "testing")
+
+
+@contextmanager
+def count_queries(engine):
+    # every SQL statement sent to the database while the block runs
+    statements = []
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+    event.listen(engine, "before_cursor_execute", capture)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, "before_cursor_execute", capture)
+
+
+@pytest.fixture(scope="session")
+def template_app():
+    # built once per run: the schema goes into a template database that every
+    # test starts from, instead of running create_all each time
+    from app import create_app
+    from extensions import db
+    app = create_app("testing")
+    with app.app_context():
+        db.create_all()
+        template = sqlite3.connect(":memory:", check_same_thread=False)
+        _sqlite_connection(db.engine).backup(template)
+        db.session.remove()
+    app.template_db = template
+    return app
+
+
+@pytest.fixture
+def app(template_app):
+    # the shared app with its in-memory database reset to the template and
+    # caches cleared; call create_app("testing") directly for a separate app
+    from extensions import db
+    with template_app.app_context():
+        db.session.remove()
+        template_app.template_db.backup(_sqlite_connection(db.engine))
+    for name in ("tally_cache", "user_cache", "data_versions", "tally_broadcaster"):
+        template_app.extensions[name].clear()
+    template_app.extensions["metrics"].reset()
+    yield template_app
+
+
+def _sqlite_connection(engine):
+    # the pooled in-memory connection behind the engine (one per engine for :memory:)
+    connection = engine.raw_connection()
+    try:
+        return connection.driver_connection
+    finally:
+        connection.close()
+
+
+@pytest.fixture
+def client(app):
+    # keeps the last request's context, so tests can query db.session after a request
+    with app.test_client() as client:
+        yield client
+
+
+@pytest.fixture
+def query_counter(app):
+    # with query_counter() as statements: client.get(...)
+    from extensions import db
+    with app.app_context():
+        engine = db.engine
+    return lambda: count_queries(engine)
@@ -0,0 +1,110 @@
+import pytest
+from sqlalchemy import insert
+from extensions import db, tally_cache, password_hasher
+from models import User, Poll, Option, Vote, PollChange
+from pagination import encode_cursor
+from flask_jwt_extended import create_access_token
+
+POLLS = 50
+OPTIONS = 3
+
+# most SQL statements each route may run, with every in-memory cache cold.
+# Keep these tight: a route that starts loading rows one by one (N+1) blows
+# through its budget here long before it shows up in production
+BUDGETS = {
+    "POST /register": 2,
+    "POST /login": 1,
+    "POST /create-poll": 5,
+    "GET /polls": 3,
+    "GET /polls (next page)": 3,
+    "POST /vote/<id>": 5,
+    "POST /vote/batch": 8,
+    "PATCH /edit-poll/<id>": 8,
+    "DELETE /delete-poll/<id>": 5,
+    "GET /poll-results/<id>": 3,
+    "GET /changes": 3,
+    "GET /poll-timeline/<id>": 4,
+    "GET /my-votes": 4,
+    "GET /admin/users": 3,
+    "GET /admin/export/votes": 2,
+    "GET /metrics": 1,
+}
+
+@pytest.fixture
+def seeded(app, client):
+    # admin, voter, 50 polls with 3 options each and one vote on every poll but the last
+    with app.app_context():
+        password = password_hasher.hash("password123")
+        db.session.execute(insert(User), [
+            {"username": name, "email": f"{name}@example.com", "password": password, "is_admin": name == "admin"}
+            for name in ["admin", "voter", "other"]
+        ])
+        db.session.execute(insert(Poll), [{"question": f"Poll {i}?", "user_id": 1} for i in range(POLLS)])
+        db.session.execute(insert(Option), [
+            {"text": f"Option {o}", "poll_id": p, "votes": 1 if o == 0 and p < POLLS else 0}
+            for p in range(1, POLLS + 1) for o in range(OPTIONS)
+        ])
+        db.session.execute(insert(Vote), [
+            {"poll_id": p, "user_id": 3, "option_id": (p - 1) * OPTIONS + 1} for p in range(1, POLLS)
+        ])
+        db.session.execute(insert(PollChange), [
+            {"poll_id": p, "version": p, "poll_version": p} for p in range(1, POLLS + 1)
+        ])
+        db.session.commit()
+        headers = {
+            who: {"Authorization": f"Bearer {create_access_token(identity=f'{who}@example.com')}"}
+            for who in ["admin", "voter", "other"]
+        }
+    return client, headers
+
+# route -> (method, url, who, json body)
+def requests_for(app, route):
+    return {
+        "POST /register": ("post", "/register", None,
+                           {"username": "new", "email": "new@example.com", "password": "password123"}),
+        "POST /login": ("post", "/login", None, {"email": "voter@example.com", "password": "password123"}),
+        "POST /create-poll": ("post", "/create-poll", "admin", {"question": "New?", "options": ["A", "B", "C", "D"]}),
+        "GET /polls": ("get", f"/polls?limit={POLLS}", "voter", None),
+        "GET /polls (next page)": ("get", f"/polls?limit=10&cursor={next_polls_cursor(app)}", "voter", None),
+        "POST /vote/<id>": ("post", "/vote/1", "voter", {"optionId": 2}),
+        "POST /vote/batch": ("post", "/vote/batch", "voter", {"votes": [
+            {"pollId": p, "optionId": (p - 1) * OPTIONS + 1} for p in range(1, POLLS + 1)
+        ]}),
+        "PATCH /edit-poll/<id>": ("patch", f"/edit-poll/{POLLS}", "admin", {"question": "Renamed?", "options": ["X", "Y"]}),
+        "DELETE /delete-poll/<id>": ("delete", "/delete-poll/1", "admin", None),
+        "GET /poll-results/<id>": ("get", "/poll-results/1", "admin", None),
+        "GET /changes": ("get", f"/changes?since={encode_cursor(POLLS - 20)}", "voter", None),
+        "GET /poll-timeline/<id>": ("get", "/poll-timeline/1?resolution=minute", "admin", None),
+        "GET /my-votes": ("get", "/my-votes", "other", None),
+        "GET /admin/users": ("get", "/admin/users?q=vot&include_total=true", "admin", None),
+        "GET /admin/export/votes": ("get", "/admin/export/votes?format=ndjson", "admin", None),
+        "GET /metrics": ("get", "/metrics", "admin", None),
+    }[route]
+
+def next_polls_cursor(app):
+    # position after the 10 newest polls
+    with app.app_context():
+        poll = db.session.query(Poll.created_at, Poll.id).order_by(
+            Poll.created_at.desc(), Poll.id.desc()
+        ).offset(9).first()
+    return encode_cursor(poll.created_at, poll.id)
+
+@pytest.mark.parametrize("route", BUDGETS)
+def test_route_query_budget(app, seeded, query_counter, route):
+    client, headers = seeded
+    method, url, who, body = requests_for(app, route)
+    with query_counter() as statements:
+        response = getattr(client, method)(url, headers=headers.get(who, {}), json=body)
+        response.get_data()  # drain streamed responses inside the block
+    assert response.status_code < 300, response.get_data(as_text=True)
+    assert len(statements) <= BUDGETS[route], f"{route} ran {len(statements)} queries:\n" + "\n".join(statements)
+
+def test_polls_budget_does_not_grow_with_page_size(seeded, query_counter):
+    # a full page costs the same as a page of one; per-poll option loads would not
+    client, headers = seeded
+    with query_counter() as small:
+        client.get("/polls?limit=1", headers=headers["voter"])
+    tally_cache.clear()
+    with query_counter() as large:
+        client.get(f"/polls?limit={POLLS}", headers=headers["voter"])
+    assert len(large) <= len(small) + 1
@@ -0,0 +1,116 @@
+import pytest
+from contextlib import contextmanager
+from sqlalchemy import event
+from extensions import db, tally_cache, user_cache
+from models import User, Poll, Option
+from pagination import encode_cursor
+from flask_jwt_extended import create_access_token
+
+@contextmanager
+def captured_selects():
+    # reads (and the vote INSERT ... SELECT) run while the block executes
+    statements = []
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(("SELECT", "INSERT INTO VOTE")) and not executemany:
+            statements.append((statement, parameters))
+    event.listen(db.engine, "before_cursor_execute", capture)
+    try:
+        yield statements
+    finally:
+        event.remove(db.engine, "before_cursor_execute", capture)
+
+def table_scans(statement, parameters):
+    # plan steps that read a whole table without an index
+    plan = db.session.connection().exec_driver_sql("EXPLAIN QUERY PLAN " + statement, parameters).all()
+    return [row[-1] for row in plan if row[-1].startswith("SCAN ") and "USING" not in row[-1]
+            and row[-1] != "SCAN CONSTANT ROW"]
+
+@pytest.fixture
+def seeded(client):
+    # admin, a voter and a few polls with votes
+    for name in ["admin", "voter"]:
+        client.post("/register", json={
+            "username": name,
+            "email": f"{name}@example.com",
+            "password": "password123"
+        })
+    admin = User.query.filter_by(email="admin@example.com").first()
+    admin.is_admin = True
+    db.session.commit()
+    admin_headers = {"Authorization": f"Bearer {create_access_token(identity='admin@example.com')}"}
+    voter_headers = {"Authorization": f"Bearer {create_access_token(identity='voter@example.com')}"}
+    for i in range(5):
+        client.post("/create-poll", json={"question": f"Poll {i}?", "options": ["A", "B", "C"]}, headers=admin_headers)
+    for poll in Poll.query.all()[:3]:
+        option = Option.query.filter_by(poll_id=poll.id).first()
+        client.post(f"/vote/{poll.id}", json={"optionId": option.id}, headers=voter_headers)
+    tally_cache.clear()
+    user_cache.clear()
+    return client, admin_headers, voter_headers
+
+def assert_indexed(client, method, url, headers, **kwargs):
+    with captured_selects() as statements:
+        getattr(client, method)(url, headers=headers, **kwargs)
+    assert statements
+    for statement, parameters in statements:
+        assert table_scans(statement, parameters) == [], statement
+
+def test_polls_queries_use_indexes(seeded):
+    client, _, voter_headers = seeded
+    page = client.get("/polls?limit=2", headers=voter_headers).get_json()
+    tally_cache.clear()
+    assert_indexed(client, "get", f"/polls?limit=2&cursor={page['next_cursor']}", voter_headers)
+
+def test_vote_queries_use_indexes(seeded):
+    client, admin_headers, _ = seeded
+    poll = Poll.query.order_by(Poll.id.desc()).first()
+    option = Option.query.filter_by(poll_id=poll.id).first()
+    assert_indexed(client, "post", f"/vote/{poll.id}", admin_headers, json={"optionId": option.id})
+
+def test_vote_batch_queries_use_indexes(seeded):
+    client, admin_headers, _ = seeded
+    votes = [{"pollId": poll.id, "optionId": poll.options[0].id} for poll in Poll.query.all()]
+    assert_indexed(client, "post", "/vote/batch", admin_headers, json={"votes": votes})
+
+def test_edit_poll_queries_use_indexes(seeded):
+    client, admin_headers, _ = seeded
+    poll = Poll.query.order_by(Poll.id.desc()).first()
+    assert_indexed(client, "patch", f"/edit-poll/{poll.id}", admin_headers, json={"question": "Renamed?"})
+
+def test_poll_results_queries_use_indexes(seeded):
+    client, admin_headers, _ = seeded
+    poll = Poll.query.first()
+    assert_indexed(client, "get", f"/poll-results/{poll.id}", admin_headers)
+
+def test_poll_timeline_queries_use_indexes(seeded):
+    client, admin_headers, _ = seeded
+    poll = Poll.query.first()
+    assert_indexed(client, "get", f"/poll-timeline/{poll.id}?resolution=minute", admin_headers)
+
+def test_my_votes_queries_use_indexes(seeded):
+    client, _, voter_headers = seeded
+    page = client.get("/my-votes?limit=1", headers=voter_headers).get_json()
+    assert_indexed(client, "get", "/my-votes?limit=1", voter_headers)
+    assert_indexed(client, "get", f"/my-votes?limit=1&cursor={page['next_cursor']}", voter_headers)
+
+def test_changes_queries_use_indexes(seeded):
+    client, _, voter_headers = seeded
+    assert_indexed(client, "get", f"/changes?since={encode_cursor(3)}", voter_headers)
+
+def test_reconcile_queries_use_indexes(seeded):
+    from reconcile import reconcile
+    with captured_selects() as statements:
+        reconcile(full=True)
+    assert statements
+    for statement, parameters in statements:
+        assert table_scans(statement, parameters) == [], statement
+
+def test_delete_poll_queries_use_indexes(seeded):
+    client, admin_headers, _ = seeded
+    poll = Poll.query.first()
+    assert_indexed(client, "delete", f"/delete-poll/{poll.id}", admin_headers)
+
+def test_admin_users_queries_use_indexes(seeded):
+    client, admin_headers, _ = seeded
+    assert_indexed(client, "get", "/admin/users?q=vot&include_total=true", admin_headers)
+    assert_indexed(client, "get", f"/admin/users?limit=1&cursor={encode_cursor(1)}", admin_headers)
@@ -1,20 +1,10 @@
-import pytest
-from app import app, db
-from models import User, Poll, Option, Vote
+import json
+import time
+from extensions import db
+from models import User, Poll, Option, Vote, VoteRollup, ArchivedVote, PollSnapshot
+from tally_cache import TallyCache
 from flask_jwt_extended import create_access_token
 
-@pytest.fixture
-def client():
-    app.config["TESTING"] = True
-    app.config["SQLALCHEMY_DATABASE_URI"] = "sqlite:///:memory:"
-    with app.test_client() as client:
-        with app.app_context():
-            db.create_all()
-        yield client
-        with app.app_context():
-            db.session.remove()
-            db.drop_all()
-
 def test_register(client):
     response = client.post("/register", json={
         "username": "testuser",
@@ -165,7 +155,7 @@ def test_vote_single_choice_success(client):
     access_token_user = create_access_token(identity=user.email)
 
     # Create a poll
-    response = client.post(
+    client.post(
         "/create-poll",
         json={
             "question": "What's your favorite programming language?",
@@ -182,8 +172,8 @@ def test_vote_single_choice_success(client):
 
     # Cast a vote
     vote_response = client.post(
-        "/vote",
-        json={"poll_id": poll.id, "option_id": option.id},
+        f"/vote/{poll.id}",
+        json={"optionId": option.id},
         headers={"Authorization": f"Bearer {access_token_user}"}
     )
     assert vote_response.status_code == 201
@@ -203,7 +193,7 @@ def test_vote_single_choice_revote(client):
     access_token_user = create_access_token(identity=user.email)
 
     # Create a poll
-    response = client.post(
+    client.post(
         "/create-poll",
         json={
             "question": "What's your favorite programming language?",
@@ -220,8 +210,8 @@ def test_vote_single_choice_revote(client):
 
     # Cast a vote
     vote_response = client.post(
-        "/vote",
-        json={"poll_id": poll.id, "option_id": option.id},
+        f"/vote/{poll.id}",
+        json={"optionId": option.id},
         headers={"Authorization": f"Bearer {access_token_user}"}
     )
     assert vote_response.status_code == 201
@@ -229,13 +219,81 @@ def test_vote_single_choice_revote(client):
 
     # Cast a vote
     vote_response = client.post(
-        "/vote",
-        json={"poll_id": poll.id, "option_id": option.id},
+        f"/vote/{poll.id}",
+        json={"optionId": option.id},
         headers={"Authorization": f"Bearer {access_token_user}"}
     )
     assert vote_response.status_code == 400 # expected
     assert vote_response.get_json()["msg"] == "User has already voted on this poll"
 
+def test_vote_counts_once(client):
+    # Register and login admin
+    client.post("/register", json={
+        "username": "admin",
+        "email": "admin@example.com",
+        "password": "adminpassword"
+    })
+    user = User.query.filter_by(email="admin@example.com").first()
+    user.is_admin = True
+    db.session.commit()
+    access_token = create_access_token(identity=user.email)
+
+    client.post(
+        "/create-poll",
+        json={"question": "Tabs or spaces?", "options": ["Tabs", "Spaces"]},
+        headers={"Authorization": f"Bearer {access_token}"}
+    )
+    poll = Poll.query.first()
+    option = Option.query.filter_by(poll_id=poll.id).first()
+
+    # Vote twice, only the first one counts
+    for _ in range(2):
+        client.post(
+            f"/vote/{poll.id}",
+            json={"optionId": option.id},
+            headers={"Authorization": f"Bearer {access_token}"}
+        )
+    assert db.session.get(Option, option.id).votes == 1
+    assert Vote.query.count() == 1
+
+def test_vote_option_not_in_poll(client):
+    client.post("/register", json={
+        "username": "admin",
+        "email": "admin@example.com",
+        "password": "adminpassword"
+    })
+    user = User.query.filter_by(email="admin@example.com").first()
+    user.is_admin = True
+    db.session.commit()
+    access_token = create_access_token(identity=user.email)
+
+    for question in ["First?", "Second?"]:
+        client.post(
+            "/create-poll",
+            json={"question": question, "options": ["Yes", "No"]},
+            headers={"Authorization": f"Bearer {access_token}"}
+        )
+    first, second = Poll.query.order_by(Poll.id).all()
+    other_option = Option.query.filter_by(poll_id=second.id).first()
+
+    # Option from another poll
+    response = client.post(
+        f"/vote/{first.id}",
+        json={"optionId": other_option.id},
+        headers={"Authorization": f"Bearer {access_token}"}
+    )
+    assert response.status_code == 404
+    assert response.get_json()["msg"] == "Option not found for this poll"
+
+    # Unknown poll
+    response = client.post(
+        "/vote/999",
+        json={"optionId": other_option.id},
+        headers={"Authorization": f"Bearer {access_token}"}
+    )
+    assert response.status_code == 404
+    assert response.get_json()["msg"] == "Poll not found"
+
 def test_edit_poll_success(client):
     # Register and login admin
     client.post("/register", json={
@@ -318,8 +376,8 @@ def test_edit_poll_with_votes(client):
     poll = Poll.query.first()
     option = Option.query.filter_by(poll_id=poll.id).first()
     client.post(
-        "/vote",
-        json={"poll_id": poll.id, "option_id": option.id},
+        f"/vote/{poll.id}",
+        json={"optionId": option.id},
         headers={"Authorization": f"Bearer {access_token}"}
     )
 
@@ -360,8 +418,8 @@ def test_get_poll_results_success(client):
     poll = Poll.query.first()
     option = Option.query.filter_by(poll_id=poll.id).first()
     client.post(
-        "/vote",
-        json={"poll_id": poll.id, "option_id": option.id},
+        f"/vote/{poll.id}",
+        json={"optionId": option.id},
         headers={"Authorization": f"Bearer {access_token}"}
     )
 
@@ -416,3 +474,1010 @@ def test_get_poll_results_poll_not_found(client):
     assert data["msg"] == "Poll not found"
 
 
+
+def test_get_polls_paginated(client):
+    # Register and login admin
+    client.post("/register", json={
+        "username": "admin",
+        "email": "admin@example.com",
+        "password": "adminpassword"
+    })
+    user = User.query.filter_by(email="admin@example.com").first()
+    user.is_admin = True
+    db.session.commit()
+    access_token = create_access_token(identity=user.email)
+
+    # Create three polls
+    for question in ["First?", "Second?", "Third?"]:
+        client.post(
+            "/create-poll",
+            json={"question": question, "options": ["Yes", "No"]},
+            headers={"Authorization": f"Bearer {access_token}"}
+        )
+
+    # First page holds the two newest polls
+    response = client.get("/polls?limit=2", headers={"Authorization": f"Bearer {access_token}"})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert [poll["question"] for poll in data["polls"]] == ["Third?", "Second?"]
+    assert len(data["polls"][0]["options"]) == 2
+    assert data["next_cursor"]
+
+    # Second page continues from the cursor
+    response = client.get(
+        f"/polls?limit=2&cursor={data['next_cursor']}",
+        headers={"Authorization": f"Bearer {access_token}"}
+    )
+    data = response.get_json()
+    assert [poll["question"] for poll in data["polls"]] == ["First?"]
+    assert data["next_cursor"] is None
+
+def test_get_polls_invalid_cursor(client):
+    client.post("/register", json={
+        "username": "testuser",
+        "email": "testuser@example.com",
+        "password": "password123"
+    })
+    access_token = create_access_token(identity="testuser@example.com")
+
+    response = client.get("/polls?cursor=garbage", headers={"Authorization": f"Bearer {access_token}"})
+    assert response.status_code == 400
+    assert response.get_json()["msg"] == "Invalid cursor"
+
+def test_poll_results_served_from_cache(client):
+    # Register and login admin
+    client.post("/register", json={
+        "username": "admin",
+        "email": "admin@example.com",
+        "password": "adminpassword"
+    })
+    user = User.query.filter_by(email="admin@example.com").first()
+    user.is_admin = True
+    db.session.commit()
+    access_token = create_access_token(identity=user.email)
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    client.post("/create-poll", json={"question": "Cats or dogs?", "options": ["Cats", "Dogs"]}, headers=headers)
+    poll = Poll.query.first()
+    option = Option.query.filter_by(poll_id=poll.id).first()
+
+    # First read misses, the poll list then reuses the cached tally
+    client.get(f"/poll-results/{poll.id}", headers=headers)
+    client.get("/polls", headers=headers)
+    stats = client.get("/admin/cache-stats", headers=headers).get_json()["tally_cache"]
+    assert stats["misses"] == 1
+    assert stats["hits"] == 1
+
+    # A vote moves the poll's version on, so the tally is read again
+    client.post(f"/vote/{poll.id}", json={"optionId": option.id}, headers=headers)
+    data = client.get(f"/poll-results/{poll.id}", headers=headers).get_json()
+    assert data["results"][0] == {"option": "Cats", "votes": 1}
+
+    # A vote written by another worker, which this one never hears about
+    from changes import record_changes
+    response = client.get(f"/poll-results/{poll.id}", headers=headers)
+    listing = client.get("/polls", headers=headers)
+    db.session.get(Option, option.id).votes += 1
+    record_changes([poll.id])
+    db.session.commit()
+    again = client.get(f"/poll-results/{poll.id}", headers={**headers, "If-None-Match": response.headers["ETag"]})
+    assert again.status_code == 200
+    assert again.get_json()["results"][0] == {"option": "Cats", "votes": 2}
+    again = client.get("/polls", headers={**headers, "If-None-Match": listing.headers["ETag"]})
+    assert again.status_code == 200
+    assert again.get_json()["polls"][0]["options"][0]["votes"] == 2
+
+    # Editing drops the cached entry
+    client.post("/create-poll", json={"question": "Tea or coffee?", "options": ["Tea", "Coffee"]}, headers=headers)
+    other = Poll.query.filter_by(question="Tea or coffee?").first()
+    client.get(f"/poll-results/{other.id}", headers=headers)
+    client.patch(f"/edit-poll/{other.id}", json={"question": "Tea, coffee or juice?"}, headers=headers)
+    data = client.get(f"/poll-results/{other.id}", headers=headers).get_json()
+    assert data["question"] == "Tea, coffee or juice?"
+
+def test_tally_cache_evicts_least_recently_used():
+    cache = TallyCache(max_size=2)
+    cache.put(1, 1, "One?", [(1, "a", 0)])
+    cache.put(2, 1, "Two?", [(2, "b", 0)])
+    cache.get(1, 1)
+    cache.put(3, 1, "Three?", [(3, "c", 0)])
+    assert cache.get(2, 1) is None
+    assert cache.get(1, 1) is not None
+    assert cache.stats()["evictions"] == 1
+
+def test_tally_cache_only_serves_the_current_version():
+    cache = TallyCache()
+    cache.put(1, 5, "One?", [(1, "a", 2)])
+    assert cache.get(1, 5) == ("One?", ((1, "a", 2),))
+    # a vote or edit by any worker stamps a newer version
+    assert cache.get(1, 6) is None
+    assert cache.stats()["misses"] == 1
+
+def test_live_tally_deltas_are_coalesced(app, client, monkeypatch):
+    socketio, broadcaster = app.extensions["socketio"], app.extensions["tally_broadcaster"]
+    # Register and login admin
+    client.post("/register", json={
+        "username": "admin",
+        "email": "admin@example.com",
+        "password": "adminpassword"
+    })
+    user = User.query.filter_by(email="admin@example.com").first()
+    user.is_admin = True
+    db.session.commit()
+    access_token = create_access_token(identity=user.email)
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    client.post("/create-poll", json={"question": "Up or down?", "options": ["Up", "Down"]}, headers=headers)
+    poll = Poll.query.first()
+    option = Option.query.filter_by(poll_id=poll.id).first()
+
+    # Socket connections need a valid token
+    assert not socketio.test_client(app, auth={"token": "bad"}).is_connected()
+    live = socketio.test_client(app, auth={"token": access_token})
+    live.emit("subscribe", {"poll_id": poll.id})
+
+    # Several voters inside one window arrive as one message; the window is
+    # widened so three requests on a slow machine still fit in it
+    monkeypatch.setattr(broadcaster, "window", 1.0)
+    tokens = []
+    for i in range(3):
+        client.post("/register", json={
+            "username": f"voter{i}",
+            "email": f"voter{i}@example.com",
+            "password": "password123"
+        })
+        tokens.append(create_access_token(identity=f"voter{i}@example.com"))
+    for token in tokens:
+        client.post(f"/vote/{poll.id}", json={"optionId": option.id}, headers={"Authorization": f"Bearer {token}"})
+    deltas = []
+    deadline = time.monotonic() + broadcaster.window * 3
+    while not deltas and time.monotonic() < deadline:
+        time.sleep(0.05)
+        deltas = [m for m in live.get_received() if m["name"] == "tally_delta"]
+    assert len(deltas) == 1
+    assert deltas[0]["args"][0] == {"poll_id": poll.id, "deltas": {str(option.id): 3}}
+
+def test_vote_batch(client):
+    # Register and login admin
+    client.post("/register", json={
+        "username": "admin",
+        "email": "admin@example.com",
+        "password": "adminpassword"
+    })
+    user = User.query.filter_by(email="admin@example.com").first()
+    user.is_admin = True
+    db.session.commit()
+    access_token = create_access_token(identity=user.email)
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    for question in ["First?", "Second?"]:
+        client.post("/create-poll", json={"question": question, "options": ["Yes", "No"]}, headers=headers)
+    first, second = Poll.query.order_by(Poll.id).all()
+    yes_first = Option.query.filter_by(poll_id=first.id).first()
+    yes_second = Option.query.filter_by(poll_id=second.id).first()
+
+    response = client.post("/vote/batch", json={"votes": [
+        {"pollId": first.id, "optionId": yes_first.id},
+        {"pollId": second.id, "optionId": yes_second.id},
+        {"pollId": first.id, "optionId": yes_first.id},
+        {"pollId": first.id, "optionId": yes_second.id},
+        {"pollId": "x"},
+        {"pollId": True, "optionId": yes_first.id}
+    ]}, headers=headers)
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["accepted"] == 2
+    assert [r["status"] for r in data["results"]] == [201, 201, 400, 404, 400, 400]
+    assert db.session.get(Option, yes_first.id).votes == 1
+    assert db.session.get(Option, yes_second.id).votes == 1
+
+def test_vote_batch_on_behalf_of_users(client):
+    # Register admin and two voters
+    for name in ["admin", "alice", "bob"]:
+        client.post("/register", json={
+            "username": name,
+            "email": f"{name}@example.com",
+            "password": "password123"
+        })
+    admin = User.query.filter_by(email="admin@example.com").first()
+    admin.is_admin = True
+    db.session.commit()
+    admin_token = create_access_token(identity="admin@example.com")
+    voter_ids = [u.id for u in User.query.filter(User.username != "admin").all()]
+
+    client.post("/create-poll", json={"question": "Lunch?", "options": ["Pizza", "Salad"]},
+                headers={"Authorization": f"Bearer {admin_token}"})
+    poll = Poll.query.first()
+    pizza = Option.query.filter_by(poll_id=poll.id).first()
+    votes = [{"userId": user_id, "pollId": poll.id, "optionId": pizza.id} for user_id in voter_ids + [999]]
+
+    # Non-admins cannot vote for others
+    voter_token = create_access_token(identity="alice@example.com")
+    response = client.post("/vote/batch", json={"votes": votes}, headers={"Authorization": f"Bearer {voter_token}"})
+    assert response.status_code == 403
+
+    response = client.post("/vote/batch", json={"votes": votes}, headers={"Authorization": f"Bearer {admin_token}"})
+    data = response.get_json()
+    assert data["accepted"] == 2
+    assert data["results"][2]["msg"] == "User not found"
+    assert db.session.get(Option, pizza.id).votes == 2
+
+def test_admin_change_invalidates_cached_user(app, client):
+    user_cache = app.extensions["user_cache"]
+    client.post("/register", json={
+        "username": "testuser",
+        "email": "testuser@example.com",
+        "password": "password123"
+    })
+    access_token = create_access_token(identity="testuser@example.com")
+    headers = {"Authorization": f"Bearer {access_token}"}
+    poll = {"question": "Promoted yet?", "options": ["Yes", "No"]}
+
+    # Cached as a regular user
+    assert client.post("/create-poll", json=poll, headers=headers).status_code == 403
+    assert user_cache.get("testuser@example.com").is_admin is False
+
+    # Promotion takes effect on the next request
+    user = User.query.filter_by(email="testuser@example.com").first()
+    user.is_admin = True
+    db.session.commit()
+    assert user_cache.get("testuser@example.com") is None
+    assert client.post("/create-poll", json=poll, headers=headers).status_code == 201
+
+def test_login_upgrades_password_hash(app, client, monkeypatch):
+    password_hasher = app.extensions["password_hasher"]
+    monkeypatch.setattr(password_hasher, "method", "pbkdf2:sha256:1000")
+    client.post("/register", json={
+        "username": "testuser",
+        "email": "testuser@example.com",
+        "password": "password123"
+    })
+    assert User.query.filter_by(email="testuser@example.com").first().password.startswith("pbkdf2:sha256:1000$")
+
+    # Switch to bcrypt, the next login rehashes
+    monkeypatch.setattr(password_hasher, "method", "bcrypt")
+    monkeypatch.setattr(password_hasher, "rounds", 4)
+    response = client.post("/login", json={"email": "testuser@example.com", "password": "password123"})
+    assert response.status_code == 200
+    stored = User.query.filter_by(email="testuser@example.com").first().password
+    assert stored.startswith("$2b$04$")
+    assert not password_hasher.needs_rehash(stored)
+
+    # The upgraded hash still verifies
+    response = client.post("/login", json={"email": "testuser@example.com", "password": "password123"})
+    assert response.status_code == 200
+
+def test_sqlite_pragmas_applied(tmp_path):
+    from types import SimpleNamespace
+    from sqlalchemy import create_engine, text
+    from config import ProductionConfig
+    from database import configure_engine
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'profile.db'}")
+    profile_app = SimpleNamespace(config={"SQLITE_PRAGMAS": ProductionConfig.SQLITE_PRAGMAS})
+    configure_engine(profile_app, engine)
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert connection.execute(text("PRAGMA synchronous")).scalar() == 1  # NORMAL
+        assert connection.execute(text("PRAGMA busy_timeout")).scalar() == 5000
+    engine.dispose()
+
+def test_conditional_get_with_etags(client):
+    # Register and login admin
+    client.post("/register", json={
+        "username": "admin",
+        "email": "admin@example.com",
+        "password": "adminpassword"
+    })
+    user = User.query.filter_by(email="admin@example.com").first()
+    user.is_admin = True
+    db.session.commit()
+    access_token = create_access_token(identity=user.email)
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    client.post("/create-poll", json={"question": "Sun or rain?", "options": ["Sun", "Rain"]}, headers=headers)
+    poll = Poll.query.first()
+    option = Option.query.filter_by(poll_id=poll.id).first()
+
+    for url in ["/polls", f"/poll-results/{poll.id}"]:
+        first = client.get(url, headers=headers)
+        etag = first.headers["ETag"]
+        assert first.status_code == 200
+
+        # Unchanged data answers 304 with no body
+        repeat = client.get(url, headers={**headers, "If-None-Match": etag})
+        assert repeat.status_code == 304
+        assert repeat.data == b""
+
+    # A vote moves both versions on
+    polls_etag = client.get("/polls", headers=headers).headers["ETag"]
+    client.post(f"/vote/{poll.id}", json={"optionId": option.id}, headers=headers)
+    response = client.get("/polls", headers={**headers, "If-None-Match": polls_etag})
+    assert response.status_code == 200
+    assert response.get_json()["polls"][0]["options"][0]["votes"] == 1
+
+def test_export_votes(client):
+    # Register and login admin
+    client.post("/register", json={
+        "username": "admin",
+        "email": "admin@example.com",
+        "password": "adminpassword"
+    })
+    user = User.query.filter_by(email="admin@example.com").first()
+    user.is_admin = True
+    db.session.commit()
+    access_token = create_access_token(identity=user.email)
+    headers = {"Authorization": f"Bearer {access_token}"}
+
+    client.post("/create-poll", json={"question": "Export me?", "options": ["Yes", "No"]}, headers=headers)
+    poll = Poll.query.first()
+    option = Option.query.filter_by(poll_id=poll.id).first()
+    client.post(f"/vote/{poll.id}", json={"optionId": option.id}, headers=headers)
+
+    response = client.get(f"/admin/export/votes/{poll.id}", headers=headers)
+    assert response.status_code == 200
+    lines = response.data.decode().splitlines()
+    assert lines[0] == "id,poll_id,option_id,user_id,timestamp"
+    assert lines[1].startswith(f"1,{poll.id},{option.id},{user.id},")
+
+    response = client.get("/admin/export/votes?format=ndjson", headers=headers)
+    rows = [json.loads(line) for line in response.data.decode().splitlines()]
+    assert [row["option_id"] for row in rows] == [option.id]
+
+    # Range filter
+    response = client.get("/admin/export/votes?format=ndjson&since=2999-01-01T00:00:00", headers=headers)
+    assert response.data == b""
+
+def test_export_votes_not_admin(client):
+    client.post("/register", json={
+        "username": "user",
+        "email": "user@example.com",
+        "password": "password123"
+    })
+    access_token = create_access_token(identity="user@example.com")
+    response = client.get("/admin/export/votes", headers={"Authorization": f"Bearer {access_token}"})
+    assert response.status_code == 403
+
+def test_admin_users_paginated_search(client):
+    # Register admin and a few users
+    for name in ["admin", "alice", "albert", "bob"]:
+        client.post("/register", json={
+            "username": name,
+            "email": f"{name}@example.com",
+            "password": "password123"
+        })
+    user = User.query.filter_by(email="admin@example.com").first()
+    user.is_admin = True
+    db.session.commit()
+    headers = {"Authorization": f"Bearer {create_access_token(identity=user.email)}"}
+
+    # Pages in id order, with a total on request
+    response = client.get("/admin/users?limit=3&include_total=true", headers=headers)
+    assert response.status_code == 200
+    data = response.get_json()
+    assert [u["username"] for u in data["users"]] == ["admin", "alice", "albert"]
+    assert data["total"] == 4
+    data = client.get(f"/admin/users?limit=3&cursor={data['next_cursor']}", headers=headers).get_json()
+    assert [u["username"] for u in data["users"]] == ["bob"]
+    assert data["next_cursor"] is None
+    assert "total" not in data
+
+    # Prefix search on username or email
+    data = client.get("/admin/users?q=al", headers=headers).get_json()
+    assert [u["username"] for u in data["users"]] == ["alice", "albert"]
+    data = client.get("/admin/users?q=bob@", headers=headers).get_json()
+    assert [u["username"] for u in data["users"]] == ["bob"]
+    data = client.get("/admin/users?q=AL", headers=headers).get_json()
+    assert [u["username"] for u in data["users"]] == ["alice", "albert"]
+
+def test_metrics(app, client, caplog, monkeypatch):
+    metrics = app.extensions["metrics"]
+    client.post("/register", json={
+        "username": "admin",
+        "email": "admin@example.com",
+        "password": "password123"
+    })
+    user = User.query.filter_by(email="admin@example.com").first()
+    user.is_admin = True
+    db.session.commit()
+    headers = {"Authorization": f"Bearer {create_access_token(identity=user.email)}"}
+    client.get("/polls", headers=headers)
+
+    # Every threshold crossed, so the request and its queries are logged
+    monkeypatch.setattr(metrics, "slow_request", 0)
+    monkeypatch.setattr(metrics, "slow_query", 0)
+    with caplog.at_level("WARNING"):
+        client.get("/polls?limit=10", headers=headers)
+    assert any(r.message.startswith("slow request: GET /polls") for r in caplog.records)
+    assert any(r.message.startswith("slow query") for r in caplog.records)
+
+    response = client.get("/metrics", headers=headers)
+    assert response.status_code == 200
+    assert response.mimetype == "text/plain"
+    body = response.get_data(as_text=True)
+    assert 'http_request_duration_seconds_count{method="GET",route="/polls"} 2' in body
+    assert 'http_request_duration_seconds_bucket{method="GET",route="/polls",le="+Inf"} 2' in body
+    assert 'http_responses_total{method="POST",route="/register",status="201"} 1' in body
+    assert "tally_cache_hits_total" in body
+    # /polls reads at least the polls page
+    count = float(body.split('http_request_db_queries_sum{method="GET",route="/polls"} ')[1].split()[0])
+    assert count >= 2
+
+def test_metrics_not_admin(client):
+    client.post("/register", json={
+        "username": "user",
+        "email": "user@example.com",
+        "password": "password123"
+    })
+    access_token = create_access_token(identity="user@example.com")
+    response = client.get("/metrics", headers={"Authorization": f"Bearer {access_token}"})
+    assert response.status_code == 403
+
+def test_bulk_import(client):
+    client.post("/register", json={
+        "username": "admin",
+        "email": "admin@example.com",
+        "password": "password123"
+    })
+    user = User.query.filter_by(email="admin@example.com").first()
+    user.is_admin = True
+    db.session.commit()
+    headers = {"Authorization": f"Bearer {create_access_token(identity=user.email)}"}
+
+    # Users as JSON: bad and duplicate rows are reported, the rest created
+    response = client.post("/admin/import/users", headers=headers, json={"users": [
+        {"username": "alice", "email": "alice@example.com", "password": "pw1"},
+        {"username": "bob", "email": "bob@example.com"},
+        {"username": "admin", "email": "other@example.com", "password": "pw2"},
+        {"username": "alice2", "email": "alice@example.com", "password": "pw3"},
+        {"username": "carol", "email": "carol@example.com", "password": "pw4", "is_admin": True},
+        {"username": "dave", "email": "dave@example.com", "password": "pw5", "is_admin": "false"},
+    ]})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["created"] == 2
+    assert [(e["index"], e["msg"]) for e in data["errors"]] == [
+        (1, "Missing required fields"),
+        (2, "Username or email already in use"),
+        (3, "Duplicate username or email in file"),
+        (5, "is_admin must be true or false"),
+    ]
+    assert User.query.filter_by(username="dave").first() is None
+    assert User.query.filter_by(email="carol@example.com").first().is_admin
+    login = client.post("/login", json={"email": "alice@example.com", "password": "pw1"})
+    assert login.status_code == 200
+
+    # Polls as CSV, one column per option
+    csv_body = "question,option1,option2,option3\nTabs or spaces?,Tabs,Spaces,\nOnly one?,Yes,,\nCats or dogs?,Cats,Dogs,Both\n"
+    response = client.post("/admin/import/polls", headers={**headers, "Content-Type": "text/csv"}, data=csv_body)
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data["created"] == 2
+    assert [e["index"] for e in data["errors"]] == [1]
+    polls = {p["question"]: [o["text"] for o in p["options"]] for p in client.get("/polls", headers=headers).get_json()["polls"]}
+    assert polls == {"Tabs or spaces?": ["Tabs", "Spaces"], "Cats or dogs?": ["Cats", "Dogs", "Both"]}
+    assert sorted(data["poll_ids"]) == sorted(poll.id for poll in Poll.query.all())
+
+    # Unreadable files are rejected as a whole
+    response = client.post("/admin/import/polls", headers={**headers, "Content-Type": "application/json"}, data="{")
+    assert response.status_code == 400
+
+def test_import_cli(app, client, tmp_path):
+    client.post("/register", json={
+        "username": "admin",
+        "email": "admin@example.com",
+        "password": "password123"
+    })
+    path = tmp_path / "polls.json"
+    path.write_text(json.dumps([
+        {"question": "Best editor?", "options": ["vim", "emacs"]},
+        {"question": "No options?"},
+    ]))
+    result = app.test_cli_runner().invoke(args=["import", "polls", str(path), "--creator", "admin@example.com"])
+    assert result.exit_code == 0, result.output
+    assert "created 1, rejected 1" in result.output
+    assert [o.text for o in Poll.query.filter_by(question="Best editor?").one().options] == ["vim", "emacs"]
+
+def test_import_polls_reports_failed_batches(app, client, monkeypatch):
+    import importer
+    from sqlalchemy.exc import OperationalError
+    client.post("/register", json={"username": "admin", "email": "admin@example.com", "password": "password123"})
+    admin = User.query.one()
+
+    # the second of three batches fails after its inserts
+    record_changes = importer.record_changes
+    def fail_second_batch(ids, kind):
+        if any(db.session.get(Poll, poll_id).question == "Two?" for poll_id in ids):
+            raise OperationalError("INSERT", {}, Exception("database is locked"))
+        record_changes(ids, kind)
+    monkeypatch.setattr(importer, "record_changes", fail_second_batch)
+    report = importer.import_polls([
+        {"question": question, "options": [f"{question} a", f"{question} b"]} for question in ["One?", "Two?", "Three?"]
+    ], admin.id, batch_size=1)
+    assert report["created"] == 2
+    assert report["errors"] == [{"index": 1, "msg": "Could not be saved, please retry"}]
+    for poll_id in report["poll_ids"]:
+        poll = db.session.get(Poll, poll_id)
+        assert [o.text for o in poll.options] == [f"{poll.question} a", f"{poll.question} b"]
+    assert sorted(p.question for p in Poll.query.all()) == ["One?", "Three?"]
+
+def test_poll_timeline(client):
+    client.post("/register", json={
+        "username": "admin",
+        "email": "admin@example.com",
+        "password": "password123"
+    })
+    user = User.query.filter_by(email="admin@example.com").first()
+    user.is_admin = True
+    db.session.commit()
+    headers = {"Authorization": f"Bearer {create_access_token(identity=user.email)}"}
+    client.post("/create-poll", json={"question": "Tea or coffee?", "options": ["Tea", "Coffee"]}, headers=headers)
+    poll = Poll.query.first()
+    tea, coffee = [option.id for option in poll.options]
+
+    # One vote through each write path
+    client.post("/register", json={"username": "voter", "email": "voter@example.com", "password": "password123"})
+    voter = {"Authorization": f"Bearer {create_access_token(identity='voter@example.com')}"}
+    assert client.post(f"/vote/{poll.id}", json={"optionId": tea}, headers=voter).status_code == 201
+    response = client.post("/vote/batch", json={"votes": [{"pollId": poll.id, "optionId": coffee}]}, headers=headers)
+    assert response.get_json()["accepted"] == 1
+
+    # Both votes land in the current minute and hour buckets
+    for resolution in ["minute", "hour"]:
+        response = client.get(f"/poll-timeline/{poll.id}?resolution={resolution}", headers=headers)
+        assert response.status_code == 200
+        data = response.get_json()
+        assert [option["text"] for option in data["options"]] == ["Tea", "Coffee"]
+        assert len(data["buckets"]) == 1
+        assert data["buckets"][0]["counts"] == {str(tea): 1, str(coffee): 1}
+    assert VoteRollup.query.count() == 4
+
+    # Range and parameter checks
+    data = client.get(f"/poll-timeline/{poll.id}?since=2020-01-01T00:00:00&until=2020-01-02T00:00:00", headers=headers).get_json()
+    assert data["buckets"] == []
+    assert client.get(f"/poll-timeline/{poll.id}?resolution=second", headers=headers).status_code == 400
+    assert client.get(f"/poll-timeline/{poll.id}?resolution=minute&since=2020-01-01T00:00:00", headers=headers).status_code == 400
+    assert client.get("/poll-timeline/999", headers=headers).status_code == 404
+    assert client.get(f"/poll-timeline/{poll.id}", headers=voter).status_code == 403
+
+    # Deleting the poll drops its rollups
+    client.delete(f"/delete-poll/{poll.id}", headers=headers)
+    assert VoteRollup.query.count() == 0
+
+def test_my_votes(client):
+    client.post("/register", json={
+        "username": "admin",
+        "email": "admin@example.com",
+        "password": "password123"
+    })
+    user = User.query.filter_by(email="admin@example.com").first()
+    user.is_admin = True
+    db.session.commit()
+    headers = {"Authorization": f"Bearer {create_access_token(identity=user.email)}"}
+    for question in ["First?", "Second?", "Third?"]:
+        client.post("/create-poll", json={"question": question, "options": ["Yes", "No"]}, headers=headers)
+    polls = [(poll.id, poll.options[1].id) for poll in Poll.query.order_by(Poll.id)]
+    for poll_id, option_id in polls[:2]:
+        client.post(f"/vote/{poll_id}", json={"optionId": option_id}, headers=headers)
+        time.sleep(0.01)
+
+    # Newest first, with the question and chosen option
+    response = client.get("/my-votes?limit=1", headers=headers)
+    assert response.status_code == 200
+    data = response.get_json()
+    assert [(v["question"], v["option"]) for v in data["votes"]] == [("Second?", "No")]
+    assert data["voted_poll_ids"] == [polls[0][0], polls[1][0]]
+    data = client.get(f"/my-votes?limit=1&cursor={data['next_cursor']}", headers=headers).get_json()
+    assert [v["question"] for v in data["votes"]] == ["First?"]
+    assert data["next_cursor"] is None
+    assert "voted_poll_ids" not in data
+
+    # Other users only see their own votes
+    client.post("/register", json={"username": "other", "email": "other@example.com", "password": "password123"})
+    other = {"Authorization": f"Bearer {create_access_token(identity='other@example.com')}"}
+    assert client.get("/my-votes", headers=other).get_json() == {"votes": [], "next_cursor": None, "voted_poll_ids": []}
+    assert client.get("/my-votes?cursor=bogus", headers=other).status_code == 400
+
+def test_multiple_choice_vote(client):
+    client.post("/register", json={
+        "username": "admin",
+        "email": "admin@example.com",
+        "password": "password123"
+    })
+    user = User.query.filter_by(email="admin@example.com").first()
+    user.is_admin = True
+    db.session.commit()
+    headers = {"Authorization": f"Bearer {create_access_token(identity=user.email)}"}
+    response = client.post("/create-poll", json={
+        "question": "Which languages do you use?", "options": ["Python", "Go", "Rust"], "is_multiple_choice": True
+    }, headers=headers)
+    assert response.get_json()["poll"]["is_multiple_choice"] is True
+    response = client.post("/create-poll", json={"question": "Q?", "options": ["A", "B"], "is_multiple_choice": "false"},
+                           headers=headers)
+    assert (response.status_code, response.get_json()["msg"]) == (400, "is_multiple_choice must be true or false")
+    client.post("/create-poll", json={"question": "Favourite?", "options": ["Python", "Go"]}, headers=headers)
+    multi, single = Poll.query.order_by(Poll.id).all()
+    python, go, rust = [option.id for option in multi.options]
+    single_id, single_options = single.id, [option.id for option in single.options]
+    multi_id = multi.id
+
+    # Several options in one request, counted once each
+    response = client.post(f"/vote/{multi_id}", json={"optionIds": [python, rust, python]}, headers=headers)
+    assert response.status_code == 201
+    polls = {p["id"]: p for p in client.get("/polls", headers=headers).get_json()["polls"]}
+    assert polls[multi_id]["is_multiple_choice"] is True
+    assert [o["votes"] for o in polls[multi_id]["options"]] == [1, 0, 1]
+
+    # Another option later is fine, the same option twice is not
+    assert client.post(f"/vote/{multi_id}", json={"optionId": go}, headers=headers).status_code == 201
+    response = client.post(f"/vote/{multi_id}", json={"optionIds": [python]}, headers=headers)
+    assert response.status_code == 400
+    assert response.get_json()["msg"] == "User has already voted for one of these options"
+    # an option from another poll fails the whole selection
+    response = client.post(f"/vote/{multi_id}", json={"optionIds": [single_options[0]]}, headers=headers)
+    assert response.status_code == 404
+    assert Vote.query.filter_by(poll_id=multi_id).count() == 3
+
+    # Option ids are JSON integers: no strings, floats or booleans
+    for body in [{"optionIds": str(single_options[0])}, {"optionIds": [float(single_options[0])]},
+                 {"optionId": str(single_options[0])}, {"optionId": True}, {"optionIds": []}]:
+        response = client.post(f"/vote/{single_id}", json=body, headers=headers)
+        assert (response.status_code, response.get_json()["msg"]) == (400, "Invalid option"), body
+
+    # Single-choice polls still take one option, once
+    response = client.post(f"/vote/{single_id}", json={"optionIds": single_options}, headers=headers)
+    assert response.status_code == 400
+    assert response.get_json()["msg"] == "This poll accepts only one option"
+    assert client.post(f"/vote/{single_id}", json={"optionId": single_options[0]}, headers=headers).status_code == 201
+    response = client.post(f"/vote/{single_id}", json={"optionId": single_options[1]}, headers=headers)
+    assert response.get_json()["msg"] == "User has already voted on this poll"
+
+    # Batch follows the same rules
+    client.post("/register", json={"username": "voter", "email": "voter@example.com", "password": "password123"})
+    voter = {"Authorization": f"Bearer {create_access_token(identity='voter@example.com')}"}
+    response = client.post("/vote/batch", json={"votes": [
+        {"pollId": multi_id, "optionId": python},
+        {"pollId": multi_id, "optionId": go},
+        {"pollId": multi_id, "optionId": go},
+        {"pollId": single_id, "optionId": single_options[0]},
+        {"pollId": single_id, "optionId": single_options[1]},
+    ]}, headers=voter)
+    assert [r["status"] for r in response.get_json()["results"]] == [201, 201, 400, 201, 400]
+    assert client.get("/my-votes", headers=voter).get_json()["voted_poll_ids"] == [multi_id, single_id]
+
+def test_create_app_gives_separate_apps():
+    from app import create_app
+    first, second = create_app("testing"), create_app("testing")
+    # nothing in-process is shared either
+    for name in ["tally_cache", "data_versions", "user_cache", "password_hasher", "socketio", "tally_broadcaster", "metrics"]:
+        assert first.extensions[name] is not second.extensions[name], name
+    first.extensions["tally_cache"].put(1, 1, "One?", [])
+    assert second.extensions["tally_cache"].get(1, 1) is None
+    with first.app_context():
+        db.create_all()
+        db.session.add(User(username="solo", email="solo@example.com", password="x"))
+        db.session.commit()
+        assert User.query.count() == 1
+    with second.app_context():
+        db.create_all()
+        assert User.query.count() == 0
+
+def test_vote_journal(tmp_path, monkeypatch):
+    from app import create_app
+    from config import TestingConfig
+    from journal import current_journal
+    monkeypatch.setattr(TestingConfig, "SQLALCHEMY_DATABASE_URI", f"sqlite:///{tmp_path / 'journal.db'}")
+    monkeypatch.setattr(TestingConfig, "VOTE_INGEST_MODE", "journal")
+    monkeypatch.setattr(TestingConfig, "VOTE_JOURNAL_PATH", str(tmp_path / "votes.jsonl"))
+    monkeypatch.setattr(TestingConfig, "VOTE_JOURNAL_INTERVAL", 0)  # compact by hand
+
+    app = create_app("testing")
+    with app.app_context():
+        db.create_all()
+    client = app.test_client()
+    for name in ["admin", "voter1", "voter2"]:
+        client.post("/register", json={"username": name, "email": f"{name}@example.com", "password": "password123"})
+    with app.app_context():
+        User.query.filter_by(username="admin").one().is_admin = True
+        db.session.commit()
+        headers = {name: {"Authorization": f"Bearer {create_access_token(identity=f'{name}@example.com')}"}
+                   for name in ["admin", "voter1", "voter2"]}
+    poll = client.post("/create-poll", json={"question": "Cats or dogs?", "options": ["Cats", "Dogs"]},
+                       headers=headers["admin"]).get_json()["poll"]
+    option_id = poll["options"][0]["id"]
+
+    # Accepted straight away, repeats rejected before anything is in the database
+    response = client.post(f"/vote/{poll['id']}", json={"optionId": option_id}, headers=headers["voter1"])
+    assert response.status_code == 202
+    response = client.post(f"/vote/{poll['id']}", json={"optionId": option_id}, headers=headers["voter1"])
+    assert response.status_code == 400
+    assert response.get_json()["msg"] == "User has already voted on this poll"
+    with app.app_context():
+        assert Vote.query.count() == 0
+        assert current_journal().compact() == 1
+        assert Vote.query.count() == 1
+        assert db.session.get(Option, option_id).votes == 1
+    data = client.get(f"/poll-results/{poll['id']}", headers=headers["admin"]).get_json()
+    assert data["results"][0]["votes"] == 1
+
+    # A restarted app rebuilds the index from the database and the unapplied journal
+    client.post(f"/vote/{poll['id']}", json={"optionId": option_id}, headers=headers["voter2"])
+    restarted = create_app("testing")
+    client = restarted.test_client()
+    for name in ["voter1", "voter2"]:
+        response = client.post(f"/vote/{poll['id']}", json={"optionId": option_id}, headers=headers[name])
+        assert response.status_code == 400
+    with restarted.app_context():
+        assert current_journal().compact() == 1
+        assert db.session.get(Option, option_id).votes == 2
+
+    # Batches go through the journal as well
+    response = client.post("/vote/batch", json={"votes": [
+        {"pollId": poll["id"], "optionId": option_id, "userId": 1}, {"pollId": poll["id"], "optionId": option_id, "userId": 2}
+    ]}, headers=headers["admin"])
+    assert [r["status"] for r in response.get_json()["results"]] == [202, 400]
+
+    # A vote arriving while the poll closes is turned away, not journaled for a closed poll
+    import lifecycle
+    close = lifecycle._close
+    def vote_during_close(poll_id, now):
+        response = client.post(f"/vote/{poll_id}", json={"optionId": option_id}, headers=headers["admin"])
+        assert response.status_code == 409
+        return close(poll_id, now)
+    monkeypatch.setattr(lifecycle, "_close", vote_during_close)
+    response = client.post(f"/close-poll/{poll['id']}", headers=headers["admin"])
+    assert response.status_code == 200
+    response = client.post(f"/vote/{poll['id']}", json={"optionId": option_id}, headers=headers["admin"])
+    assert response.get_json()["msg"] == "Poll is closed"
+    with restarted.app_context():
+        assert current_journal().compact() == 0
+
+def test_changes_feed(client):
+    client.post("/register", json={
+        "username": "admin",
+        "email": "admin@example.com",
+        "password": "password123"
+    })
+    user = User.query.filter_by(email="admin@example.com").first()
+    user.is_admin = True
+    db.session.commit()
+    headers = {"Authorization": f"Bearer {create_access_token(identity=user.email)}"}
+    first = client.post("/create-poll", json={"question": "Tea?", "options": ["Yes", "No"]}, headers=headers).get_json()["poll"]
+    second = client.post("/create-poll", json={"question": "Coffee?", "options": ["Yes", "No"]}, headers=headers).get_json()["poll"]
+
+    # The starting token sees nothing until something changes
+    token = client.get("/changes", headers=headers).get_json()["token"]
+    data = client.get(f"/changes?since={token}", headers=headers).get_json()
+    assert (data["polls"], data["tallies"], data["deleted"], data["token"]) == ([], [], [], token)
+
+    # A vote sends the tallies only, an edit the whole poll, a delete the id
+    client.post(f"/vote/{first['id']}", json={"optionId": first["options"][0]["id"]}, headers=headers)
+    third = client.post("/create-poll", json={"question": "Juice?", "options": ["Yes", "No"]}, headers=headers).get_json()["poll"]
+    client.delete(f"/delete-poll/{second['id']}", headers=headers)
+    data = client.get(f"/changes?since={token}", headers=headers).get_json()
+    assert data["tallies"] == [{"id": first["id"], "options": [
+        {"id": first["options"][0]["id"], "votes": 1}, {"id": first["options"][1]["id"], "votes": 0}
+    ]}]
+    assert data["deleted"] == [second["id"]]
+    assert [poll["id"] for poll in data["polls"]] == [third["id"]]
+    assert data["polls"][0]["options"][0] == {"id": third["options"][0]["id"], "text": "Yes", "votes": 0}
+
+    # Pages of changes, oldest first
+    page = client.get(f"/changes?since={token}&limit=1", headers=headers).get_json()
+    assert page["has_more"] and page["tallies"][0]["id"] == first["id"]
+    page = client.get(f"/changes?since={page['token']}&limit=2", headers=headers).get_json()
+    assert not page["has_more"] and page["token"] == data["token"]
+
+    assert client.get("/changes?since=nope", headers=headers).status_code == 400
+
+def test_poll_lifecycle(app, client):
+    from datetime import timedelta
+    from lifecycle import close_expired, utcnow
+    client.post("/register", json={
+        "username": "admin",
+        "email": "admin@example.com",
+        "password": "password123"
+    })
+    user = User.query.filter_by(email="admin@example.com").first()
+    user.is_admin = True
+    db.session.commit()
+    headers = {"Authorization": f"Bearer {create_access_token(identity=user.email)}"}
+    closes_at = (utcnow() + timedelta(hours=1)).isoformat()
+    poll = client.post("/create-poll", json={
+        "question": "Tea?", "options": ["Yes", "No"], "closes_at": closes_at
+    }, headers=headers).get_json()["poll"]
+    assert poll["closes_at"] == closes_at and poll["closed_at"] is None
+    later = client.post("/create-poll", json={
+        "question": "Lunch?", "options": ["Yes", "No"], "opens_at": closes_at
+    }, headers=headers).get_json()["poll"]
+    assert client.post("/create-poll", json={
+        "question": "Late?", "options": ["Yes", "No"], "closes_at": "2000-01-01T00:00:00"
+    }, headers=headers).status_code == 400
+
+    # Upcoming polls don't take votes yet and aren't listed as open
+    response = client.post(f"/vote/{later['id']}", json={"optionId": later["options"][0]["id"]}, headers=headers)
+    assert (response.status_code, response.get_json()["msg"]) == (400, "Poll is not open yet")
+    assert [p["id"] for p in client.get("/polls", headers=headers).get_json()["polls"]] == [poll["id"]]
+    assert [p["id"] for p in client.get("/polls?status=upcoming", headers=headers).get_json()["polls"]] == [later["id"]]
+    assert client.get("/polls?status=bogus", headers=headers).status_code == 400
+
+    assert client.post(f"/vote/{poll['id']}", json={"optionId": poll["options"][0]["id"]}, headers=headers).status_code == 201
+    client.get(f"/poll-results/{poll['id']}", headers=headers)
+
+    # Past closes_at the scheduler closes the poll: its votes move to the archive
+    assert close_expired(utcnow() + timedelta(hours=2)) == [poll["id"]]
+    assert Vote.query.count() == 0
+    assert [(v.poll_id, v.option_id) for v in ArchivedVote.query] == [(poll["id"], poll["options"][0]["id"])]
+    response = client.post(f"/vote/{poll['id']}", json={"optionId": poll["options"][1]["id"]}, headers=headers)
+    assert (response.status_code, response.get_json()["msg"]) == (400, "Poll is closed")
+    assert client.patch(f"/edit-poll/{poll['id']}", json={"question": "Coffee?"}, headers=headers).status_code == 400
+    assert client.post(f"/close-poll/{poll['id']}", headers=headers).status_code == 400
+    assert [p["id"] for p in client.get("/polls?status=closed", headers=headers).get_json()["polls"]] == [poll["id"]]
+
+    # Frozen results: revalidating is a 304 for as long as the poll exists
+    response = client.get(f"/poll-results/{poll['id']}", headers=headers)
+    assert response.headers["Cache-Control"] == "private, no-cache"
+    assert response.get_json()["results"] == [{"option": "Yes", "votes": 1}, {"option": "No", "votes": 0}]
+    assert response.get_json()["closed_at"]
+    again = client.get(f"/poll-results/{poll['id']}", headers={**headers, "If-None-Match": response.headers["ETag"]})
+    assert again.status_code == 304
+
+    # Vote history and export still include archived votes
+    data = client.get("/my-votes", headers=headers).get_json()
+    assert [v["question"] for v in data["votes"]] == ["Tea?"]
+    assert data["voted_poll_ids"] == [poll["id"]]
+    export = client.get(f"/admin/export/votes/{poll['id']}?format=ndjson", headers=headers)
+    assert [json.loads(line)["option_id"] for line in export.get_data(as_text=True).splitlines()] == [poll["options"][0]["id"]]
+
+    # Admins can close a poll early; deleting a closed poll removes its archive
+    response = client.post(f"/close-poll/{later['id']}", headers=headers)
+    assert response.status_code == 200 and response.get_json()["results"]["question"] == "Lunch?"
+    assert client.delete(f"/delete-poll/{poll['id']}", headers=headers).status_code == 200
+    assert ArchivedVote.query.count() == 0
+
+    # A worker that cached a snapshot finds the poll gone; the id isn't handed out again
+    stale = client.get(f"/poll-results/{later['id']}", headers=headers).get_data()
+    assert client.delete(f"/delete-poll/{later['id']}", headers=headers).status_code == 200
+    app.extensions["data_versions"].put_body(("snapshot", later["id"]), stale)
+    assert client.get(f"/poll-results/{later['id']}", headers=headers).status_code == 404
+    new = client.post("/create-poll", json={"question": "New?", "options": ["Yes", "No"]}, headers=headers).get_json()["poll"]
+    assert new["id"] > later["id"]
+
+def test_edit_poll_closed_meanwhile(client, monkeypatch):
+    import routes
+    from contextlib import contextmanager
+    from lifecycle import close_poll
+    client.post("/register", json={"username": "admin", "email": "admin@example.com", "password": "password123"})
+    admin = User.query.one()
+    admin.is_admin = True
+    db.session.commit()
+    headers = {"Authorization": f"Bearer {create_access_token(identity=admin.email)}"}
+    poll = client.post("/create-poll", json={"question": "Tea?", "options": ["Yes", "No"]}, headers=headers).get_json()["poll"]
+    client.post(f"/vote/{poll['id']}", json={"optionId": poll["options"][0]["id"]}, headers=headers)
+
+    # The scheduler closes the poll after the edit looked it up: its archived votes stay
+    @contextmanager
+    def closed_first(poll_id):
+        close_poll(poll_id)
+        yield
+    monkeypatch.setattr(routes, "blocking_votes", closed_first)
+    response = client.patch(f"/edit-poll/{poll['id']}", json={"options": ["A", "B"]}, headers=headers)
+    assert (response.status_code, response.get_json()["msg"]) == (400, "Poll is closed")
+    assert ArchivedVote.query.count() == 1
+    assert [o.text for o in Option.query.order_by(Option.id)] == ["Yes", "No"]
+
+def test_delete_poll_cascades(app, client, monkeypatch):
+    from lifecycle import close_poll, purge_deleted
+    client.post("/register", json={
+        "username": "admin",
+        "email": "admin@example.com",
+        "password": "password123"
+    })
+    admin = User.query.filter_by(email="admin@example.com").first()
+    admin.is_admin = True
+    db.session.add_all([User(username=f"voter{i}", email=f"voter{i}@example.com", password="x") for i in range(5)])
+    db.session.commit()
+    headers = {"Authorization": f"Bearer {create_access_token(identity=admin.email)}"}
+    voter_ids = [user.id for user in User.query.filter(User.username != "admin")]
+
+    def poll_with_votes(question, voters):
+        poll = client.post("/create-poll", json={"question": question, "options": ["Yes", "No"]}, headers=headers).get_json()["poll"]
+        client.post("/vote/batch", json={"votes": [
+            {"userId": user_id, "pollId": poll["id"], "optionId": poll["options"][0]["id"]} for user_id in voters
+        ]}, headers=headers)
+        return poll
+
+    # A small poll goes in one statement; the database removes the rest
+    small = poll_with_votes("Small?", voter_ids[:2])
+    close_poll(small["id"])
+    response = client.delete(f"/delete-poll/{small['id']}", headers=headers)
+    assert response.get_json()["background"] is False
+    for model in (Option, Vote, ArchivedVote, VoteRollup, PollSnapshot):
+        assert model.query.count() == 0, model
+
+    # A poll with more votes than a chunk disappears now, its rows go in chunks later
+    monkeypatch.setitem(app.config, "POLL_DELETE_CHUNK_SIZE", 2)
+    keep = poll_with_votes("Keep?", voter_ids[:1])
+    large = poll_with_votes("Large?", voter_ids)
+    response = client.delete(f"/delete-poll/{large['id']}", headers=headers)
+    assert response.get_json()["background"] is True
+    assert [poll["id"] for poll in client.get("/polls", headers=headers).get_json()["polls"]] == [keep["id"]]
+    assert client.get(f"/poll-results/{large['id']}", headers=headers).status_code == 404
+    vote = client.post(f"/vote/{large['id']}", json={"optionId": large["options"][1]["id"]}, headers=headers)
+    assert vote.status_code == 404
+    assert Vote.query.filter_by(poll_id=large["id"]).count() == 5
+
+    assert purge_deleted() == [large["id"]]
+    assert db.session.get(Poll, large["id"]) is None
+    assert Option.query.filter_by(poll_id=large["id"]).count() == 0
+    assert VoteRollup.query.filter_by(poll_id=large["id"]).count() == 0
+    assert [vote.poll_id for vote in Vote.query] == [keep["id"]]
+
+def test_reconcile_tallies(app, client):
+    from reconcile import reconcile
+    client.post("/register", json={
+        "username": "admin",
+        "email": "admin@example.com",
+        "password": "password123"
+    })
+    admin = User.query.filter_by(email="admin@example.com").first()
+    admin.is_admin = True
+    db.session.commit()
+    headers = {"Authorization": f"Bearer {create_access_token(identity=admin.email)}"}
+    first, second = [
+        client.post("/create-poll", json={"question": question, "options": ["Yes", "No"]}, headers=headers).get_json()["poll"]
+        for question in ["Tea?", "Coffee?"]
+    ]
+    client.post(f"/vote/{first['id']}", json={"optionId": first["options"][0]["id"]}, headers=headers)
+    report = reconcile()
+    assert (report["checked_polls"], report["corrections"]) == (2, [])
+    assert reconcile()["checked_polls"] == 0
+
+    # Drifted counters: only the poll changed since the last run is rechecked
+    for poll in (first, second):
+        db.session.execute(Option.__table__.update().where(Option.id == poll["options"][1]["id"]).values(votes=7))
+    db.session.commit()
+    voter = User(username="voter", email="voter@example.com", password="x")
+    db.session.add(voter)
+    db.session.commit()
+    client.post("/vote/batch", json={"votes": [
+        {"userId": voter.id, "pollId": first["id"], "optionId": first["options"][0]["id"]}
+    ]}, headers=headers)
+    client.get(f"/poll-results/{first['id']}", headers=headers)
+    report = reconcile()
+    assert report["checked_polls"] == 1
+    assert report["corrections"] == [{"poll_id": first["id"], "option_id": first["options"][1]["id"], "was": 7, "votes": 0}]
+    results = client.get(f"/poll-results/{first['id']}", headers=headers).get_json()["results"]
+    assert [r["votes"] for r in results] == [2, 0]
+
+    # A full run finds drift that no change was recorded for
+    result = app.test_cli_runner().invoke(args=["tallies", "reconcile", "--full"])
+    assert f"poll {second['id']} option {second['options'][1]['id']}: 7 -> 0" in result.output
+    assert "corrected 1 counters" in result.output
+    assert reconcile(full=True)["corrections"] == []
+
+def test_polls_listing_follows_open_and_close_times(client, monkeypatch):
+    from datetime import timedelta
+    import routes
+    from lifecycle import utcnow
+    client.post("/register", json={
+        "username": "admin",
+        "email": "admin@example.com",
+        "password": "password123"
+    })
+    user = User.query.filter_by(email="admin@example.com").first()
+    user.is_admin = True
+    db.session.commit()
+    headers = {"Authorization": f"Bearer {create_access_token(identity=user.email)}"}
+    start = utcnow()
+    poll = client.post("/create-poll", json={
+        "question": "Tea?", "options": ["Yes", "No"], "closes_at": (start + timedelta(minutes=1)).isoformat()
+    }, headers=headers).get_json()["poll"]
+    response = client.get("/polls", headers=headers)
+    assert [p["id"] for p in response.get_json()["polls"]] == [poll["id"]]
+
+    # Nothing is written when closes_at passes, but the list and its ETag still change
+    monkeypatch.setattr(routes, "utcnow", lambda: start + timedelta(minutes=2))
+    again = client.get("/polls", headers={**headers, "If-None-Match": response.headers["ETag"]})
+    assert again.status_code == 200
+    assert again.get_json()["polls"] == []
@@ -0,0 +1,44 @@
+# versions.py
+# encoded response bodies for conditional GETs, per process. The ETags come from
+# the database's poll change log (changes.py), which every worker writes to, so
+# a body is cached under its version and no worker can serve an outdated one
+from collections import OrderedDict
+from threading import Lock
+
+
+class DataVersions:
+    def __init__(self, app=None, max_bodies=256):
+        self.max_bodies = max_bodies
+        self._bodies = OrderedDict()  # cache key -> encoded body
+        self._lock = Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        self.max_bodies = app.config.get("RESPONSE_CACHE_SIZE", self.max_bodies)
+        self.clear()
+        app.extensions["data_versions"] = self
+
+    def get_body(self, key):
+        with self._lock:
+            body = self._bodies.get(key)
+            if body is not None:
+                self._bodies.move_to_end(key)
+            return body
+
+    def put_body(self, key, body):
+        # key must include the ETag, so a new version never sees an old body
+        with self._lock:
+            self._bodies[key] = body
+            self._bodies.move_to_end(key)
+            while len(self._bodies) > self.max_bodies:
+                self._bodies.popitem(last=False)
+
+    def discard_body(self, key):
+        # for bodies cached under a key without a version, like closed poll snapshots
+        with self._lock:
+            self._bodies.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._bodies.clear()
@@ -0,0 +1,149 @@
+# voting.py
+# set-wise vote recording shared by the batch endpoint, plus the bookkeeping
+# every committed change needs (tally cache, live updates)
+from collections import Counter
+from datetime import datetime, timezone
+from sqlalchemy import bindparam, func, insert, select, update
+from sqlalchemy.exc import IntegrityError
+from extensions import db, tally_cache, broadcaster
+from models import User, Poll, Option, Vote
+from rollups import record_votes
+from changes import record_changes
+
+# rows written concurrently can make a validated batch hit the unique constraint,
+# in which case validation is redone against the newly committed votes
+BATCH_ATTEMPTS = 3
+
+# Poll.status_at of a poll not taking votes -> (status, message)
+POLL_NOT_OPEN = {
+    "closed": (400, "Poll is closed"),
+    "upcoming": (400, "Poll is not open yet"),
+}
+
+option_table = Option.__table__
+
+
+def votes_committed(counts):
+    # counts maps (poll id, option id) -> number of new votes. Cached tallies and
+    # ETags follow the versions record_changes stamped in the same transaction
+    for (poll_id, option_id), count in counts.items():
+        broadcaster.record(poll_id, option_id, count)
+
+
+def poll_changed(poll_id, event):
+    # a poll was edited or deleted
+    tally_cache.invalidate(poll_id)
+    broadcaster.announce(event, poll_id)
+
+
+def apply_votes(rows):
+    # insert vote rows with their option counts and rollups, without committing;
+    # returns (poll id, option id) -> number of votes
+    counts = Counter((row["poll_id"], row["option_id"]) for row in rows)
+    db.session.execute(insert(Vote), rows)
+    # one grouped increment per option, not one per vote
+    db.session.execute(
+        update(option_table)
+        .where(option_table.c.id == bindparam("option_key"))
+        .values(votes=option_table.c.votes + bindparam("count")),
+        [{"option_key": option_id, "count": count} for (_, option_id), count in counts.items()]
+    )
+    record_votes((row["poll_id"], row["option_id"], row["timestamp"]) for row in rows)
+    record_changes(poll_id for poll_id, _ in counts)
+    return counts
+
+
+def cast_votes(selections, check_users=False, journal=None):
+    # selections is a list of (user id, poll id, option id), several options of a
+    # multiple-choice poll being several selections; returns one
+    # (status, msg) per selection, in order, after committing the accepted ones
+    # (or writing them to the vote journal, when there is one)
+    for attempt in range(BATCH_ATTEMPTS):
+        # the journal turns away votes for polls changed after this
+        epochs = journal.epochs({poll_id for _, poll_id, _ in selections}) if journal is not None else None
+        results, rows = _validate(selections, check_users)
+        if not rows:
+            return results
+        if journal is not None:
+            return _journal_results(results, rows, journal.append(rows, epochs))
+        try:
+            counts = apply_votes(rows)
+            db.session.commit()
+        except IntegrityError:
+            db.session.rollback()
+            if attempt == BATCH_ATTEMPTS - 1:
+                raise
+            continue
+        votes_committed(counts)
+        return results
+
+
+def _journal_results(results, rows, accepted):
+    # the validated votes go to the journal, which may still find some repeated
+    journaled = iter(zip(rows, accepted))
+    for index, (status, _) in enumerate(results):
+        if status != 201:
+            continue
+        row, ok = next(journaled)
+        if ok:
+            results[index] = (202, "Vote accepted")
+        elif ok is None:
+            results[index] = (409, "Poll changed, please retry")
+        elif row["is_multiple_choice"]:
+            results[index] = (400, "User has already voted for this option")
+        else:
+            results[index] = (400, "User has already voted on this poll")
+    return results
+
+
+def _validate(selections, check_users):
+    poll_ids = {poll_id for _, poll_id, _ in selections}
+    option_ids = {option_id for _, _, option_id in selections}
+    user_ids = {user_id for user_id, _, _ in selections}
+
+    # a handful of IN queries for the whole batch
+    polls = {row[0]: row[1:] for row in db.session.execute(
+        select(Poll.id, func.coalesce(Poll.is_multiple_choice, False), Poll.opens_at, Poll.closes_at, Poll.closed_at)
+        .where(Poll.id.in_(poll_ids), Poll.deleted_at.is_(None))
+    )}
+    option_polls = dict(db.session.execute(
+        select(Option.id, Option.poll_id).where(Option.id.in_(option_ids))
+    ).all())
+    users = set(db.session.scalars(select(User.id).where(User.id.in_(user_ids)))) if check_users else user_ids
+    # (poll, user) for single-choice votes, (poll, user, option) for multiple choice
+    voted = set()
+    for poll_id, user_id, option_id, multiple in db.session.execute(
+        select(Vote.poll_id, Vote.user_id, Vote.option_id, Vote.is_multiple_choice)
+        .where(Vote.poll_id.in_(poll_ids), Vote.user_id.in_(user_ids))
+    ):
+        voted.add((poll_id, user_id, option_id) if multiple else (poll_id, user_id))
+
+    now = datetime.now(timezone.utc)
+    results = []
+    rows = []
+    for user_id, poll_id, option_id in selections:
+        multiple, *times = polls.get(poll_id, (None, None, None, None))
+        status = Poll.status_at(*times, now.replace(tzinfo=None))
+        key = (poll_id, user_id, option_id) if multiple else (poll_id, user_id)
+        if user_id not in users:
+            results.append((404, "User not found"))
+        elif poll_id not in polls:
+            results.append((404, "Poll not found"))
+        elif option_polls.get(option_id) != poll_id:
+            results.append((404, "Option not found for this poll"))
+        elif status != "open":
+            results.append(POLL_NOT_OPEN[status])
+        elif key in voted:
+            if multiple:
+                results.append((400, "User has already voted for this option"))
+            else:
+                results.append((400, "User has already voted on this poll"))
+        else:
+            # later duplicates inside the same batch are rejected too
+            voted.add(key)
+            rows.append({
+                "poll_id": poll_id, "user_id": user_id, "option_id": option_id,
+                "timestamp": now, "is_multiple_choice": bool(multiple)
+            })
+            results.append((201, "Vote cast successfully"))
+    return results, rows
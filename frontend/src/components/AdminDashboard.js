@@ -1,15 +1,23 @@
-import { useEffect, useState } from "react";
+import { useEffect, useRef, useState } from "react";
 import { useNavigate } from "react-router-dom";
 import Navbar from "./Navbar";
+import { fetchChangeToken, fetchChanges } from "../pollChanges";
 
 const AdminDashboard = () => {
     const navigate = useNavigate();
     const [users, setUsers] = useState([]);
+    const [userSearch, setUserSearch] = useState("");
+    const [nextUserCursor, setNextUserCursor] = useState(null);
+    const [userTotal, setUserTotal] = useState(null);
     const [polls, setPolls] = useState([]);
+    const [nextPollCursor, setNextPollCursor] = useState(null);
     const [question, setQuestion] = useState("");
     const [options, setOptions] = useState(["", ""]);
+    const [isMultipleChoice, setIsMultipleChoice] = useState(false);
+    const [closesAt, setClosesAt] = useState("");
     const [message, setMessage] = useState("");
     const [selectedPollResult, setSelectedPollResult] = useState(null);
+    const changeTokenRef = useRef(null);
 
     useEffect(() => {
         const isAdmin = localStorage.getItem("is_admin");
@@ -28,24 +36,67 @@ const AdminDashboard = () => {
     const fetchAdminData = async () => {
         try {
             const token = localStorage.getItem("authToken");
-            const res = await fetch("http://localhost:5000/admin/users", {
-                headers: { Authorization: `Bearer ${token}` },
-            });
-
-            const userData = await res.json();
-            setUsers(userData);
+            await fetchUsers();
 
-            const pollsRes = await fetch("http://localhost:5000/polls", {
+            changeTokenRef.current = await fetchChangeToken();
+            // admins see closed and upcoming polls too
+            const pollsRes = await fetch("http://localhost:5000/polls?status=all", {
                 headers: { Authorization: `Bearer ${token}` },
             });
 
             const pollData = await pollsRes.json();
-            setPolls(pollData);
+            setPolls(pollData.polls);
+            setNextPollCursor(pollData.next_cursor);
         } catch (error) {
             console.error("Failed to load admin data");
         }
     };
 
+    // first page of users (optionally filtered), or the next page when a cursor is given
+    const fetchUsers = async (cursor = null, search = userSearch) => {
+        try {
+            const params = new URLSearchParams({ q: search });
+            if (cursor) {
+                params.set("cursor", cursor);
+            } else {
+                params.set("include_total", "true");
+            }
+            const res = await fetch(`http://localhost:5000/admin/users?${params}`, {
+                headers: { Authorization: `Bearer ${localStorage.getItem("authToken")}` },
+            });
+            const userData = await res.json();
+            setUsers((prevUsers) => cursor ? [...prevUsers, ...userData.users] : userData.users);
+            setNextUserCursor(userData.next_cursor);
+            if (!cursor) setUserTotal(userData.total);
+        } catch (error) {
+            console.error("Failed to load users");
+        }
+    };
+
+    // only the polls changed since the last load, instead of the whole list
+    const syncPolls = async () => {
+        try {
+            const { apply, token } = await fetchChanges(changeTokenRef.current);
+            changeTokenRef.current = token;
+            setPolls(apply);
+        } catch (error) {
+            fetchAdminData();
+        }
+    };
+
+    const fetchMorePolls = async () => {
+        try {
+            const res = await fetch(`http://localhost:5000/polls?status=all&cursor=${encodeURIComponent(nextPollCursor)}`, {
+                headers: { Authorization: `Bearer ${localStorage.getItem("authToken")}` },
+            });
+            const pollData = await res.json();
+            setPolls((prevPolls) => [...prevPolls, ...pollData.polls]);
+            setNextPollCursor(pollData.next_cursor);
+        } catch (error) {
+            console.error("Failed to load more polls");
+        }
+    };
+
     const fetchPollResult = async (pollId) => {
         try {
             const res = await fetch(`http://localhost:5000/poll-results/${pollId}`, {
@@ -95,7 +146,7 @@ const AdminDashboard = () => {
             const data = await res.json();
             if (res.ok) {
                 setMessage("Poll deleted successfully!");
-                fetchAdminData();
+                syncPolls();
             } else {
                 setMessage(data.msg || "Failed to delete poll.");
             }
@@ -105,6 +156,31 @@ const AdminDashboard = () => {
         }
     }
 
+    // freezes the results now instead of waiting for the closing time
+    const handleClosePoll = async (pollId) => {
+        if (!window.confirm("Close this poll? No more votes will be accepted.")) return;
+
+        try {
+            const res = await fetch(`http://localhost:5000/close-poll/${pollId}`, {
+                method: "POST",
+                headers: {
+                    Authorization: `Bearer ${localStorage.getItem("authToken")}`,
+                },
+            });
+            const data = await res.json();
+            if (res.ok) {
+                setMessage("Poll closed.");
+                setSelectedPollResult(data.results);
+                syncPolls();
+            } else {
+                setMessage(data.msg || "Failed to close poll.");
+            }
+        } catch (error) {
+            console.error("Error closing poll", error);
+            setMessage("Server error while closing");
+        }
+    };
+
     const handleSubmit = async (e) => {
         e.preventDefault();
         setMessage("");
@@ -121,7 +197,13 @@ const AdminDashboard = () => {
                     "Content-Type": "application/json",
                     "Authorization": `Bearer ${localStorage.getItem("authToken")}`,
                 },
-                body: JSON.stringify({ question, options }),
+                body: JSON.stringify({
+                    question,
+                    options,
+                    is_multiple_choice: isMultipleChoice,
+                    // the picker gives local time; the server wants an ISO timestamp
+                    closes_at: closesAt ? new Date(closesAt).toISOString() : undefined,
+                }),
             });
 
             const data = await response.json();
@@ -129,7 +211,9 @@ const AdminDashboard = () => {
                 setMessage("Poll created successfully!");
                 setQuestion("");
                 setOptions(["", ""]);
-                fetchAdminData();
+                setIsMultipleChoice(false);
+                setClosesAt("");
+                syncPolls();
                 setSelectedPollResult(null);
             } else {
                 if (response.status === 401 && data.msg === "Token has expired") {
@@ -170,16 +254,34 @@ const AdminDashboard = () => {
                         )}
                     </div>
                 ))}
+                <label>
+                    <input type="checkbox" checked={isMultipleChoice} onChange={(e) => setIsMultipleChoice(e.target.checked)} />
+                    Allow multiple choices
+                </label><br />
+                <label>
+                    Closes at (optional){" "}
+                    <input type="datetime-local" value={closesAt} onChange={(e) => setClosesAt(e.target.value)} />
+                </label><br />
                 <button type="button" onClick={addOption}>Add Option</button>
                 <button type="submit">Create Poll</button>
             </form>
 
-            <h2>Users</h2>
+            <h2>Users{userTotal !== null && ` (${userTotal})`}</h2>
+            <input
+                type="text"
+                placeholder="Search username or email"
+                value={userSearch}
+                onChange={(e) => {
+                    setUserSearch(e.target.value);
+                    fetchUsers(null, e.target.value);
+                }}
+            />
             <ul>
                 {users.map(user => (
                     <li key={user.id}>{user.username} - {user.email}</li>
                 ))}
             </ul>
+            {nextUserCursor && <button onClick={() => fetchUsers(nextUserCursor)}>Load More Users</button>}
 
             <h2>Polls</h2>
             {polls.length === 0 && <p>No polls found or failed to fetch.</p>}
@@ -188,15 +290,22 @@ const AdminDashboard = () => {
                 {polls.map(poll => (
                     <li key={poll.id}>
                         <strong>{poll.question}</strong>
+                        {poll.closed_at && " (closed)"}
                         <button onClick={() => fetchPollResult(poll.id)} style={{ marginLeft: "10px" }}>
                             View Results
                         </button>
+                        {!poll.closed_at && (
+                            <button onClick={() => handleClosePoll(poll.id)} style={{ marginLeft: "10px" }}>
+                                Close Now
+                            </button>
+                        )}
                         <button onClick={() => handleDeletePoll(poll.id)} style={{ marginLeft: "10px" }}>
                             Delete
                         </button>
                     </li>
                 ))}
             </ul>
+            {nextPollCursor && <button onClick={fetchMorePolls}>Load More Polls</button>}
 
             {selectedPollResult && (
                 <div style={{ marginTop: "20px", border: "1px solid gray", padding: "15px" }}>
@@ -1,13 +1,53 @@
-import React from 'react'
+import React, { useEffect, useState } from 'react'
 import Navbar from './Navbar'
 
 const History = () => {
+  const [votes, setVotes] = useState([]);
+  const [nextCursor, setNextCursor] = useState(null);
+  const [message, setMessage] = useState("");
+
+  useEffect(() => {
+    fetchVotes();
+  }, []);
+
+  // cursor is null for the first page, otherwise the page is appended
+  const fetchVotes = async (cursor = null) => {
+    try {
+      const url = cursor
+        ? `http://localhost:5000/my-votes?cursor=${encodeURIComponent(cursor)}`
+        : "http://localhost:5000/my-votes";
+      const res = await fetch(url, {
+        headers: { Authorization: `Bearer ${localStorage.getItem("authToken")}` },
+      });
+      const data = await res.json();
+      if (!res.ok) {
+        setMessage(data.msg || "Failed to load your votes");
+        return;
+      }
+      setVotes((prevVotes) => cursor ? [...prevVotes, ...data.votes] : data.votes);
+      setNextCursor(data.next_cursor);
+    } catch (error) {
+      setMessage("Failed to connect to the server.");
+    }
+  };
+
   return (
     <div style={{ padding: "80px"}}>
         <Navbar />
-        <div>History</div>
+        <h1>Your Votes</h1>
+        {message && <p>{message}</p>}
+        {votes.length === 0 && !message && <p>You haven't voted on any polls yet.</p>}
+        <ul>
+          {votes.map((vote) => (
+            <li key={`${vote.poll_id}-${vote.option_id}`}>
+              <strong>{vote.question}</strong> - {vote.option}
+              {vote.timestamp && <span> ({new Date(vote.timestamp + "Z").toLocaleString()})</span>}
+            </li>
+          ))}
+        </ul>
+        {nextCursor && <button onClick={() => fetchVotes(nextCursor)}>Load More</button>}
     </div>
   )
 }
 
-export default History
\ No newline at end of file
+export default History
@@ -1,29 +1,114 @@
-import { useEffect, useState } from "react";
+import { useEffect, useRef, useState } from "react";
+import { io } from "socket.io-client";
 import Navbar from "./Navbar";
+import { fetchChangeToken, fetchChanges } from "../pollChanges";
+
+// server timestamps are UTC without a zone
+const parseUtc = (value) => value && new Date(`${value}Z`);
+
+// /changes also brings polls that closed, or haven't opened yet
+const isOpen = (poll, now = new Date()) =>
+    !poll.closed_at
+    && (!poll.opens_at || parseUtc(poll.opens_at) <= now)
+    && (!poll.closes_at || parseUtc(poll.closes_at) > now);
 
 const VotesPage = () => {
     const [polls, setPolls] = useState([]);
     const [votes, setVotes] = useState({}); // poll ID : option ID
     const [message, setMessage] = useState("");
+    const [nextCursor, setNextCursor] = useState(null);
+    const [votedPollIds, setVotedPollIds] = useState(new Set());
+    const socketRef = useRef(null);
+    const changeTokenRef = useRef(null);
 
     useEffect(() => {
         fetchPolls();
+        fetchVotedPollIds();
+
+        // live tallies: the server pushes merged vote deltas for subscribed polls
+        const socket = io("http://localhost:5000", {
+            auth: { token: localStorage.getItem("authToken") },
+        });
+        socket.on("tally_delta", ({ poll_id, deltas }) => {
+            setPolls((prevPolls) => prevPolls.map((poll) => poll.id !== poll_id ? poll : {
+                ...poll,
+                options: poll.options.map((option) => ({
+                    ...option,
+                    votes: option.votes + (deltas[option.id] || 0),
+                })),
+            }));
+        });
+        socket.on("poll_updated", () => syncPolls());
+        socket.on("poll_deleted", ({ poll_id }) => {
+            setPolls((prevPolls) => prevPolls.filter((poll) => poll.id !== poll_id));
+        });
+        socket.on("poll_closed", ({ poll_id }) => {
+            setPolls((prevPolls) => prevPolls.filter((poll) => poll.id !== poll_id));
+        });
+        socketRef.current = socket;
+        return () => socket.disconnect();
     }, []);
 
-    const fetchPolls = async () => {
+    // join the room of every poll on screen (joining twice is harmless); keyed on
+    // the ids, so a poll replaced by another still gets subscribed
+    const pollIdsKey = polls.map((poll) => poll.id).sort((a, b) => a - b).join(",");
+    useEffect(() => {
+        const socket = socketRef.current;
+        if (!socket || !pollIdsKey) return;
+        const pollIds = pollIdsKey.split(",").map(Number);
+        const subscribe = () => pollIds.forEach((pollId) => socket.emit("subscribe", { poll_id: pollId }));
+        subscribe();
+        socket.on("connect", subscribe);
+        return () => socket.off("connect", subscribe);
+    }, [pollIdsKey]);
+
+    // cursor is null for the first page, otherwise the page is appended
+    const fetchPolls = async (cursor = null) => {
         try {
-            const res = await fetch("http://localhost:5000/polls", {
+            if (!cursor) changeTokenRef.current = await fetchChangeToken();
+            const url = cursor
+                ? `http://localhost:5000/polls?cursor=${encodeURIComponent(cursor)}`
+                : "http://localhost:5000/polls";
+            const res = await fetch(url, {
                 headers: {
                     Authorization: `Bearer ${localStorage.getItem("authToken")}`,
                 }
             });
             const data = await res.json();
-            setPolls(data);
+            setPolls((prevPolls) => cursor ? [...prevPolls, ...data.polls] : data.polls);
+            setNextCursor(data.next_cursor);
         } catch(error) {
             console.error("Failed to fetch polls", error);
         }
     };
 
+    // only the polls changed since the last load, instead of the whole list;
+    // tallies keep coming from the socket
+    const syncPolls = async () => {
+        try {
+            const { apply, token } = await fetchChanges(changeTokenRef.current, { tallies: false });
+            changeTokenRef.current = token;
+            setPolls((prevPolls) => apply(prevPolls).filter((poll) => isOpen(poll)));
+        } catch(error) {
+            fetchPolls();
+        }
+    };
+
+    // polls this user already voted on, listed with the first page of their history
+    const fetchVotedPollIds = async () => {
+        try {
+            const res = await fetch("http://localhost:5000/my-votes?limit=1", {
+                headers: {
+                    Authorization: `Bearer ${localStorage.getItem("authToken")}`,
+                }
+            });
+            const data = await res.json();
+            if (res.ok) setVotedPollIds(new Set(data.voted_poll_ids));
+        } catch(error) {
+            console.error("Failed to fetch voted polls", error);
+        }
+    };
+
     const handleOptionChange = (pollId, optionId) => {
         setVotes((prevVotes) => ({
             ...prevVotes,
@@ -31,9 +116,22 @@ const VotesPage = () => {
         }));
     };
 
+    // multiple-choice polls keep a list of selected option IDs
+    const handleOptionToggle = (pollId, optionId) => {
+        setVotes((prevVotes) => {
+            const selected = prevVotes[pollId] || [];
+            return {
+                ...prevVotes,
+                [pollId]: selected.includes(optionId)
+                    ? selected.filter((id) => id !== optionId)
+                    : [...selected, optionId]
+            };
+        });
+    };
+
     const handleVoteSubmit = async (pollId) => {
-        const selectedOptionId = votes[pollId];
-        if(!selectedOptionId) {
+        const selected = votes[pollId];
+        if(!selected || selected.length === 0) {
             setMessage("Please select an option.");
             return;
         }
@@ -45,13 +143,15 @@ const VotesPage = () => {
                     "Content-Type": "application/json",
                     Authorization: `Bearer ${localStorage.getItem("authToken")}`,
                 },
-                body: JSON.stringify({ optionId: selectedOptionId}),
+                // every selected option of a multiple-choice poll in one request
+                body: JSON.stringify(Array.isArray(selected) ? { optionIds: selected } : { optionId: selected }),
             });
 
             const data = await res.json()
             if (res.ok) {
+                // the updated tally arrives over the socket
                 setMessage("Vote submitted!");
-                fetchPolls();
+                setVotedPollIds((prevIds) => new Set(prevIds).add(pollId));
             } else {
                 setMessage(data.msg || "Error submitting vote");
             }
@@ -69,16 +169,28 @@ const VotesPage = () => {
             {polls.map((poll) => (
                 <div key={poll.id} style={{marginBottom: "30px", border: "1px solid gray", padding: "10px" }}>
                     <h3>{poll.question}</h3>
+                    {poll.is_multiple_choice && <p>Select all that apply.</p>}
+                    {poll.closes_at && <p>Closes {parseUtc(poll.closes_at).toLocaleString()}</p>}
                     {poll.options.map((option) => (
                         <div key={option.id}>
-                            <input type="radio" id={option.id} name={`poll-${poll.id}`} value={option.id} 
-                            checked={votes[poll.id] === option.id} onChange={() => handleOptionChange(poll.id, option.id)} />
+                            {poll.is_multiple_choice ? (
+                                <input type="checkbox" id={option.id} name={`poll-${poll.id}`} value={option.id}
+                                checked={(votes[poll.id] || []).includes(option.id)} onChange={() => handleOptionToggle(poll.id, option.id)}
+                                disabled={votedPollIds.has(poll.id)} />
+                            ) : (
+                                <input type="radio" id={option.id} name={`poll-${poll.id}`} value={option.id} 
+                                checked={votes[poll.id] === option.id} onChange={() => handleOptionChange(poll.id, option.id)}
+                                disabled={votedPollIds.has(poll.id)} />
+                            )}
                             <label htmlFor={option.id}>{option.text}</label>
                         </div>
                     ))}
-                    <button onClick={() => handleVoteSubmit(poll.id)}>Submit Vote</button>
+                    {votedPollIds.has(poll.id)
+                        ? <p>You voted on this poll.</p>
+                        : <button onClick={() => handleVoteSubmit(poll.id)}>Submit Vote</button>}
                 </div>
             ))}
+            {nextCursor && <button onClick={() => fetchPolls(nextCursor)}>Load More</button>}
         </div>
     )
 }
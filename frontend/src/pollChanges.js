@@ -0,0 +1,51 @@
+// keeps a list of polls current with /changes instead of refetching /polls
+
+const authHeaders = () => ({ Authorization: `Bearer ${localStorage.getItem("authToken")}` });
+
+// token for "now"; take it before loading /polls so no change is missed
+export const fetchChangeToken = async () => {
+    const res = await fetch("http://localhost:5000/changes", { headers: authHeaders() });
+    const data = await res.json();
+    return data.token;
+};
+
+// every change since token, as a function to apply to the polls list, and the new token.
+// Pages that get live tallies over the socket pass { tallies: false }
+export const fetchChanges = async (token, { tallies = true } = {}) => {
+    const updates = [];
+    let hasMore = true;
+    while (hasMore) {
+        const res = await fetch(`http://localhost:5000/changes?since=${encodeURIComponent(token)}`, {
+            headers: authHeaders(),
+        });
+        const data = await res.json();
+        if (!res.ok) throw new Error(data.msg || "Failed to fetch changes");
+        updates.push((polls) => applyChanges(polls, tallies ? data : { ...data, tallies: [] }));
+        token = data.token;
+        hasMore = data.has_more;
+    }
+    return { apply: (polls) => updates.reduce((current, update) => update(current), polls), token };
+};
+
+const applyChanges = (polls, { polls: changed, tallies, deleted }) => {
+    const deletedIds = new Set(deleted);
+    const changedById = new Map(changed.map((poll) => [poll.id, poll]));
+    const talliesById = new Map(tallies.map((tally) => [tally.id, tally.options]));
+    const known = new Set(polls.map((poll) => poll.id));
+
+    const updated = polls
+        .filter((poll) => !deletedIds.has(poll.id))
+        .map((poll) => {
+            if (changedById.has(poll.id)) return changedById.get(poll.id);
+            const counts = talliesById.get(poll.id);
+            if (!counts) return poll;
+            const votesById = new Map(counts.map((option) => [option.id, option.votes]));
+            return {
+                ...poll,
+                options: poll.options.map((option) => ({ ...option, votes: votesById.get(option.id) ?? option.votes })),
+            };
+        });
+    // new polls go first, like the newest-first /polls list
+    const created = changed.filter((poll) => !known.has(poll.id)).reverse();
+    return [...created, ...updated];
+};